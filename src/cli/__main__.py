@@ -2,6 +2,7 @@ import sys
 from pathlib import Path
 
 from lapsim import encoder
+from lapsim.eval import batch
 
 from toolkit.tracks import splicer
 
@@ -28,6 +29,10 @@ parser.add_argument("--spacing", type=int)
 parser.add_argument("--partitions", type=int)
 parser.add_argument("--flip", nargs='?', const=True)
 
+parser.add_argument("--predictions", type=str)
+parser.add_argument("--workers", type=int)
+parser.add_argument("--method", type=str)
+
 args = parser.parse_args()
 
 if args.function == 'splice':
@@ -51,5 +56,17 @@ elif args.function == 'encode':
         flip=args.flip,
     )
 
+elif args.function == 'evaluate':
+    if not args.src or not args.predictions:
+        raise Exception("Incorrect args. `evaluate --src <src> --predictions <predictions> (optional) --dest <dest.jsonl> --workers 4 --method evaluate2` ")
+
+    batch.from_cli(
+        args.src,
+        args.predictions,
+        dest=args.dest,
+        workers=args.workers,
+        method=args.method,
+    )
+
 else:
-    print(f"Unknown function: {args.function}. Please choose from: 'splice'")
+    print(f"Unknown function: {args.function}. Please choose from: 'splice', 'encode', 'evaluate'")
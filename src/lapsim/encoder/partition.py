@@ -32,7 +32,7 @@ class Partition(BaseModel):
         with open(path, "w+") as file:
             file.write(self.model_dump_json())
 
-    def append(self, partitions: Partition):
+    def append(self, partitions: 'Partition'):
         self.vehicles.extend(partitions.vehicles)
         self.widths.extend(partitions.widths)
         self.angles.extend(partitions.angles)
@@ -40,6 +40,14 @@ class Partition(BaseModel):
         self.positions.extend(partitions.positions)
         self.velocities.extend(partitions.velocities)
 
+    def subset(self, track_indexes: List[int]) -> 'Partition':
+        """Create a partition containing only the given tracks. Fields which
+        aren't set (e.g. the targets of a partition to predict) are left empty"""
+        return Partition(**{
+            key: [getattr(self, key)[t_idx] for t_idx in track_indexes] if getattr(self, key) else []
+            for key in ["vehicles", "widths", "angles", "offsets", "positions", "velocities"]
+        })
+
     @staticmethod
     def combine(partitions: List['Partition']):
         vehicles = []
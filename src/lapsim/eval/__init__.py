@@ -1,9 +1,25 @@
-from typing import List, Optional, Tuple
+from typing import List, Optional, Sequence, Tuple
 
 import numpy as np
 from toolkit import maths
-from lapsim.encoder.encoder import extract_features
 from lapsim.eval.evaluation import Evaluation
+from lapsim.eval.vectorised import (
+    track_arrays,
+    line_angles,
+    optimal_positions,
+    estimate_lap_time_arrays,
+    estimate_lap_times,
+    segment_times,
+    find_apexes_arrays,
+    evaluation_error,
+    racing_line_intersections,
+)
+from lapsim.eval.context import EvaluationContext, LapErrors, lap_errors, evaluate_arrays, evaluate2_arrays
+from lapsim.eval.sectors import SectorIndex, SectorErrors, split_sectors, apex_segments
+from lapsim.eval.accumulator import QuantileSketch, ErrorAccumulator, EvaluationAccumulator
+from lapsim.eval.batch import evaluate_many, read_evaluations
+from lapsim.eval.validation import ValidationGeometry, ValidationMetrics, validation_metrics, validation_metrics_arrays
+from lapsim.eval.store import EvaluationStore, EvaluationStoreWriter
 from toolkit.tracks.models import SegmentationLine, Track
 
 """Evaluation toolkit module.
@@ -12,12 +28,14 @@ This module provides the functions to evaluating two sets of spliced data.
 """
 
 
-def evaluate(truth: Track, predicted: Track) -> Evaluation:
+def evaluate(truth: Track, predicted: Track, angles: Optional[Sequence[float]] = None) -> Evaluation:
     """Compare spliced data
 
     Args:
         truth: The ground truth data
         predicted: The data predicted by the model
+        angles: The alpha angles of the ground truth seg. lines, used to find
+            the apexes, see `find_apexes`
 
     Returns:
         Evaluation model
@@ -45,7 +63,7 @@ def evaluate(truth: Track, predicted: Track) -> Evaluation:
 
         position_percentage_errors.append(abs(predicted.segmentations[n].pos - truth.segmentations[n].pos) * 100)
 
-    apexes = find_apexes(truth.segmentations)
+    apexes = find_apexes(truth.segmentations, angles)
 
     return Evaluation.from_errors(
         laptime=estimate_lap_time(truth),
@@ -58,12 +76,14 @@ def evaluate(truth: Track, predicted: Track) -> Evaluation:
     )
 
 
-def evaluate2(truth: Track, predicted: Track) -> Evaluation:
+def evaluate2(truth: Track, predicted: Track, angles: Optional[Sequence[float]] = None) -> Evaluation:
     """Compare spliced data irrespective of smoothing
 
     Args:
         truth: The ground truth data
         predicted: The data predicted by the model
+        angles: The alpha angles of the ground truth seg. lines, used to find
+            the apexes, see `find_apexes`
 
     Returns:
         Evaluation model
@@ -81,7 +101,7 @@ def evaluate2(truth: Track, predicted: Track) -> Evaluation:
 
     positional_deltas, percentage_deltas = evaluate_position_errors_irrespective_of_smoothing(truth, predicted)
 
-    apexes = find_apexes(truth.segmentations)
+    apexes = find_apexes(truth.segmentations, angles)
 
     return Evaluation.from_errors(
         laptime=estimate_lap_time(truth),
@@ -106,57 +126,30 @@ def estimate_lap_time(track: Track) -> float:
     Returns:
         Estimation lap time.
     """
-    path = calculate_optimal_positions(track)
+    return estimate_lap_time_arrays(*track_arrays(track))
 
-    total_time = 0
-    for i in range(len(track.segmentations)):
-        p_pos, c_pos = path[i - 1], path[i]
-        u = track.segmentations[i].vel
-        v = track.segmentations[i - 1].vel
-        s = maths.distance(p_pos, c_pos)
-        t = 2 * s / (u + v)
 
-        total_time += t
-
-    return total_time
-
-
-def find_apexes(segmentations: List[SegmentationLine]) -> List[int]:
+def find_apexes(segmentations: List[SegmentationLine], angles: Optional[Sequence[float]] = None) -> List[int]:
     """This function is designed to find the apexes of a track. Returning a
     list of indexes where each index maps to a seg line where the line kisses
     the apex.
 
     Args:
-        List of segmentation lines with the ground truth position.
+        segmentations: List of segmentation lines with the ground truth position.
+        angles: The alpha angles of the seg. lines, e.g. the angles of the
+            encoded track. Calculated from the seg. lines if not given.
 
     Returns:
         List of indexes representing the apexes of the track.
     """
-    _, angles, _ = extract_features(segmentations)
-    apexes = []
-    for i, normal in enumerate(segmentations):
-        threshold = 0.02
-
-        within_threshold = normal.pos < threshold or normal.pos > 1 - threshold
-        within_ratio = abs(angles[i]) > 0.01
-
-        if within_threshold and within_ratio:
-            apexes += [[i, normal.pos]]
-
-    apex_groups = []
-    current_group = []
-    for i in range(len(apexes)):
-        current_group += [apexes[i]]
-        if apexes[i + 1 - len(apexes)][0] != apexes[i][0] + 1:
-            apex_groups += [current_group]
-            current_group = []
+    lines, pos, _ = track_arrays(Track(segmentations=segmentations))
 
-    apexes = []
-    for group in apex_groups:
-        errors = [x[1] if x[1] < 0.5 else 1 - x[1] for x in group]
-        apexes.append(group[np.argmin(errors)][0])
+    if angles is None:
+        angles = line_angles(lines)
+    elif len(angles) != len(segmentations):
+        raise ValueError(f"Expected {len(segmentations)} angles, got: {len(angles)}")
 
-    return apexes
+    return find_apexes_arrays(pos, np.asarray(angles, dtype=np.float64)).tolist()
 
 
 def calculate_optimal_positions(track: Track) -> np.ndarray:
@@ -196,9 +189,9 @@ def evaluate_position_errors_irrespective_of_smoothing(truth: Track, predicted:
 
     absolute_errors = []
     percentage_errors = []
-    for idx, normal in enumerate(racing_line_normals):
+    all_intersections = racing_line_intersections(racing_line_normals, maths.points_to_lines(predicted_racing_line))
+    for idx, intersections in enumerate(all_intersections):
         error = None
-        intersections = maths.segment_intersections(normal, maths.points_to_lines(predicted_racing_line))
 
         for intersection in intersections:
             delta = maths.distance(true_racing_line[idx], intersection)
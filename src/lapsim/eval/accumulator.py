@@ -0,0 +1,246 @@
+import math
+from typing import Optional, Sequence
+
+import numpy as np
+
+from lapsim.eval.evaluation import Evaluation, EvaluationError, EvaluationLapTime
+from lapsim.eval.context import LapErrors
+
+"""Mergeable accumulators of the evaluation metrics.
+
+`Evaluation.combine` averages the metrics of each track, so the combined RMSE
+and ci95 values aren't the RMSE and ci95 of the whole dataset, and every
+evaluation has to be kept until they're combined. The accumulators here keep
+sums, sums of squares, counts and maxes of the errors, plus a fixed-memory
+quantile sketch for the ci95 values. They are updated a track at a time,
+merged across processes and finalised into an `Evaluation`, so the metrics
+over a whole dataset are computed in a single streaming pass. Everything is
+exact except the ci95 values, which have a bounded relative error.
+"""
+
+
+class QuantileSketch:
+    """A fixed-memory sketch of the distribution of non-negative values, for
+    estimating quantiles with a bounded relative error.
+
+    Values are counted in logarithmically sized buckets, bucket `i` holding
+    the values in `(gamma^(i-1), gamma^i]`, where `gamma` is chosen so the
+    centre of each bucket is within the relative accuracy of every value in
+    it. Values below `min_value` are counted as zero, and values above
+    `max_value` in the last bucket. Sketches with the same settings are merged
+    by adding their counts."""
+
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-6, max_value: float = 1e6):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"Relative accuracy must be in the range (0, 1), got: {relative_accuracy}")
+
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+
+        self.min_index = math.ceil(math.log(min_value) / self._log_gamma)
+        self.max_index = math.ceil(math.log(max_value) / self._log_gamma)
+
+        self.zero_count = 0
+        self.counts = np.zeros(self.max_index - self.min_index + 1, dtype=np.int64)
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + int(np.sum(self.counts))
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64).reshape(-1)
+        if np.any(values < 0):
+            raise ValueError("Only non-negative values can be added to the sketch")
+
+        small = values < self.min_value
+        self.zero_count += int(np.sum(small))
+
+        indexes = np.ceil(np.log(values[~small]) / self._log_gamma).astype(np.int64)
+        indexes = np.clip(indexes, self.min_index, self.max_index) - self.min_index
+        self.counts += np.bincount(indexes, minlength=len(self.counts))
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        if (other.relative_accuracy, other.min_value, other.max_value) != \
+                (self.relative_accuracy, self.min_value, self.max_value):
+            raise ValueError("Only sketches with the same settings can be merged")
+
+        self.zero_count += other.zero_count
+        self.counts += other.counts
+
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate the value `q` of the way through the sorted values, i.e.
+        `sorted(values)[int(len(values) * q)]`, or None if the sketch is empty"""
+        count = self.count
+        if count == 0:
+            return None
+
+        rank = min(int(count * q), count - 1)
+        if rank < self.zero_count:
+            return 0.
+
+        cumulative = self.zero_count + np.cumsum(self.counts)
+        index = int(np.searchsorted(cumulative, rank, side="right")) + self.min_index
+
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+
+class ErrorAccumulator:
+    """Accumulates the errors of seg. lines, finalised into an
+    `EvaluationError`, see `EvaluationError.from_errors` and
+    `vectorised.evaluation_error`. NaN errors are ignored."""
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.count = 0
+        self.sum = 0.
+        self.sum_absolute = 0.
+        self.sum_squares = 0.
+        self.max = -math.inf
+
+        self.percentage_count = 0
+        self.percentage_sum = 0.
+        self.percentage_max = -math.inf
+
+        self.apex_count = 0
+        self.apex_sum = 0.
+        self.apex_sum_absolute = 0.
+        self.apex_max = -math.inf
+
+        self.sketch = QuantileSketch(relative_accuracy)
+        self.percentage_sketch = QuantileSketch(relative_accuracy)
+
+    def update(self, deltas: np.ndarray, percentage_errors: np.ndarray, apexes: Sequence[int]):
+        """Add the errors of a track
+
+        Args:
+            deltas: The signed error of each seg. line.
+            percentage_errors: The percentage error of each seg. line.
+            apexes: The indexes of the apexes.
+        """
+        deltas = np.asarray(deltas, dtype=np.float64)
+        percentage_errors = np.asarray(percentage_errors, dtype=np.float64)
+
+        apex_deltas = deltas[np.asarray(apexes, dtype=int)]
+        apex_deltas = apex_deltas[~np.isnan(apex_deltas)]
+
+        deltas = deltas[~np.isnan(deltas)]
+        percentage_errors = percentage_errors[~np.isnan(percentage_errors)]
+        abs_deltas = np.abs(deltas)
+
+        self.count += len(deltas)
+        self.sum += float(np.sum(deltas))
+        self.sum_absolute += float(np.sum(abs_deltas))
+        self.sum_squares += float(np.sum(np.square(deltas)))
+        self.max = max(self.max, float(np.max(abs_deltas, initial=-math.inf)))
+        self.sketch.update(abs_deltas)
+
+        self.percentage_count += len(percentage_errors)
+        self.percentage_sum += float(np.sum(percentage_errors))
+        self.percentage_max = max(self.percentage_max, float(np.max(percentage_errors, initial=-math.inf)))
+        self.percentage_sketch.update(percentage_errors)
+
+        self.apex_count += len(apex_deltas)
+        self.apex_sum += float(np.sum(apex_deltas))
+        self.apex_sum_absolute += float(np.sum(np.abs(apex_deltas)))
+        self.apex_max = max(self.apex_max, float(np.max(np.abs(apex_deltas), initial=-math.inf)))
+
+    def merge(self, other: 'ErrorAccumulator') -> 'ErrorAccumulator':
+        self.count += other.count
+        self.sum += other.sum
+        self.sum_absolute += other.sum_absolute
+        self.sum_squares += other.sum_squares
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+        self.percentage_count += other.percentage_count
+        self.percentage_sum += other.percentage_sum
+        self.percentage_max = max(self.percentage_max, other.percentage_max)
+        self.percentage_sketch.merge(other.percentage_sketch)
+
+        self.apex_count += other.apex_count
+        self.apex_sum += other.apex_sum
+        self.apex_sum_absolute += other.apex_sum_absolute
+        self.apex_max = max(self.apex_max, other.apex_max)
+
+        return self
+
+    def finalise(self) -> EvaluationError:
+        if self.count == 0 or self.percentage_count == 0:
+            raise ValueError("No errors have been accumulated")
+
+        return EvaluationError(
+            max=self.max,
+            mean=self.sum / self.count,
+            mean_absolute=self.sum_absolute / self.count,
+            rmse=math.sqrt(self.sum_squares / self.count),
+            ci95=self.sketch.quantile(0.95),
+
+            percentage_mean=self.percentage_sum / self.percentage_count,
+            percentage_max=self.percentage_max,
+            percentage_ci95=self.percentage_sketch.quantile(0.95),
+
+            apex_mean=self.apex_sum / self.apex_count if self.apex_count else None,
+            apex_mean_absolute=self.apex_sum_absolute / self.apex_count if self.apex_count else None,
+            apex_max=self.apex_max if self.apex_count else None,
+        )
+
+
+class EvaluationAccumulator:
+    """Accumulates the errors of predicted laps, finalised into an `Evaluation`
+    of the whole dataset. The lap time metrics are the mean of the metrics of
+    each lap, as in `EvaluationLapTime.combine`, the position and velocity
+    metrics are over every seg. line of every lap."""
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.laps = 0
+        self.laptime_sums = np.zeros(6)
+
+        self.position = ErrorAccumulator(relative_accuracy)
+        self.velocity = ErrorAccumulator(relative_accuracy)
+
+    def update(self, errors: LapErrors):
+        """Add the errors of a lap, see `context.lap_errors`"""
+        laptime = EvaluationLapTime.from_values(errors.laptime, errors.predicted_laptime)
+
+        self.laps += 1
+        self.laptime_sums += [
+            laptime.truth, laptime.predicted, laptime.error,
+            laptime.abs_error, laptime.percentage, laptime.error_per_minute
+        ]
+
+        self.position.update(errors.position_deltas, errors.position_percentage_errors, errors.apexes)
+        self.velocity.update(errors.velocity_deltas, errors.velocity_percentage_errors, errors.apexes)
+
+    def merge(self, other: 'EvaluationAccumulator') -> 'EvaluationAccumulator':
+        self.laps += other.laps
+        self.laptime_sums += other.laptime_sums
+
+        self.position.merge(other.position)
+        self.velocity.merge(other.velocity)
+
+        return self
+
+    def finalise(self) -> Evaluation:
+        if self.laps == 0:
+            raise ValueError("No laps have been accumulated")
+
+        truth, predicted, error, abs_error, percentage, error_per_minute = (self.laptime_sums / self.laps).tolist()
+
+        return Evaluation(
+            laptime=EvaluationLapTime(
+                truth=truth,
+                predicted=predicted,
+                error=error,
+                abs_error=abs_error,
+                percentage=percentage,
+                error_per_minute=error_per_minute
+            ),
+            position=self.position.finalise(),
+            velocity=self.velocity.finalise(),
+            apexes=[]
+        )
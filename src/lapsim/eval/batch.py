@@ -0,0 +1,195 @@
+import dataclasses
+import json
+import os
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from lapsim.eval.evaluation import Evaluation, EvaluationError, EvaluationLapTime
+from lapsim.eval.accumulator import EvaluationAccumulator
+from lapsim.eval.context import lap_errors
+from lapsim.eval.vectorised import track_arrays
+from toolkit.tracks.models import Track
+
+"""Batch evaluation of a test set.
+
+The tracks are evaluated across a pool of processes, each worker loading its
+own truth (and predicted) track, so only the evaluations are sent back. The
+evaluation of each track is streamed to a JSON lines file as it completes, and
+the tracks aren't kept alive once evaluated.
+"""
+
+
+# A prediction is either the path to a predicted track, or the predicted
+# positions and velocities on the seg. lines of the truth track
+Prediction = Union[str, Path, Tuple[np.ndarray, np.ndarray]]
+
+EVALUATION_METHODS = ("evaluate", "evaluate2")
+
+
+def load_track(path: Union[str, Path]) -> Track:
+    """Load a track, either a spliced track file (where the track is under the
+    "track" key) or a plain track file"""
+    with open(path) as file:
+        data = json.load(file)
+
+    return Track(**data.get("track", data))
+
+
+def evaluate_many(
+        truth_paths: Sequence[Union[str, Path]],
+        predictions: Sequence[Prediction],
+        workers: Optional[int] = None,
+        output: Optional[Union[str, Path]] = None,
+        method: str = "evaluate",
+        accumulator: Optional[EvaluationAccumulator] = None
+) -> Evaluation:
+    """Evaluate a set of predicted tracks against their ground truths
+
+    Args:
+        truth_paths: The paths to the ground truth tracks.
+        predictions: The prediction of each truth track, either the path to
+            the predicted track or the predicted `(pos, vel)` arrays.
+        workers: The number of processes to evaluate with, defaults to the
+            number of CPUs. With 1 worker the tracks are evaluated serially.
+        output: If given, the evaluation of each track is written to this file
+            as a JSON line, see `read_evaluations`.
+        method: Either "evaluate" or "evaluate2".
+        accumulator: If given, the errors of every track are added to the
+            accumulator, for the exact metrics of the whole test set.
+
+    Returns:
+        The combined evaluation, see `Evaluation.combine`
+    """
+    if len(truth_paths) != len(predictions):
+        raise ValueError(f"Got {len(truth_paths)} truth tracks but {len(predictions)} predictions")
+
+    if method not in EVALUATION_METHODS:
+        raise ValueError(f"Unknown evaluation method: '{method}', expected one of {EVALUATION_METHODS}")
+
+    workers = workers or os.cpu_count() or 1
+    accumulate = accumulator is not None
+    items = [
+        (truth_path, prediction, method, accumulate)
+        for truth_path, prediction in zip(truth_paths, predictions)
+    ]
+
+    evaluations = []
+    output_file = open(output, "w+") if output is not None else None
+    pool = Pool(min(workers, len(items))) if workers > 1 and len(items) > 1 else None
+
+    try:
+        results = pool.imap(_evaluate_item, items) if pool is not None else map(_evaluate_item, items)
+
+        for name, evaluation, track_accumulator in results:
+            evaluations.append(evaluation)
+
+            if accumulate:
+                accumulator.merge(track_accumulator)
+
+            if output_file is not None:
+                output_file.write(json.dumps({"name": name, "evaluation": dataclasses.asdict(evaluation)}) + "\n")
+                output_file.flush()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        if output_file is not None:
+            output_file.close()
+
+    return Evaluation.combine(evaluations)
+
+
+def read_evaluations(path: Union[str, Path]) -> Iterator[Tuple[str, Evaluation]]:
+    """Read the evaluations written by `evaluate_many`
+
+    Args:
+        path: The JSON lines file of the evaluations.
+
+    Returns:
+        An iterator of the name of each track and its evaluation
+    """
+    with open(path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+
+            data = json.loads(line)
+            evaluation = data["evaluation"]
+
+            yield data["name"], Evaluation(
+                laptime=EvaluationLapTime(**evaluation["laptime"]),
+                position=EvaluationError(**evaluation["position"]),
+                velocity=EvaluationError(**evaluation["velocity"]),
+                apexes=evaluation["apexes"]
+            )
+
+
+def _evaluate_item(
+        item: Tuple[Union[str, Path], Prediction, str, bool]
+) -> Tuple[str, Evaluation, Optional[EvaluationAccumulator]]:
+    """Evaluate a single track, called by `evaluate_many` in the workers"""
+    truth_path, prediction, method, accumulate = item
+    truth_lines, truth_pos, truth_vel = track_arrays(load_track(truth_path))
+
+    if isinstance(prediction, (str, Path)):
+        predicted_lines, predicted_pos, predicted_vel = track_arrays(load_track(prediction))
+    else:
+        predicted_pos, predicted_vel = (np.asarray(values, dtype=np.float64).reshape(-1) for values in prediction)
+        predicted_lines = truth_lines
+
+    errors = lap_errors(
+        truth_lines, truth_pos, truth_vel, predicted_pos, predicted_vel, predicted_lines,
+        irrespective_of_smoothing=method == "evaluate2"
+    )
+
+    track_accumulator = None
+    if accumulate:
+        track_accumulator = EvaluationAccumulator()
+        track_accumulator.update(errors)
+
+    return Path(truth_path).stem, errors.evaluation(), track_accumulator
+
+
+def from_cli(
+        src: str,
+        predictions: str,
+        dest: Optional[str] = None,
+        workers: Optional[int] = None,
+        method: Optional[str] = None
+):
+    """This function is to be called using params entered via the CLI
+
+    Args:
+        src: The directory of ground truth tracks.
+        predictions: The directory of predicted tracks, with the same file
+            names as the ground truth tracks.
+        dest: The JSON lines file to write the evaluation of each track to.
+        workers: The number of processes to evaluate with.
+        method: Either "evaluate" or "evaluate2", defaults to "evaluate".
+    """
+    if not os.path.exists(src):
+        raise FileNotFoundError(f"Source directory {src} does not exist")
+
+    if not os.path.exists(predictions):
+        raise FileNotFoundError(f"Predictions directory {predictions} does not exist")
+
+    src, predictions = Path(src), Path(predictions)
+
+    names: List[str] = sorted(x for x in os.listdir(src) if x[0] != '.' and (predictions / x).exists())
+    print(f"Found {len(names)} predicted tracks to evaluate.")
+
+    accumulator = EvaluationAccumulator()
+    evaluate_many(
+        [src / name for name in names],
+        [predictions / name for name in names],
+        workers=workers,
+        output=dest,
+        method=method or "evaluate",
+        accumulator=accumulator
+    )
+
+    print(json.dumps(dataclasses.asdict(accumulator.finalise()), indent=2))
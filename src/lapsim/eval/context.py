@@ -0,0 +1,297 @@
+import dataclasses
+from pathlib import Path
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+
+from lapsim.eval.evaluation import Evaluation, EvaluationLapTime
+from lapsim.eval.vectorised import (
+    estimate_lap_time_arrays,
+    evaluation_error,
+    find_apexes_arrays,
+    line_angles,
+    line_widths,
+    optimal_positions,
+    position_errors,
+    racing_line_normals,
+    smoothing_independent_errors,
+    track_arrays,
+    velocity_errors,
+)
+from toolkit.tracks.models import Track
+
+"""Truth-side evaluation contexts.
+
+Everything about a ground truth lap that doesn't depend on the prediction
+(the optimal line, the racing line normals, the apexes, the lap time and the
+velocity range) is precomputed once in an `EvaluationContext`, which can be
+saved and reused for every prediction scored against that lap, e.g. when
+comparing several models or checkpoints on the same test set.
+"""
+
+
+@dataclasses.dataclass
+class LapErrors:
+    """The errors of each seg. line of a predicted lap, before they're
+    summarised into an `Evaluation`"""
+
+    laptime: float
+    predicted_laptime: float
+
+    position_deltas: np.ndarray
+    position_percentage_errors: np.ndarray
+    velocity_deltas: np.ndarray
+    velocity_percentage_errors: np.ndarray
+
+    apexes: List[int]
+
+    def evaluation(self) -> Evaluation:
+        return Evaluation(
+            laptime=EvaluationLapTime.from_values(self.laptime, self.predicted_laptime),
+
+            position=evaluation_error(self.position_deltas, self.position_percentage_errors, self.apexes),
+            velocity=evaluation_error(self.velocity_deltas, self.velocity_percentage_errors, self.apexes),
+
+            apexes=self.apexes
+        )
+
+
+@dataclasses.dataclass
+class EvaluationContext:
+    """The precomputed quantities of a ground truth lap"""
+
+    lines: np.ndarray
+    pos: np.ndarray
+    vel: np.ndarray
+
+    optimal_line: np.ndarray
+    widths: np.ndarray
+    apexes: np.ndarray
+
+    laptime: float
+    min_vel: float
+    max_vel: float
+
+    # The normals of the optimal line, only needed to evaluate irrespective of
+    # smoothing so they're computed on first use unless built eagerly
+    racing_line_normals: Optional[np.ndarray] = None
+
+    @staticmethod
+    def from_arrays(
+            lines: np.ndarray,
+            pos: np.ndarray,
+            vel: np.ndarray,
+            angles: Optional[Sequence[float]] = None,
+            apexes: Optional[Sequence[int]] = None,
+            normals: bool = True
+    ) -> 'EvaluationContext':
+        """Build the context of a ground truth lap
+
+        Args:
+            lines: The `(N, 4)` seg. lines.
+            pos: The `(N,)` ground truth positions.
+            vel: The `(N,)` ground truth velocities.
+            angles: The alpha angles of the seg. lines, e.g. from the encoded
+                track, calculated from the seg. lines if not given.
+            apexes: The apex indexes, found from the positions and angles if
+                not given.
+            normals: If true, the racing line normals are computed now rather
+                than on first use.
+
+        Returns:
+            The evaluation context
+        """
+        lines = np.asarray(lines, dtype=np.float64).reshape((-1, 4))
+        pos, vel = np.asarray(pos, dtype=np.float64), np.asarray(vel, dtype=np.float64)
+
+        if apexes is None:
+            angles = line_angles(lines) if angles is None else np.asarray(angles, dtype=np.float64)
+            apexes = find_apexes_arrays(pos, angles)
+
+        context = EvaluationContext(
+            lines=lines,
+            pos=pos,
+            vel=vel,
+            optimal_line=optimal_positions(lines, pos),
+            widths=line_widths(lines),
+            apexes=np.asarray(apexes, dtype=np.int64),
+            laptime=estimate_lap_time_arrays(lines, pos, vel),
+            min_vel=float(np.min(vel)),
+            max_vel=float(np.max(vel)),
+        )
+
+        if normals:
+            context.get_racing_line_normals()
+
+        return context
+
+    @staticmethod
+    def from_track(track: Track, angles: Optional[Sequence[float]] = None, normals: bool = True) -> 'EvaluationContext':
+        """Build the context of a ground truth track, see `from_arrays`"""
+        return EvaluationContext.from_arrays(*track_arrays(track), angles=angles, normals=normals)
+
+    def get_racing_line_normals(self) -> np.ndarray:
+        if self.racing_line_normals is None:
+            self.racing_line_normals = np.array(racing_line_normals(self.optimal_line), dtype=np.float64)
+
+        return self.racing_line_normals
+
+    def lap_errors(
+            self,
+            predicted_pos: np.ndarray,
+            predicted_vel: np.ndarray,
+            predicted_lines: Optional[np.ndarray] = None,
+            irrespective_of_smoothing: bool = False
+    ) -> LapErrors:
+        """Compute the errors of each seg. line of a predicted lap
+
+        Args:
+            predicted_pos: The `(N,)` predicted positions.
+            predicted_vel: The `(N,)` predicted velocities.
+            predicted_lines: The seg. lines of the prediction, defaults to the
+                ground truth seg. lines.
+            irrespective_of_smoothing: If true, the position errors are
+                measured as in `evaluate2`, otherwise as in `evaluate`.
+
+        Returns:
+            The errors of the lap
+        """
+        predicted_lines = self.lines if predicted_lines is None else np.asarray(predicted_lines, dtype=np.float64)
+        predicted_pos = np.asarray(predicted_pos, dtype=np.float64)
+        predicted_vel = np.asarray(predicted_vel, dtype=np.float64)
+
+        if irrespective_of_smoothing:
+            position_deltas, position_percentage_errors = smoothing_independent_errors(
+                self.optimal_line,
+                [tuple(normal) for normal in self.get_racing_line_normals().tolist()],
+                self.widths,
+                optimal_positions(predicted_lines, predicted_pos)
+            )
+        else:
+            position_deltas, position_percentage_errors = position_errors(
+                self.lines, self.pos, predicted_lines, predicted_pos
+            )
+
+        velocity_deltas, velocity_percentage_errors = velocity_errors(
+            self.vel, predicted_vel, (self.min_vel, self.max_vel)
+        )
+
+        return LapErrors(
+            laptime=self.laptime,
+            predicted_laptime=estimate_lap_time_arrays(predicted_lines, predicted_pos, predicted_vel),
+            position_deltas=position_deltas,
+            position_percentage_errors=position_percentage_errors,
+            velocity_deltas=velocity_deltas,
+            velocity_percentage_errors=velocity_percentage_errors,
+            apexes=self.apexes.tolist()
+        )
+
+    def evaluate(self, predicted_pos: np.ndarray, predicted_vel: np.ndarray, predicted_lines: Optional[np.ndarray] = None) -> Evaluation:
+        """Compare a predicted lap to the ground truth, see `evaluate`"""
+        return self.lap_errors(predicted_pos, predicted_vel, predicted_lines).evaluation()
+
+    def evaluate2(self, predicted_pos: np.ndarray, predicted_vel: np.ndarray, predicted_lines: Optional[np.ndarray] = None) -> Evaluation:
+        """Compare a predicted lap to the ground truth irrespective of
+        smoothing, see `evaluate2`"""
+        return self.lap_errors(predicted_pos, predicted_vel, predicted_lines, irrespective_of_smoothing=True).evaluation()
+
+    def save(self, path: Union[str, Path]):
+        """Save the context as a `.npz` file"""
+        arrays = {
+            field.name: np.asarray(getattr(self, field.name))
+            for field in dataclasses.fields(self)
+            if getattr(self, field.name) is not None
+        }
+
+        with open(path, "wb") as file:
+            np.savez(file, **arrays)
+
+    @staticmethod
+    def load(path: Union[str, Path]) -> 'EvaluationContext':
+        """Load a context saved with `save`"""
+        with np.load(path) as data:
+            return EvaluationContext(
+                lines=data["lines"],
+                pos=data["pos"],
+                vel=data["vel"],
+                optimal_line=data["optimal_line"],
+                widths=data["widths"],
+                apexes=data["apexes"],
+                laptime=float(data["laptime"]),
+                min_vel=float(data["min_vel"]),
+                max_vel=float(data["max_vel"]),
+                racing_line_normals=data["racing_line_normals"] if "racing_line_normals" in data else None,
+            )
+
+
+def lap_errors(
+        truth_lines: np.ndarray,
+        truth_pos: np.ndarray,
+        truth_vel: np.ndarray,
+        predicted_pos: np.ndarray,
+        predicted_vel: np.ndarray,
+        predicted_lines: Optional[np.ndarray] = None,
+        apexes: Optional[Sequence[int]] = None,
+        irrespective_of_smoothing: bool = False
+) -> LapErrors:
+    """Compute the errors of each seg. line of a predicted lap, see
+    `EvaluationContext.lap_errors`
+
+    Args:
+        truth_lines: The `(N, 4)` seg. lines of the ground truth.
+        truth_pos: The `(N,)` ground truth positions.
+        truth_vel: The `(N,)` ground truth velocities.
+        predicted_pos: The `(N,)` predicted positions.
+        predicted_vel: The `(N,)` predicted velocities.
+        predicted_lines: The seg. lines of the prediction, defaults to the
+            ground truth seg. lines.
+        apexes: The apex indexes, found from the ground truth if not given.
+        irrespective_of_smoothing: If true, the position errors are measured
+            as in `evaluate2`, otherwise as in `evaluate`.
+
+    Returns:
+        The errors of the lap
+    """
+    context = EvaluationContext.from_arrays(truth_lines, truth_pos, truth_vel, apexes=apexes, normals=False)
+    return context.lap_errors(predicted_pos, predicted_vel, predicted_lines, irrespective_of_smoothing)
+
+
+def evaluate_arrays(
+        truth_lines: np.ndarray,
+        truth_pos: np.ndarray,
+        truth_vel: np.ndarray,
+        predicted_pos: np.ndarray,
+        predicted_vel: np.ndarray,
+        predicted_lines: Optional[np.ndarray] = None,
+        apexes: Optional[Sequence[int]] = None
+) -> Evaluation:
+    """Compare a predicted lap to the ground truth, see `evaluate` and
+    `lap_errors` for the arguments
+
+    Returns:
+        Evaluation model
+    """
+    return lap_errors(
+        truth_lines, truth_pos, truth_vel, predicted_pos, predicted_vel, predicted_lines, apexes
+    ).evaluation()
+
+
+def evaluate2_arrays(
+        truth_lines: np.ndarray,
+        truth_pos: np.ndarray,
+        truth_vel: np.ndarray,
+        predicted_pos: np.ndarray,
+        predicted_vel: np.ndarray,
+        predicted_lines: Optional[np.ndarray] = None,
+        apexes: Optional[Sequence[int]] = None
+) -> Evaluation:
+    """Compare a predicted lap to the ground truth irrespective of smoothing,
+    see `evaluate2` and `lap_errors` for the arguments
+
+    Returns:
+        Evaluation model
+    """
+    return lap_errors(
+        truth_lines, truth_pos, truth_vel, predicted_pos, predicted_vel, predicted_lines, apexes,
+        irrespective_of_smoothing=True
+    ).evaluation()
@@ -11,6 +11,12 @@ def _mean(x):
     return sum(non_null_x) / len(non_null_x)
 
 
+def _ci95(x) -> float:
+    """The value 95% of the way through the sorted values"""
+    k = int(len(x) * 0.95)
+    return float(np.partition(np.asarray(x), k)[k])
+
+
 def _max(x):
     non_null_x = [v for v in x if v is not None]
     if len(non_null_x) == 0:
@@ -44,11 +50,11 @@ class EvaluationError:
             mean=float(np.mean(deltas)),
             mean_absolute=float(np.mean(np.abs(deltas))),
             rmse=np.sqrt(np.mean(np.square(deltas))),
-            ci95=sorted(np.abs(deltas))[int(len(deltas) * 0.95)],
+            ci95=_ci95(np.abs(deltas)),
 
             percentage_mean=float(np.mean(percentage_errors)),
             percentage_max=np.max(percentage_errors),
-            percentage_ci95=sorted(percentage_errors)[int(len(percentage_errors) * 0.95)],
+            percentage_ci95=_ci95(percentage_errors),
 
             apex_mean=float(np.mean(deltas[apexes])) if apexes else None,
             apex_mean_absolute=float(np.mean(np.abs(deltas[apexes]))) if apexes else None,
@@ -0,0 +1,218 @@
+import dataclasses
+import math
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from lapsim.eval.context import EvaluationContext
+from lapsim.eval.vectorised import segment_times
+
+"""Sector-level evaluation.
+
+The per-line times and errors of a lap are stored as prefix sums, so the lap
+time, mean error and RMSE over any range of seg. lines is answered in O(1)
+without re-evaluating the sub-track.
+
+Ranges are `(start, end)` line indexes, with the start inclusive and the end
+exclusive. The end can be past the last line to wrap around the lap, e.g.
+`(n - 10, n + 10)` covers the 10 lines either side of the start/finish line
+and `(i, i + n)` is a full lap starting at line `i`. The time of a range is
+the time taken to travel from its first line to its end line.
+"""
+
+
+# A range of seg. lines, see the module docstring
+LineRange = Tuple[int, int]
+
+
+@dataclasses.dataclass
+class SectorErrors:
+    """The errors of a predicted lap over a range of seg. lines. Mean errors
+    and RMSEs are None where every error in the range is missing"""
+
+    start: int
+    end: int
+
+    laptime: float
+    predicted_laptime: float
+    laptime_error: float
+
+    position_mean: Optional[float]
+    position_mean_absolute: Optional[float]
+    position_rmse: Optional[float]
+
+    velocity_mean: Optional[float]
+    velocity_mean_absolute: Optional[float]
+    velocity_rmse: Optional[float]
+
+
+class PrefixSums:
+    """The prefix sums of a per-line value, for looped range sums"""
+
+    def __init__(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+
+        self.n_lines = len(values)
+        self.sums = np.concatenate(([0.], np.cumsum(values)))
+
+    def _at(self, index: int) -> float:
+        laps, index = divmod(index, self.n_lines)
+        return laps * self.sums[-1] + self.sums[index]
+
+    def sum(self, start: int, end: int) -> float:
+        return float(self._at(end) - self._at(start))
+
+
+class ErrorPrefixSums:
+    """The prefix sums of the errors, their absolutes, squares and counts.
+    Missing (NaN) errors are skipped"""
+
+    def __init__(self, errors: np.ndarray):
+        errors = np.asarray(errors, dtype=np.float64)
+        present = ~np.isnan(errors)
+        errors = np.where(present, errors, 0)
+
+        self.errors = PrefixSums(errors)
+        self.absolute = PrefixSums(np.abs(errors))
+        self.squares = PrefixSums(np.square(errors))
+        self.counts = PrefixSums(present)
+
+    def count(self, start: int, end: int) -> int:
+        return int(round(self.counts.sum(start, end)))
+
+    def mean(self, start: int, end: int) -> Optional[float]:
+        count = self.count(start, end)
+        return self.errors.sum(start, end) / count if count else None
+
+    def mean_absolute(self, start: int, end: int) -> Optional[float]:
+        count = self.count(start, end)
+        return self.absolute.sum(start, end) / count if count else None
+
+    def rmse(self, start: int, end: int) -> Optional[float]:
+        count = self.count(start, end)
+        return math.sqrt(max(self.squares.sum(start, end), 0.) / count) if count else None
+
+
+class SectorIndex:
+    """The prefix sums of a predicted lap's times and errors, for querying
+    any range of seg. lines in O(1)"""
+
+    def __init__(
+            self,
+            truth_times: np.ndarray,
+            predicted_times: np.ndarray,
+            position_deltas: np.ndarray,
+            velocity_deltas: np.ndarray,
+            apexes: Sequence[int]
+    ):
+        """
+        Args:
+            truth_times: The time from each seg. line to the next of the ground
+                truth lap.
+            predicted_times: The time from each seg. line to the next of the
+                predicted lap.
+            position_deltas: The position error of each seg. line.
+            velocity_deltas: The velocity error of each seg. line.
+            apexes: The apex indexes of the ground truth lap.
+        """
+        self.n_lines = len(truth_times)
+        self.apexes = [int(apex) for apex in apexes]
+
+        self.truth_times = PrefixSums(truth_times)
+        self.predicted_times = PrefixSums(predicted_times)
+        self.position = ErrorPrefixSums(position_deltas)
+        self.velocity = ErrorPrefixSums(velocity_deltas)
+
+    @staticmethod
+    def from_context(
+            context: EvaluationContext,
+            predicted_pos: np.ndarray,
+            predicted_vel: np.ndarray,
+            predicted_lines: Optional[np.ndarray] = None,
+            irrespective_of_smoothing: bool = False
+    ) -> 'SectorIndex':
+        """Build the index of a predicted lap, see `EvaluationContext.lap_errors`"""
+        predicted_lines = context.lines if predicted_lines is None else np.asarray(predicted_lines, dtype=np.float64)
+        errors = context.lap_errors(predicted_pos, predicted_vel, predicted_lines, irrespective_of_smoothing)
+
+        # `segment_times` is the time from the previous line, rolled to the time to the next line
+        truth_times = np.roll(segment_times(context.lines, context.pos, context.vel)[0], -1)
+        predicted_times = np.roll(segment_times(predicted_lines, predicted_pos, predicted_vel)[0], -1)
+
+        return SectorIndex(truth_times, predicted_times, errors.position_deltas, errors.velocity_deltas, errors.apexes)
+
+    @staticmethod
+    def from_arrays(
+            truth_lines: np.ndarray,
+            truth_pos: np.ndarray,
+            truth_vel: np.ndarray,
+            predicted_pos: np.ndarray,
+            predicted_vel: np.ndarray,
+            predicted_lines: Optional[np.ndarray] = None,
+            irrespective_of_smoothing: bool = False
+    ) -> 'SectorIndex':
+        """Build the index of a predicted lap, see `context.lap_errors`"""
+        context = EvaluationContext.from_arrays(truth_lines, truth_pos, truth_vel, normals=False)
+        return SectorIndex.from_context(context, predicted_pos, predicted_vel, predicted_lines, irrespective_of_smoothing)
+
+    def _validate(self, start: int, end: int):
+        if not 0 <= start < self.n_lines or not start <= end <= start + self.n_lines:
+            raise ValueError(f"Invalid range ({start}, {end}) of a lap of {self.n_lines} seg. lines")
+
+    def laptime(self, start: int, end: int) -> Tuple[float, float]:
+        """The truth and predicted times to travel from the start to the end line"""
+        self._validate(start, end)
+        return self.truth_times.sum(start, end), self.predicted_times.sum(start, end)
+
+    def sector(self, start: int, end: int) -> SectorErrors:
+        """The errors over a range of seg. lines"""
+        laptime, predicted_laptime = self.laptime(start, end)
+
+        return SectorErrors(
+            start=start,
+            end=end,
+
+            laptime=laptime,
+            predicted_laptime=predicted_laptime,
+            laptime_error=laptime - predicted_laptime,
+
+            position_mean=self.position.mean(start, end),
+            position_mean_absolute=self.position.mean_absolute(start, end),
+            position_rmse=self.position.rmse(start, end),
+
+            velocity_mean=self.velocity.mean(start, end),
+            velocity_mean_absolute=self.velocity.mean_absolute(start, end),
+            velocity_rmse=self.velocity.rmse(start, end),
+        )
+
+    def sectors(self, ranges: Sequence[LineRange]) -> List[SectorErrors]:
+        return [self.sector(start, end) for start, end in ranges]
+
+    def split_sectors(self, n_sectors: int) -> List[SectorErrors]:
+        """The errors of the lap split into equal sectors, see `split_sectors`"""
+        return self.sectors(split_sectors(self.n_lines, n_sectors))
+
+    def apex_segments(self) -> List[SectorErrors]:
+        """The errors of each apex-to-apex segment, see `apex_segments`"""
+        return self.sectors(apex_segments(self.apexes, self.n_lines))
+
+
+def split_sectors(n_lines: int, n_sectors: int) -> List[LineRange]:
+    """Split a lap into sectors of (almost) equal numbers of seg. lines"""
+    if not 0 < n_sectors <= n_lines:
+        raise ValueError(f"Expected between 1 and {n_lines} sectors, got: {n_sectors}")
+
+    boundaries = (np.arange(n_sectors + 1) * n_lines // n_sectors).tolist()
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def apex_segments(apexes: Sequence[int], n_lines: int) -> List[LineRange]:
+    """Split a lap into the segments between consecutive apexes. The last
+    segment wraps around from the last apex to the first, and a lap with
+    fewer than two apexes is a single segment"""
+    apexes = sorted(int(apex) for apex in apexes)
+
+    if len(apexes) == 0:
+        return [(0, n_lines)]
+
+    return [(start, end) for start, end in zip(apexes, apexes[1:])] + [(apexes[-1], apexes[0] + n_lines)]
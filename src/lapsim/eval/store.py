@@ -0,0 +1,364 @@
+import dataclasses
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+from lapsim.eval.evaluation import Evaluation, EvaluationError, EvaluationLapTime
+from lapsim.eval.context import LapErrors
+
+"""Columnar evaluation results.
+
+An `EvaluationStore` is a directory of `.npz` shards plus an `index.json`
+listing them. Each shard holds the rows of a batch of evaluated tracks in two
+tables, stored column by column:
+
+- the tracks table, one row per track with its name, vehicle, track, model
+  and the flattened metrics of its `Evaluation`, e.g. `laptime_error` or
+  `position_rmse`
+- the lines table, one row per seg. line with its position and velocity
+  errors, whether it's an apex, and the row of its track in the shard
+
+Queries stream over the shards one at a time and only load the columns they
+need, so the results of millions of seg. lines are aggregated without
+rebuilding an `Evaluation` per track or holding every row in memory.
+"""
+
+
+INDEX_FILE = "index.json"
+
+# Held by the writer of a store, see `EvaluationStoreWriter`
+LOCK_FILE = "writer.lock"
+
+# The string columns describing each track
+TRACK_KEYS = ("name", "vehicle", "track", "model")
+
+# The metric columns of each track, flattened from its `Evaluation`
+TRACK_METRICS = tuple(
+    [f"laptime_{field.name}" for field in dataclasses.fields(EvaluationLapTime)]
+    + [f"position_{field.name}" for field in dataclasses.fields(EvaluationError)]
+    + [f"velocity_{field.name}" for field in dataclasses.fields(EvaluationError)]
+)
+
+# The error columns of each seg. line
+LINE_METRICS = ("position_delta", "position_percentage_error", "velocity_delta", "velocity_percentage_error")
+
+# The stored columns of each seg. line, besides the row of its track
+LINE_DTYPES = {**{column: np.float64 for column in LINE_METRICS}, "line": np.int64, "apex": bool}
+
+# The default columns aggregated at each level
+AGGREGATE_COLUMNS = {
+    "tracks": ("laptime_error", "laptime_abs_error", "position_rmse", "velocity_rmse"),
+    "lines": ("position_delta", "velocity_delta"),
+}
+
+
+class EvaluationStoreWriter:
+    """Appends evaluated tracks to a store. Rows are buffered and written as a
+    new shard once the buffer holds `shard_size` seg. lines, or on `flush`.
+    Each shard is written to a temporary file and renamed before it's added
+    to the index, so readers only see complete shards.
+
+    A store takes a single writer at a time, since the index is rewritten as
+    each shard is added. The writer holds a lock file in the store until it's
+    closed, and opening a second writer on the same store raises a
+    `FileExistsError`. If a writer is killed without closing, its lock file
+    has to be removed by hand."""
+
+    def __init__(self, directory: Union[str, Path], shard_size: int = 1_000_000):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self.lock_path = self.directory / LOCK_FILE
+        try:
+            os.close(os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            raise FileExistsError(
+                f"The store {self.directory} already has a writer, remove {self.lock_path} if it was killed")
+        self._closed = False
+
+        self.shard_size = shard_size
+
+        self._tracks: Dict[str, list] = {column: [] for column in TRACK_KEYS + TRACK_METRICS + ("n_lines",)}
+        self._lines: Dict[str, List[np.ndarray]] = {column: [] for column in LINE_DTYPES}
+        self._buffered_lines = 0
+
+    def __enter__(self) -> 'EvaluationStoreWriter':
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add(self, errors: LapErrors, name: str, vehicle: str = "", track: str = "", model: str = ""):
+        """Add the errors of a predicted lap, see `context.lap_errors`
+
+        Args:
+            errors: The errors of the lap.
+            name: The name of the evaluated lap, e.g. the file name.
+            vehicle: The vehicle of the lap.
+            track: The track of the lap.
+            model: The model (or model version) which made the prediction.
+        """
+        n_lines = len(errors.position_deltas)
+        self._add_track(errors.evaluation(), n_lines, name, vehicle, track, model)
+
+        apex = np.zeros(n_lines, dtype=bool)
+        apex[np.asarray(errors.apexes, dtype=np.int64)] = True
+
+        for column, values in zip(LINE_METRICS, [
+            errors.position_deltas, errors.position_percentage_errors,
+            errors.velocity_deltas, errors.velocity_percentage_errors
+        ]):
+            self._lines[column].append(np.asarray(values, dtype=np.float64))
+        self._lines["line"].append(np.arange(n_lines, dtype=np.int64))
+        self._lines["apex"].append(apex)
+
+        self._buffered_lines += n_lines
+        if self._buffered_lines >= self.shard_size:
+            self.flush()
+
+    def add_evaluation(self, evaluation: Evaluation, name: str, vehicle: str = "", track: str = "", model: str = ""):
+        """Add the evaluation of a lap without its per-line errors, e.g. one
+        read with `read_evaluations`, see `add`"""
+        self._add_track(evaluation, 0, name, vehicle, track, model)
+
+    def _add_track(self, evaluation: Evaluation, n_lines: int, name: str, vehicle: str, track: str, model: str):
+        for column, value in zip(TRACK_KEYS, (name, vehicle, track, model)):
+            self._tracks[column].append(value)
+
+        for column, value in _flatten(evaluation).items():
+            self._tracks[column].append(np.nan if value is None else float(value))
+
+        self._tracks["n_lines"].append(n_lines)
+
+    def flush(self):
+        """Write the buffered rows as a new shard"""
+        n_tracks = len(self._tracks["name"])
+        if n_tracks == 0:
+            return
+
+        arrays = {f"tracks.{column}": np.asarray(self._tracks[column], dtype=str) for column in TRACK_KEYS}
+        arrays.update({f"tracks.{column}": np.asarray(self._tracks[column], dtype=np.float64) for column in TRACK_METRICS})
+        arrays["tracks.n_lines"] = np.asarray(self._tracks["n_lines"], dtype=np.int64)
+
+        for column, dtype in LINE_DTYPES.items():
+            arrays[f"lines.{column}"] = np.concatenate(self._lines[column] or [np.zeros(0)]).astype(dtype)
+        arrays["lines.track_row"] = np.repeat(np.arange(n_tracks, dtype=np.int64), arrays["tracks.n_lines"])
+
+        shard_name = f"shard-{uuid.uuid4().hex}.npz"
+        temp_path = self.directory / f".tmp-{shard_name}"
+        with open(temp_path, "wb") as file:
+            np.savez(file, **arrays)
+        os.rename(temp_path, self.directory / shard_name)
+
+        index = _read_index(self.directory)
+        index["shards"].append({"file": shard_name, "tracks": n_tracks, "lines": int(len(arrays["lines.line"]))})
+        _write_index(self.directory, index)
+
+        for values in list(self._tracks.values()) + list(self._lines.values()):
+            values.clear()
+        self._buffered_lines = 0
+
+    def close(self):
+        if self._closed:
+            return
+
+        try:
+            self.flush()
+        finally:
+            self._closed = True
+            os.remove(self.lock_path)
+
+
+class EvaluationStore:
+    """Reads and aggregates the rows of a store written by
+    `EvaluationStoreWriter`.
+
+    Rows are filtered by the track columns with keyword arguments, a value or
+    a list of values to match, e.g. `store.tracks(model=["v1", "v2"])`. The
+    lines table can also be filtered by `apex=True` or `apex=False`."""
+
+    def __init__(self, directory: Union[str, Path]):
+        self.directory = Path(directory)
+        self.index = _read_index(self.directory)
+
+    def __len__(self) -> int:
+        return sum(shard["tracks"] for shard in self.index["shards"])
+
+    @property
+    def n_lines(self) -> int:
+        return sum(shard["lines"] for shard in self.index["shards"])
+
+    def tracks(self, columns: Optional[Sequence[str]] = None, **filters) -> Dict[str, np.ndarray]:
+        """Load the columns of the tracks table, defaults to every column"""
+        columns = list(columns or TRACK_KEYS + TRACK_METRICS + ("n_lines",))
+        return _concatenate(self._rows("tracks", columns, filters), columns)
+
+    def lines(self, columns: Optional[Sequence[str]] = None, **filters) -> Dict[str, np.ndarray]:
+        """Load the columns of the lines table, which include the track
+        columns of each line's track, defaults to the line columns and names"""
+        columns = list(columns or ("name", "line", "apex") + LINE_METRICS)
+        return _concatenate(self._rows("lines", columns, filters), columns)
+
+    def aggregate(
+            self,
+            by: Union[str, Sequence[str]],
+            level: str = "lines",
+            columns: Optional[Sequence[str]] = None,
+            **filters
+    ) -> Dict[Any, Dict[str, Optional[float]]]:
+        """Aggregate the rows by one or more columns, in a single pass over
+        the shards. Missing (NaN) values are ignored.
+
+        Args:
+            by: The column(s) to group by, e.g. "vehicle", "model" or (at the
+                lines level) "apex".
+            level: Either "lines", to aggregate the errors of every seg. line,
+                or "tracks", to aggregate the per-track metrics.
+            columns: The columns to aggregate, see `AGGREGATE_COLUMNS` for the
+                defaults.
+            **filters: See `EvaluationStore`.
+
+        Returns:
+            The aggregates of each group, keyed by the group's value (or tuple
+            of values when grouping by several columns). Each has the number
+            of rows (`count`) and the mean, mean absolute and RMSE of each
+            column as floats, e.g. `position_delta_rmse`, which are None where
+            every value of the column is missing.
+        """
+        if level not in AGGREGATE_COLUMNS:
+            raise ValueError(f"Unknown level: '{level}', expected one of {tuple(AGGREGATE_COLUMNS)}")
+
+        keys = [by] if isinstance(by, str) else list(by)
+        columns = list(columns or AGGREGATE_COLUMNS[level])
+
+        # The count, sum, absolute sum and sum of squares of each column
+        sums: Dict[tuple, np.ndarray] = {}
+        counts: Dict[tuple, int] = {}
+
+        for rows in self._rows(level, keys + columns, filters):
+            if len(rows[columns[0]]) == 0:
+                continue
+
+            groups, inverse = _group(rows, keys)
+            values = np.stack([rows[column] for column in columns], axis=1).astype(np.float64)
+            present = ~np.isnan(values)
+            values = np.where(present, values, 0)
+
+            group_sums = np.stack([
+                _bincount(inverse, present, len(groups)),
+                _bincount(inverse, values, len(groups)),
+                _bincount(inverse, np.abs(values), len(groups)),
+                _bincount(inverse, np.square(values), len(groups)),
+            ], axis=1)
+            group_counts = np.bincount(inverse, minlength=len(groups))
+
+            for i, group in enumerate(groups):
+                sums[group] = sums[group] + group_sums[i] if group in sums else group_sums[i]
+                counts[group] = counts.get(group, 0) + int(group_counts[i])
+
+        results = {}
+        for group in sorted(sums):
+            result: Dict[str, Optional[float]] = {"count": counts[group]}
+
+            for i, column in enumerate(columns):
+                count, total, absolute, squares = sums[group][:, i]
+                result[f"{column}_mean"] = float(total / count) if count else None
+                result[f"{column}_mean_absolute"] = float(absolute / count) if count else None
+                result[f"{column}_rmse"] = float(np.sqrt(squares / count)) if count else None
+
+            results[group[0] if len(keys) == 1 else group] = result
+
+        return results
+
+    def _rows(self, level: str, columns: Sequence[str], filters: Dict[str, Any]) -> Iterator[Dict[str, np.ndarray]]:
+        """Load the filtered columns of each shard"""
+        if level not in ("tracks", "lines"):
+            raise ValueError(f"Unknown table: '{level}'")
+
+        needed = set(columns) | set(filters)
+        for shard in self.index["shards"]:
+            with np.load(self.directory / shard["file"]) as data:
+                track_columns = {column[len("tracks."):] for column in data.files if column.startswith("tracks.")}
+                line_columns = {column[len("lines."):] for column in data.files if column.startswith("lines.")}
+
+                unknown = needed - track_columns - (line_columns if level == "lines" else set())
+                if unknown:
+                    raise ValueError(f"Unknown columns: {sorted(unknown)}")
+
+                if level == "tracks":
+                    rows = {column: data[f"tracks.{column}"] for column in needed}
+                else:
+                    track_rows = data["lines.track_row"]
+                    rows = {
+                        column: data[f"lines.{column}"] if column in line_columns else data[f"tracks.{column}"][track_rows]
+                        for column in needed
+                    }
+
+            mask = np.ones(shard[level], dtype=bool)
+            for column, value in filters.items():
+                mask &= np.isin(rows[column], value)
+
+            yield {column: rows[column][mask] for column in columns}
+
+
+def _flatten(evaluation: Evaluation) -> Dict[str, Optional[float]]:
+    """The metric columns of an evaluation, see `TRACK_METRICS`"""
+    return {
+        **{f"laptime_{name}": value for name, value in dataclasses.asdict(evaluation.laptime).items()},
+        **{f"position_{name}": value for name, value in dataclasses.asdict(evaluation.position).items()},
+        **{f"velocity_{name}": value for name, value in dataclasses.asdict(evaluation.velocity).items()},
+    }
+
+
+def _group(rows: Dict[str, np.ndarray], keys: Sequence[str]):
+    """The unique groups of the key columns, and the group of each row"""
+    codes, uniques = [], []
+    for key in keys:
+        unique, inverse = np.unique(rows[key], return_inverse=True)
+        uniques.append(unique.tolist())
+        codes.append(inverse.reshape(-1))
+
+    combined = np.ravel_multi_index(codes, [len(unique) for unique in uniques])
+    group_codes, inverse = np.unique(combined, return_inverse=True)
+
+    groups = [
+        tuple(unique[i] for unique, i in zip(uniques, np.unravel_index(code, [len(unique) for unique in uniques])))
+        for code in group_codes.tolist()
+    ]
+
+    return groups, inverse.reshape(-1)
+
+
+def _bincount(inverse: np.ndarray, values: np.ndarray, n_groups: int) -> np.ndarray:
+    """Sum each column of the values by group"""
+    return np.stack([
+        np.bincount(inverse, weights=values[:, i], minlength=n_groups) for i in range(values.shape[1])
+    ], axis=1)
+
+
+def _concatenate(shards: Iterator[Dict[str, np.ndarray]], columns: Sequence[str]) -> Dict[str, np.ndarray]:
+    shards = list(shards)
+    if not shards:
+        return {column: np.zeros(0) for column in columns}
+
+    return {column: np.concatenate([shard[column] for shard in shards]) for column in columns}
+
+
+def _read_index(directory: Path) -> dict:
+    try:
+        with open(directory / INDEX_FILE) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {"version": 1, "shards": []}
+
+
+def _write_index(directory: Path, index: dict):
+    temp_path = directory / f".tmp-{uuid.uuid4().hex}-{INDEX_FILE}"
+    with open(temp_path, "w+") as file:
+        json.dump(index, file, indent=2)
+
+    os.replace(temp_path, directory / INDEX_FILE)
@@ -0,0 +1,200 @@
+import dataclasses
+from pathlib import Path
+from typing import Dict, List, Sequence, Union
+
+import numpy as np
+
+from lapsim.eval.context import EvaluationContext
+from lapsim.eval.vectorised import line_widths, track_arrays
+from lapsim.normalisation.transform_normalisation import TransformNormalisation
+from toolkit.tracks.models import Track
+
+"""In-training validation metrics.
+
+The model outputs of a whole validation partition are scored in physical
+units without building a `Track` per lap. The seg. lines of every track are
+concatenated once into a `ValidationGeometry`, and each epoch the stacked
+outputs and targets are detransformed and denormalised together, then the
+position errors (in metres), velocity errors and lap times of every track are
+computed in one pass over the concatenated seg. lines, reduced per track with
+`np.add.reduceat`.
+
+The position errors are the distances between the truth and predicted racing
+line points on the same seg. line, as in `evaluate`.
+"""
+
+
+class ValidationGeometry:
+    """The concatenated seg. lines of a set of tracks"""
+
+    def __init__(self, lines: Sequence[np.ndarray]):
+        """
+        Args:
+            lines: The `(N_i, 4)` seg. lines of each track, in the order of the
+                tracks in the partition.
+        """
+        lines = [np.asarray(track_lines, dtype=np.float64).reshape((-1, 4)) for track_lines in lines]
+        if len(lines) == 0 or any(len(track_lines) == 0 for track_lines in lines):
+            raise ValueError("Expected at least one track, and at least one seg. line per track")
+
+        self.track_lengths: List[int] = [len(track_lines) for track_lines in lines]
+        self.lines = np.concatenate(lines)
+        self.widths = line_widths(self.lines)
+
+        # The index of the first line of each track
+        self.starts = np.concatenate(([0], np.cumsum(self.track_lengths)[:-1])).astype(np.int64)
+
+        # The index of the previous line of each line, looped within each track
+        self.previous = np.arange(len(self.lines), dtype=np.int64) - 1
+        self.previous[self.starts] = self.starts + np.asarray(self.track_lengths) - 1
+
+    def __len__(self) -> int:
+        return len(self.track_lengths)
+
+    @staticmethod
+    def from_tracks(tracks: Sequence[Track]) -> 'ValidationGeometry':
+        return ValidationGeometry([track_arrays(track)[0] for track in tracks])
+
+    @staticmethod
+    def from_contexts(contexts: Sequence[EvaluationContext]) -> 'ValidationGeometry':
+        return ValidationGeometry([context.lines for context in contexts])
+
+    def split(self, values: np.ndarray) -> List[np.ndarray]:
+        """Split concatenated per-line values into the values of each track"""
+        return np.split(values, self.starts[1:])
+
+    def save(self, path: Union[str, Path]):
+        """Save the geometry as a `.npz` file"""
+        with open(path, "wb") as file:
+            np.savez(file, lines=self.lines, track_lengths=np.asarray(self.track_lengths, dtype=np.int64))
+
+    @staticmethod
+    def load(path: Union[str, Path]) -> 'ValidationGeometry':
+        """Load a geometry saved with `save`"""
+        with np.load(path) as data:
+            return ValidationGeometry(np.split(data["lines"], np.cumsum(data["track_lengths"])[:-1]))
+
+
+@dataclasses.dataclass
+class ValidationMetrics:
+    """The errors of each track of a validation partition, as `(T,)` arrays.
+    Position errors are in metres and velocity errors in m/s, both signed as
+    in `evaluate`"""
+
+    laptime: np.ndarray
+    predicted_laptime: np.ndarray
+    laptime_error: np.ndarray
+
+    position_mean: np.ndarray
+    position_mean_absolute: np.ndarray
+    position_rmse: np.ndarray
+
+    velocity_mean: np.ndarray
+    velocity_mean_absolute: np.ndarray
+    velocity_rmse: np.ndarray
+
+    def summary(self) -> Dict[str, float]:
+        """The mean of each metric over the tracks, e.g. for logging every
+        epoch. The lap time error is the mean absolute error"""
+        summary = {field.name: float(np.mean(getattr(self, field.name))) for field in dataclasses.fields(self)}
+        summary["laptime_error"] = float(np.mean(np.abs(self.laptime_error)))
+
+        return summary
+
+
+def validation_metrics_arrays(
+        geometry: ValidationGeometry,
+        truth_pos: np.ndarray,
+        truth_vel: np.ndarray,
+        predicted_pos: np.ndarray,
+        predicted_vel: np.ndarray
+) -> ValidationMetrics:
+    """Compute the errors of each track from the concatenated positions and
+    velocities of every track
+
+    Args:
+        geometry: The seg. lines of the tracks.
+        truth_pos: The `(M,)` ground truth positions, `M` the total number of
+            seg. lines.
+        truth_vel: The `(M,)` ground truth velocities.
+        predicted_pos: The `(M,)` predicted positions.
+        predicted_vel: The `(M,)` predicted velocities.
+
+    Returns:
+        The errors of each track
+    """
+    truth_pos, truth_vel, predicted_pos, predicted_vel = (
+        np.asarray(values, dtype=np.float64).reshape(-1)
+        for values in (truth_pos, truth_vel, predicted_pos, predicted_vel)
+    )
+
+    n_lines = len(geometry.lines)
+    if any(len(values) != n_lines for values in (truth_pos, truth_vel, predicted_pos, predicted_vel)):
+        raise ValueError(f"Expected {n_lines} positions and velocities, one per seg. line of the geometry")
+
+    counts = np.asarray(geometry.track_lengths, dtype=np.float64)
+
+    def per_track(values: np.ndarray) -> np.ndarray:
+        return np.add.reduceat(values, geometry.starts)
+
+    # The racing line points are on the same seg. lines, so their distance is
+    # the position difference scaled by the width of the line
+    position_deltas = (predicted_pos - truth_pos) * geometry.widths
+    velocity_deltas = truth_vel - predicted_vel
+
+    laptime = per_track(_segment_times(geometry, truth_pos, truth_vel))
+    predicted_laptime = per_track(_segment_times(geometry, predicted_pos, predicted_vel))
+
+    return ValidationMetrics(
+        laptime=laptime,
+        predicted_laptime=predicted_laptime,
+        laptime_error=laptime - predicted_laptime,
+
+        position_mean=per_track(position_deltas) / counts,
+        position_mean_absolute=per_track(np.abs(position_deltas)) / counts,
+        position_rmse=np.sqrt(per_track(np.square(position_deltas)) / counts),
+
+        velocity_mean=per_track(velocity_deltas) / counts,
+        velocity_mean_absolute=per_track(np.abs(velocity_deltas)) / counts,
+        velocity_rmse=np.sqrt(per_track(np.square(velocity_deltas)) / counts),
+    )
+
+
+def validation_metrics(
+        normaliser: TransformNormalisation,
+        geometry: ValidationGeometry,
+        outputs: Sequence[np.ndarray],
+        targets: Sequence[np.ndarray]
+) -> ValidationMetrics:
+    """Compute the errors of each track from the normalised model outputs
+
+    Args:
+        normaliser: The normaliser the outputs and targets were transformed
+            with.
+        geometry: The seg. lines of the tracks of the partition.
+        outputs: The stacked `[position, velocity]` model outputs of every
+            track, see `TransformNormalisation.detransform_and_denormalise_batch`.
+        targets: The stacked `[position, velocity]` targets of every track.
+
+    Returns:
+        The errors of each track
+    """
+    predicted_pos, predicted_vel = _detransform(normaliser, geometry, outputs)
+    truth_pos, truth_vel = _detransform(normaliser, geometry, targets)
+
+    return validation_metrics_arrays(geometry, truth_pos, truth_vel, predicted_pos, predicted_vel)
+
+
+def _detransform(normaliser: TransformNormalisation, geometry: ValidationGeometry, outputs: Sequence[np.ndarray]):
+    positions, velocities = normaliser.detransform_and_denormalise_batch(geometry.track_lengths, *outputs)
+    return np.concatenate(positions), np.concatenate(velocities)
+
+
+def _segment_times(geometry: ValidationGeometry, pos: np.ndarray, vel: np.ndarray) -> np.ndarray:
+    """The time taken to reach each seg. line from the previous line of its
+    track, see `segment_times`"""
+    lines = geometry.lines
+    paths = lines[:, :2] + (lines[:, 2:] - lines[:, :2]) * pos[:, np.newaxis]
+
+    deltas = paths - paths[geometry.previous]
+    return 2 * np.hypot(deltas[:, 0], deltas[:, 1]) / (vel + vel[geometry.previous])
@@ -0,0 +1,316 @@
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from toolkit import maths
+from lapsim.eval.evaluation import EvaluationError, _ci95
+from toolkit.tracks.models import Track
+from toolkit.utils.spacial_map import SegmentGrid
+
+"""Array-native evaluation.
+
+The functions here compute the same metrics as `evaluate` and `evaluate2`, but
+take the seg. lines as `(N, 4)` arrays of `[x1, y1, x2, y2]` and the pos and
+vel as `(N,)` vectors, and compute every metric with vectorised NumPy rather
+than looping over the segmentation models. Missing errors (e.g. a normal of
+the truth line that doesn't intersect the predicted line) are NaN.
+"""
+
+
+# The length of the racing line normals intersected with the predicted line
+RACING_LINE_NORMAL_LENGTH = 10
+
+# The apex search settings, see `find_apexes`
+APEX_POSITION_THRESHOLD = 0.02
+APEX_ANGLE_THRESHOLD = 0.01
+
+
+def track_arrays(track: Track) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Convert a track to arrays
+
+    Args:
+        track: The spliced track.
+
+    Returns:
+        The `(N, 4)` seg. lines, the `(N,)` positions and the `(N,)` velocities
+    """
+    lines = np.array([[s.x1, s.y1, s.x2, s.y2] for s in track.segmentations], dtype=np.float64).reshape((-1, 4))
+    pos = np.array([s.pos for s in track.segmentations], dtype=np.float64)
+    vel = np.array([s.vel for s in track.segmentations], dtype=np.float64)
+
+    return lines, pos, vel
+
+
+def line_angles(lines: np.ndarray) -> np.ndarray:
+    """The alpha angle at each seg. line (the angle turned between the centres
+    of the previous, current and next lines, looped), matching the angles of
+    `extract_features`"""
+    centers = (lines[:, :2] + lines[:, 2:]) / 2
+    to_prev = np.roll(centers, 1, axis=0) - centers
+    to_next = np.roll(centers, -1, axis=0) - centers
+
+    between = np.mod(
+        np.arctan2(to_prev[:, 1], to_prev[:, 0]) - np.arctan2(to_next[:, 1], to_next[:, 0]) + np.pi * 2,
+        np.pi * 2
+    )
+
+    return between - np.pi
+
+
+def optimal_positions(lines: np.ndarray, pos: np.ndarray) -> np.ndarray:
+    """The `(N, 2)` points of the racing line, interpolated along each seg. line
+    by its position, see `calculate_optimal_positions`"""
+    pos = np.asarray(pos)[:, np.newaxis]
+    return lines[:, :2] + (lines[:, 2:] - lines[:, :2]) * pos
+
+
+def estimate_lap_time_arrays(lines: np.ndarray, pos: np.ndarray, vel: np.ndarray) -> float:
+    """Estimate the lap time from the racing line of the seg. lines, see
+    `estimate_lap_time`"""
+    return float(estimate_lap_times(lines, np.asarray(pos)[np.newaxis], np.asarray(vel)[np.newaxis])[0])
+
+
+def estimate_lap_times(
+        lines: np.ndarray,
+        pos: np.ndarray,
+        vel: np.ndarray,
+        cumulative: bool = False
+) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+    """Estimate the lap times of a batch of laps around the same seg. lines.
+    The time between each pair of seg. lines is `2s / (u + v)`, where `s` is
+    the distance between the racing line points and `u` and `v` the
+    velocities at each line.
+
+    Args:
+        lines: The `(N, 4)` seg. lines.
+        pos: The `(K, N)` positions of each lap on the seg. lines.
+        vel: The `(K, N)` velocities of each lap.
+        cumulative: If true, the cumulative time traces are returned too.
+
+    Returns:
+        The `(K,)` lap times, and if cumulative is true the `(K, N)` times at
+        which each lap reaches each seg. line, starting from the first line at
+        time 0 (so the lap time is the last time plus the time from the last
+        line back to the first).
+    """
+    times = segment_times(lines, pos, vel)
+
+    lap_times = np.sum(times, axis=1)
+    if not cumulative:
+        return lap_times
+
+    traces = np.zeros_like(times)
+    np.cumsum(times[:, 1:], axis=1, out=traces[:, 1:])
+
+    return lap_times, traces
+
+
+def segment_times(lines: np.ndarray, pos: np.ndarray, vel: np.ndarray) -> np.ndarray:
+    """The time taken to reach each seg. line from the previous line (looped,
+    so the first is the time from the last line), see `estimate_lap_times`
+
+    Args:
+        lines: The `(N, 4)` seg. lines.
+        pos: The `(K, N)` positions of each lap on the seg. lines.
+        vel: The `(K, N)` velocities of each lap.
+
+    Returns:
+        The `(K, N)` times
+    """
+    pos, vel = np.atleast_2d(pos), np.atleast_2d(vel)
+    if pos.shape != vel.shape or pos.shape[1] != len(lines):
+        raise ValueError(f"Expected (K, {len(lines)}) positions and velocities, got: {pos.shape} and {vel.shape}")
+
+    # The (K, N, 2) racing line points
+    paths = lines[np.newaxis, :, :2] + (lines[:, 2:] - lines[:, :2])[np.newaxis] * pos[:, :, np.newaxis]
+
+    deltas = paths - np.roll(paths, 1, axis=1)
+    return 2 * np.hypot(deltas[..., 0], deltas[..., 1]) / (vel + np.roll(vel, 1, axis=1))
+
+
+def find_apexes_arrays(pos: np.ndarray, angles: np.ndarray) -> np.ndarray:
+    """Find the apexes from the positions and the angles of the seg. lines,
+    see `find_apexes`. The seg. lines where the racing line is near the edge of
+    a corner are grouped into runs of consecutive lines, and the apex of each
+    run is the line nearest the edge.
+
+    Args:
+        pos: The positions on the seg. lines.
+        angles: The alpha angles of the seg. lines, see `line_angles`.
+
+    Returns:
+        The indexes of the apexes
+    """
+    pos = np.asarray(pos)
+
+    candidates = np.flatnonzero(
+        ((pos < APEX_POSITION_THRESHOLD) | (pos > 1 - APEX_POSITION_THRESHOLD)) &
+        (np.abs(angles) > APEX_ANGLE_THRESHOLD)
+    )
+    if len(candidates) == 0:
+        return candidates
+
+    # Number the runs of consecutive indexes, then sort by run and then by the
+    # distance to the edge, so the first candidate of each run is its apex
+    groups = np.concatenate(([0], np.cumsum(np.diff(candidates) != 1)))
+    errors = np.where(pos[candidates] < 0.5, pos[candidates], 1 - pos[candidates])
+
+    order = np.lexsort((errors, groups))
+    firsts = np.flatnonzero(np.diff(groups[order], prepend=-1))
+
+    return candidates[order[firsts]]
+
+
+def evaluation_error(deltas: np.ndarray, percentage_errors: np.ndarray, apexes: Sequence[int]) -> EvaluationError:
+    """Summarise the errors of each seg. line, see `EvaluationError.from_errors`.
+    NaN errors are ignored.
+
+    Args:
+        deltas: The signed error of each seg. line.
+        percentage_errors: The percentage error of each seg. line.
+        apexes: The indexes of the apexes.
+
+    Returns:
+        The summarised errors
+    """
+    deltas = np.asarray(deltas, dtype=np.float64)
+    percentage_errors = np.asarray(percentage_errors, dtype=np.float64)
+
+    apex_deltas = deltas[np.asarray(apexes, dtype=int)]
+    apex_deltas = apex_deltas[~np.isnan(apex_deltas)]
+
+    deltas = deltas[~np.isnan(deltas)]
+    percentage_errors = percentage_errors[~np.isnan(percentage_errors)]
+    abs_deltas = np.abs(deltas)
+
+    return EvaluationError(
+        max=float(np.max(abs_deltas)),
+        mean=float(np.mean(deltas)),
+        mean_absolute=float(np.mean(abs_deltas)),
+        rmse=float(np.sqrt(np.mean(np.square(deltas)))),
+        ci95=_ci95(abs_deltas),
+
+        percentage_mean=float(np.mean(percentage_errors)),
+        percentage_max=float(np.max(percentage_errors)),
+        percentage_ci95=_ci95(percentage_errors),
+
+        apex_mean=float(np.mean(apex_deltas)) if len(apex_deltas) else None,
+        apex_mean_absolute=float(np.mean(np.abs(apex_deltas))) if len(apex_deltas) else None,
+        apex_max=float(np.max(np.abs(apex_deltas))) if len(apex_deltas) else None,
+    )
+
+
+def velocity_errors(
+        truth_vel: np.ndarray,
+        predicted_vel: np.ndarray,
+        truth_vel_range: Optional[Tuple[float, float]] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """The velocity deltas and the percentage errors, relative to the range of
+    the velocities of both laps. The min and max truth velocities are
+    calculated if not given."""
+    deltas = np.asarray(truth_vel) - np.asarray(predicted_vel)
+
+    min_vel, max_vel = truth_vel_range if truth_vel_range is not None else (np.min(truth_vel), np.max(truth_vel))
+    vel_range = max(max_vel, np.max(predicted_vel)) - min(min_vel, np.min(predicted_vel))
+
+    return deltas, np.abs(deltas) / vel_range * 100
+
+
+def position_errors(
+        truth_lines: np.ndarray,
+        truth_pos: np.ndarray,
+        predicted_lines: np.ndarray,
+        predicted_pos: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """The distances between the racing line points, negative where the
+    prediction is nearer the start of the seg. line, and the percentage errors
+    of the positions"""
+    truth_pos, predicted_pos = np.asarray(truth_pos), np.asarray(predicted_pos)
+
+    delta = optimal_positions(predicted_lines, predicted_pos) - optimal_positions(truth_lines, truth_pos)
+    distances = np.hypot(delta[:, 0], delta[:, 1])
+
+    return np.where(predicted_pos < truth_pos, -distances, distances), np.abs(predicted_pos - truth_pos) * 100
+
+
+def position_errors_irrespective_of_smoothing(
+        truth_lines: np.ndarray,
+        truth_pos: np.ndarray,
+        predicted_lines: np.ndarray,
+        predicted_pos: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """The distances from each point of the truth racing line to the nearest
+    intersection of its normal with the splined predicted racing line, and
+    those distances as a fraction of the seg. line widths, see
+    `evaluate_position_errors_irrespective_of_smoothing`. Normals without an
+    intersection have NaN errors."""
+    true_racing_line = optimal_positions(truth_lines, truth_pos)
+
+    return smoothing_independent_errors(
+        true_racing_line,
+        racing_line_normals(true_racing_line),
+        line_widths(truth_lines),
+        optimal_positions(predicted_lines, predicted_pos)
+    )
+
+
+def line_widths(lines: np.ndarray) -> np.ndarray:
+    """The lengths of the seg. lines"""
+    return np.hypot(lines[:, 1] - lines[:, 3], lines[:, 0] - lines[:, 2])
+
+
+def racing_line_normals(true_racing_line: np.ndarray) -> list:
+    """The normals of the racing line, which the predicted racing line is
+    intersected with"""
+    return maths.create_line_normals_from_points(true_racing_line, RACING_LINE_NORMAL_LENGTH)
+
+
+def smoothing_independent_errors(
+        true_racing_line: np.ndarray,
+        normals: list,
+        widths: np.ndarray,
+        predicted_racing_line: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """The distances from each point of the truth racing line to the nearest
+    intersection of its normal with the splined predicted racing line, see
+    `position_errors_irrespective_of_smoothing`
+
+    Args:
+        true_racing_line: The `(N, 2)` truth racing line.
+        normals: The normals of the truth racing line, see `racing_line_normals`.
+        widths: The widths of the truth seg. lines.
+        predicted_racing_line: The `(N, 2)` predicted racing line.
+
+    Returns:
+        The distances and the distances as a fraction of the widths
+    """
+    splined = maths.catmull_rom_spline(np.asarray(predicted_racing_line).tolist(), 5, True)
+    predicted_segments = maths.points_to_lines(splined)
+
+    errors = np.full(len(true_racing_line), np.nan)
+    for idx, intersections in enumerate(racing_line_intersections(normals, predicted_segments)):
+        if intersections:
+            delta = np.asarray(intersections, dtype=np.float64) - true_racing_line[idx]
+            errors[idx] = np.min(np.hypot(delta[:, 0], delta[:, 1]))
+
+    return errors, errors / widths
+
+
+def racing_line_intersections(normals: list, segments: list) -> List[list]:
+    """Intersect each normal with the segments of the (splined) predicted
+    racing line. Only the segments a normal may intersect are tested, found
+    with a grid index, so the intersections are the same as testing every
+    segment but in near-linear time.
+
+    Args:
+        normals: The normals of the truth racing line, as `[x1, y1, x2, y2]`.
+        segments: The segments of the predicted racing line.
+
+    Returns:
+        The intersections of each normal, in the order of the segments
+    """
+    grid = SegmentGrid(np.array(segments, dtype=np.float64), RACING_LINE_NORMAL_LENGTH)
+
+    return [
+        maths.segment_intersections(normal, [segments[i] for i in candidates])
+        for normal, candidates in zip(normals, grid.query(np.array(normals, dtype=np.float64)))
+    ]
@@ -2,3 +2,4 @@ from . import transforms
 from .normalisation_bounds import NormalisationBounds
 from .normalised_data import NormalisedData
 from .transform_normalisation import TransformNormalisation
+from .cache import DiskTransformCache, MemoryTransformCache
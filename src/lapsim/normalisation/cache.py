@@ -0,0 +1,325 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Union, Optional, Tuple, List, Dict
+
+import numpy as np
+
+from lapsim.encoder.partition import Partition
+from lapsim.normalisation.transform_normalisation import TransformNormalisation
+from lapsim.normalisation.transforms.executor import Cores
+
+
+"""Caches of transformed partitions.
+
+The transform config doesn't change within a training run, so every epoch
+after the first re-transforms the same partitions into the same arrays. The
+caches here store the transform outputs keyed by the content of the partition
+and the transform & normalisation settings, so later epochs can skip parsing
+and transforming the partition."""
+
+
+# The transform outputs: the inputs, the list of targets and the vehicles
+TransformResult = Tuple[np.ndarray, List[np.ndarray], np.ndarray]
+
+
+def hash_file(path: Union[str, Path]) -> str:
+    """Hash the content of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def hash_partition(partition: Partition) -> str:
+    """Hash the content of a partition"""
+    return hashlib.sha256(partition.model_dump_json().encode()).hexdigest()
+
+
+def hash_config(normaliser: TransformNormalisation) -> str:
+    """Hash the transform and normalisation bounds settings, canonicalised so
+    the same settings always have the same hash. The subsampling settings
+    aren't included since they're applied to the transform outputs."""
+    config = {
+        "transform": normaliser.transform.model_dump(mode="json", exclude={"random_repeats", "decimation"}),
+        "bounds": normaliser.bounds.model_dump(mode="json"),
+    }
+
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+def cache_key(
+        normaliser: TransformNormalisation,
+        partition: Optional[Partition] = None,
+        partition_path: Optional[Union[str, Path]] = None
+) -> str:
+    """Get the cache key of a partition transformed by the normaliser. The
+    partition is identified by the hash of its file if a path is given,
+    otherwise by the hash of its content."""
+    if partition_path is not None:
+        partition_hash = hash_file(partition_path)
+    elif partition is not None:
+        partition_hash = hash_partition(partition)
+    else:
+        raise ValueError("Either a partition or a partition path is required")
+
+    return hashlib.sha256((partition_hash + hash_config(normaliser)).encode()).hexdigest()
+
+
+def _validate_result(result: TransformResult):
+    x, outputs, vehicles = result
+    if not all(isinstance(array, np.ndarray) for array in [x, *outputs, vehicles]):
+        raise ValueError("Only transforms which output arrays can be cached")
+
+
+def _freeze(result: TransformResult):
+    x, outputs, vehicles = result
+    for array in [x, *outputs, vehicles]:
+        array.setflags(write=False)
+
+
+class TransformCache(ABC):
+    """A cache of transform outputs, keyed by `cache_key`"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[TransformResult]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def put(self, key: str, result: TransformResult):
+        raise NotImplementedError
+
+    def load_and_transform(
+            self,
+            normaliser: TransformNormalisation,
+            partition_path: Union[str, Path],
+            cores: Optional[Cores] = None
+    ) -> TransformResult:
+        """Get the transform of a partition file from the cache, otherwise load
+        and transform the partition and add it to the cache. On a hit the
+        partition is only hashed, not parsed.
+
+        Args:
+            normaliser: The normaliser to transform the partition with.
+            partition_path: The path to the partition file.
+            cores: See `TransformNormalisation.normalise_and_transform`.
+
+        Returns:
+            The transform outputs
+        """
+        key = cache_key(normaliser, partition_path=partition_path)
+
+        result = self.get(key)
+        if result is None:
+            result = normaliser.normalise_and_transform(Partition.load(partition_path), cores=cores)
+            self.put(key, result)
+
+        return result
+
+    def normalise_and_transform(
+            self,
+            normaliser: TransformNormalisation,
+            partition: Partition,
+            cores: Optional[Cores] = None
+    ) -> TransformResult:
+        """Get the transform of a loaded partition from the cache, otherwise
+        transform it and add it to the cache, see `load_and_transform`"""
+        key = cache_key(normaliser, partition=partition)
+
+        result = self.get(key)
+        if result is None:
+            result = normaliser.normalise_and_transform(partition, cores=cores)
+            self.put(key, result)
+
+        return result
+
+
+class DiskTransformCache(TransformCache):
+    """A cache of transform outputs stored on disk as `.npy` files, which are
+    memory mapped when read. When the cache grows larger than `max_bytes`, the
+    least recently used entries are evicted.
+
+    Each entry is a directory named by its key, written to a temporary
+    directory first and then renamed, so readers only see complete entries."""
+
+    def __init__(self, directory: Union[str, Path], max_bytes: Optional[int] = None, mmap: bool = True):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self.max_bytes = max_bytes
+        self.mmap = mmap
+
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[TransformResult]:
+        path = self.directory / key
+        try:
+            with open(path / "meta.json") as file:
+                meta = json.load(file)
+
+            mmap_mode = "r" if self.mmap else None
+            result = (
+                np.load(path / "x.npy", mmap_mode=mmap_mode),
+                [np.load(path / f"output-{i}.npy", mmap_mode=mmap_mode) for i in range(meta["outputs"])],
+                np.load(path / "vehicles.npy", mmap_mode=mmap_mode),
+            )
+        except FileNotFoundError:
+            return None
+
+        # Mark the entry as recently used
+        os.utime(path)
+
+        return result
+
+    def put(self, key: str, result: TransformResult):
+        _validate_result(result)
+        x, outputs, vehicles = result
+
+        temp_path = self.directory / f".tmp-{uuid.uuid4().hex}"
+        temp_path.mkdir()
+
+        np.save(temp_path / "x.npy", x)
+        for i, output in enumerate(outputs):
+            np.save(temp_path / f"output-{i}.npy", output)
+        np.save(temp_path / "vehicles.npy", vehicles)
+
+        with open(temp_path / "meta.json", "w+") as file:
+            json.dump({"outputs": len(outputs)}, file)
+
+        try:
+            os.rename(temp_path, self.directory / key)
+        except OSError:
+            # Already added by another loader
+            shutil.rmtree(temp_path, ignore_errors=True)
+
+        self.evict(keep=key)
+
+    def entries(self) -> List[Tuple[str, int, int]]:
+        """Get the key, size in bytes and last used time of each entry, from
+        the least to the most recently used"""
+        entries = []
+        for path in self.directory.iterdir():
+            if path.name.startswith(".tmp-") or not path.is_dir():
+                continue
+
+            try:
+                size = sum(file.stat().st_size for file in path.iterdir())
+                entries.append((path.name, size, path.stat().st_mtime_ns))
+            except FileNotFoundError:
+                continue
+
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def size_bytes(self) -> int:
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep: Optional[str] = None):
+        """Evict the least recently used entries until the cache fits within
+        `max_bytes`. The entry with the `keep` key is never evicted"""
+        if self.max_bytes is None:
+            return
+
+        with self._lock:
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+
+            for key, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+
+                if key != keep:
+                    shutil.rmtree(self.directory / key, ignore_errors=True)
+                    total -= size
+
+    def clear(self):
+        for key, _, _ in self.entries():
+            shutil.rmtree(self.directory / key, ignore_errors=True)
+
+
+def result_bytes(result: TransformResult) -> int:
+    """The number of bytes of the arrays in a transform result"""
+    x, outputs, vehicles = result
+    return x.nbytes + sum(output.nbytes for output in outputs) + vehicles.nbytes
+
+
+class MemoryTransformCache(TransformCache):
+    """A cache of transform outputs kept in memory, within a budget of
+    `max_bytes`. When adding an entry would go over the budget the least
+    recently used entries are evicted, and results larger than the whole
+    budget aren't cached. The arrays of every result put in the cache are
+    made read-only, whether or not it's cached. The cache is thread safe so it
+    can be shared with the async loaders."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: OrderedDict[str, TransformResult] = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._size_bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: str):
+        return key in self._entries
+
+    def get(self, key: str) -> Optional[TransformResult]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return result
+
+    def put(self, key: str, result: TransformResult):
+        _validate_result(result)
+        size = result_bytes(result)
+
+        # The same arrays are handed to every later caller, so they're made
+        # read-only (like the memory maps of the disk cache) to stop in-place
+        # changes leaking into later epochs. Results too large to cache are
+        # frozen too, so the arrays returned don't depend on their size.
+        _freeze(result)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            if size > self.max_bytes:
+                return
+
+            while self._size_bytes + size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+            self._entries[key] = result
+            self._sizes[key] = size
+            self._size_bytes += size
+
+    def _remove(self, key: str):
+        del self._entries[key]
+        self._size_bytes -= self._sizes.pop(key)
+
+    def size_bytes(self) -> int:
+        return self._size_bytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._size_bytes = 0
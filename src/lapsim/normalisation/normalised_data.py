@@ -43,3 +43,11 @@ class NormalisedData:
 
     def track_length(self, t_idx):
         return len(self["widths"][t_idx])
+
+    def subset(self, track_indexes: List[int]) -> 'NormalisedData':
+        """Create a new normalised data object containing only the given
+        tracks, in the given order. The track data isn't copied."""
+        return NormalisedData({
+            key: [values[t_idx] for t_idx in track_indexes]
+            for key, values in self.data.items()
+        })
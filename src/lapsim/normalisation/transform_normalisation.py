@@ -1,15 +1,21 @@
 import json
 import threading
 from pathlib import Path
-from typing import Union, List, Tuple
+from typing import Union, List, Tuple, Optional, Iterator, TYPE_CHECKING
 
 import numpy as np
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
 from lapsim.normalisation.normalisation_bounds import NormalisationBounds
 from lapsim.encoder.partition import Partition
+from lapsim.normalisation.transforms.bucketing import Bucket
+from lapsim.normalisation.transforms.executor import Cores, Executor, create_executor
+from lapsim.normalisation.transforms.quantisation import quantise
 from lapsim.normalisation.transforms.transformer import Transform
 
+if TYPE_CHECKING:
+    from lapsim.normalisation.cache import TransformCache
+
 
 """This module contains the transform normalisation. This is the main object to
 be used for normalising and transforming the input data to the network."""
@@ -20,6 +26,8 @@ class TransformNormalisation(BaseModel):
     transform: Transform = Field(default_factory=lambda: Transform())
     bounds: NormalisationBounds = Field(default_factory=lambda: NormalisationBounds())
 
+    _executor: Optional[Executor] = PrivateAttr(default=None)
+
     def save(self, path):
         with open(path, "w+") as file:
             file.write(self.model_dump_json(exclude_none=True))
@@ -45,12 +53,145 @@ class TransformNormalisation(BaseModel):
 
         return self
 
-    def normalise_and_transform(self, partition: Partition, cores: int = 1):
-        """Normalise and transform the data"""
+    def set_executor(self, mode: str = "auto", workers: Optional[int] = None) -> Executor:
+        """Set the executor the transforms run on when no cores are given. The
+        executor's workers persist between transforms until `shutdown` is
+        called, replacing any previously set executor.
+
+        Args:
+            mode: One of "serial", "thread", "process" or "auto". Auto picks
+                the backend and number of workers based on the partition size.
+            workers: The (maximum) number of workers, defaults to the number of
+                CPUs.
+
+        Returns:
+            The new executor
+        """
+        self.shutdown()
+        self._executor = create_executor(mode, workers)
+
+        return self._executor
+
+    def shutdown(self):
+        """Shut down the executor's workers, if an executor has been set"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _resolve_cores(self, cores: Optional[Cores]) -> Cores:
+        if cores is not None:
+            return cores
+
+        return self._executor if self._executor is not None else 1
+
+    def normalise_and_transform(
+            self,
+            partition: Partition,
+            cores: Optional[Cores] = None,
+            quantisation: Optional[str] = None
+    ):
+        """Normalise and transform the data. When no cores are given, the
+        executor set with `set_executor` is used, otherwise it is transformed
+        on a single core.
+
+        When a quantisation type ("uint8" or "int16") is given, the inputs are
+        returned as a `QuantisedArray`, see `quantisation.quantise`."""
         vehicles = self.transform.vectorise_vehicles(partition.vehicles)
         normalisation = self.bounds.normalise(partition, vehicles)
 
-        return self.transform.transform(normalisation, cores=cores)
+        x, outputs, vehicles = self.transform.transform(normalisation, cores=self._resolve_cores(cores))
+
+        if quantisation is not None:
+            if not isinstance(x, np.ndarray):
+                raise ValueError(f"Quantisation is not supported by the '{self.transform.method}' transform")
+
+            x = quantise(x, quantisation)
+
+        return x, outputs, vehicles
+
+    def normalise_and_transform_chunks(
+            self,
+            partition: Partition,
+            max_bytes: int,
+            cores: Optional[Cores] = None,
+            quantisation: Optional[str] = None
+    ) -> Iterator[Tuple[List[int], Tuple]]:
+        """Normalise and transform the data in chunks of tracks, where the
+        outputs of each chunk fit within the given number of bytes (see
+        `Transform.estimate_output_bytes`). Each chunk is transformed as it's
+        iterated to, so only one chunk is held in memory at once.
+
+        Args:
+            partition: The partition to transform.
+            max_bytes: The maximum output bytes of each chunk, a track which
+                doesn't fit on its own is transformed as its own chunk.
+            cores: See `normalise_and_transform`.
+            quantisation: See `normalise_and_transform`.
+
+        Returns:
+            An iterator of the track indexes of each chunk and its transform
+        """
+        track_lengths = [len(widths) for widths in partition.widths]
+
+        for track_indexes in self.transform.chunk_track_indexes(track_lengths, max_bytes):
+            yield track_indexes, self.normalise_and_transform(
+                partition.subset(track_indexes), cores=cores, quantisation=quantisation)
+
+    def normalise_and_transform_bucketed(
+            self,
+            partition: Partition,
+            n_buckets: int,
+            cores: Optional[Cores] = None
+    ) -> List[Bucket]:
+        """Normalise and transform the data in track length buckets, see
+        `TransformMethod.transform_bucketed`"""
+        vehicles = self.transform.vectorise_vehicles(partition.vehicles)
+        normalisation = self.bounds.normalise(partition, vehicles)
+
+        return self.transform.transform_bucketed(
+            normalisation, cores=self._resolve_cores(cores), n_buckets=n_buckets)
+
+    def normalise_and_transform_packed(self, partition: Partition, cores: Optional[Cores] = None):
+        """Normalise and transform the data into padded arrays of whole tracks,
+        see `StatefulLaggingTransformMethod.transform_packed`"""
+        vehicles = self.transform.vectorise_vehicles(partition.vehicles)
+        normalisation = self.bounds.normalise(partition, vehicles)
+
+        return self.transform.transform_packed(normalisation, cores=self._resolve_cores(cores))
+
+    def retransform_track(
+            self,
+            x: np.ndarray,
+            partition: Partition,
+            start: int,
+            end: int,
+            track_index: int = 0
+    ) -> np.ndarray:
+        """Update a previously transformed track after the seg. lines in the
+        range [start, end) have been edited, so only the affected rows need to
+        be predicted again. Only supported by the window transforms.
+
+        Args:
+            x: The transform inputs of the track (its rows of a previous
+                transform), updated in place.
+            partition: The partition containing the edited track.
+            start: The first edited seg. line.
+            end: The seg. line after the last edited line.
+            track_index: The index of the edited track in the partition.
+
+        Returns:
+            The sorted indexes of the rows of the track which were updated
+        """
+        track = partition.subset([track_index])
+        vehicles = self.transform.vectorise_vehicles(track.vehicles)
+        normalisation = self.bounds.normalise(track, vehicles)
+
+        return self.transform.retransform(normalisation, 0, x, start, end)
+
+    def subsample_indexes(self, partition: Partition, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """Draw the rows of the partition's transform output to train on for an
+        epoch, see `Transform.subsample_indexes`"""
+        return self.transform.subsample_indexes([len(widths) for widths in partition.widths], rng)
 
     def detransform_and_denormalise(
             self,
@@ -64,34 +205,79 @@ class TransformNormalisation(BaseModel):
             velocity * (self.bounds.max_velocity - self.bounds.min_velocity) + self.bounds.min_velocity
         )
 
-    def async_load_and_normalise_partition(self, partition_path: Union[str, Path], cores: int = 1):
+    def detransform_and_denormalise_batch(
+            self,
+            track_lengths: List[int],
+            position: np.ndarray,
+            velocity: np.ndarray
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """Detransform and denormalise the stacked outputs of many tracks at
+        once, e.g. the model outputs for a whole partition.
+
+        Args:
+            track_lengths: Number of normals in each track
+            position: The stacked position outputs of all the tracks
+            velocity: The stacked velocity outputs of all the tracks
+
+        Returns:
+            The lists of the position and velocity traces of each track
+        """
+        positions, velocities = self.transform.detransform_batch(track_lengths, [position, velocity])
+        velocity_range = self.bounds.max_velocity - self.bounds.min_velocity
+
+        return (
+            positions,
+            [track_velocity * velocity_range + self.bounds.min_velocity for track_velocity in velocities]
+        )
+
+    def async_load_and_normalise_partition(
+            self,
+            partition_path: Union[str, Path],
+            cores: Optional[Cores] = None,
+            cache: Optional['TransformCache'] = None
+    ):
         """Load and normalise a partition asyncronously
 
         Args:
             partition_path: File path to the partition
+            cores: See `normalise_and_transform`
+            cache: The cache of transformed partitions to read from and add
+                to, see `lapsim.normalisation.cache`
 
         Returns:
             The async partition loader object
         """
-        loader = AsyncPartitionNormalisationLoader(partition_path, self, cores)
+        loader = AsyncPartitionNormalisationLoader(partition_path, self, cores, cache)
         loader.start()
 
         return loader
 
 
 class AsyncPartitionNormalisationLoader(threading.Thread):
-    """Helper object for loading and normalising the partition asyncronously"""
+    """Helper object for loading and normalising the partition asyncronously.
+    When the transform is read from a cache the partition isn't loaded, so
+    `partition` is None"""
 
-    def __init__(self, path: str, normaliser: TransformNormalisation, cores: int = 1):
+    def __init__(
+            self,
+            path: str,
+            normaliser: TransformNormalisation,
+            cores: Optional[Cores] = None,
+            cache: Optional['TransformCache'] = None
+    ):
         super().__init__()
 
         self._path = path
         self._normaliser = normaliser
+        self._cache = cache
 
         self.partition = None
         self.normalisation = None
         self.cores = cores
 
     def run(self):
-        self.partition = Partition.load(self._path)
-        self.normalisation = self._normaliser.normalise_and_transform(self.partition, cores=self.cores)
+        if self._cache is not None:
+            self.normalisation = self._cache.load_and_transform(self._normaliser, self._path, cores=self.cores)
+        else:
+            self.partition = Partition.load(self._path)
+            self.normalisation = self._normaliser.normalise_and_transform(self.partition, cores=self.cores)
@@ -1,11 +1,13 @@
 import math
-from typing import List
+from typing import List, Tuple
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 from lapsim.normalisation.normalised_data import NormalisedData
-from lapsim.normalisation.transforms.common import patchify, combine, TransformMethod
-from lapsim.normalisation.transforms.sampling import get_target_output
+from lapsim.normalisation.transforms.executor import Cores
+from lapsim.normalisation.transforms.common import patchify_batch, combine, TransformMethod
+from lapsim.normalisation.transforms.sampling import target_indexes
 
 
 """Bidirectional history transform allows for the full track to be passed into
@@ -29,7 +31,7 @@ line as the most recent point in time.
 
 class BidirectionalTransformMethod(TransformMethod):
 
-    def transform(self, normalised: NormalisedData, cores: int):
+    def transform(self, normalised: NormalisedData, cores: Cores):
         """The bidirectional history transform. This works by iterating through the
         track length and inputing the history of the track up to this point in time
         and by passing in the future track doing the same but in reverse. This
@@ -50,80 +52,61 @@ class BidirectionalTransformMethod(TransformMethod):
              A tuple of the inputs (a tuple of the input bidirectional array and
              vehicle array) and the outputs (sampled position and sampled velocity)
         """
-        x = np.zeros((
-            normalised.normals_count(),
-            math.ceil(normalised.longest_track_length() / self.patch_size),
-            2 * len(self.inputs) * self.patch_size
-        ), dtype=np.float32)
-        x.fill(-1)
 
         vehicles = np.zeros((normalised.normals_count(), normalised.vehicle_size()), dtype=np.float32)
 
-        # Encode tracks
-        track_encodings = self.perform_parallel_transforms(_bidirectional_transform, normalised, cores)
+        # Encode tracks, padded with -1s
+        x = self.perform_parallel_transforms(_bidirectional_transform, normalised, cores, shape=(
+            normalised.normals_count(),
+            math.ceil(normalised.longest_track_length() / self.patch_size),
+            2 * len(self.inputs) * self.patch_size
+        ), dtype=np.float32, fill=-1)
 
         global_index = 0
-        for i in range(len(normalised.vehicles)):
-            track_length = len(normalised.widths[i])
-            track_encoding = track_encodings[i]
-
-            x[global_index:global_index + len(track_encoding), -track_encoding.shape[1]:] = track_encoding
+        for i in range(len(normalised)):
+            track_length = normalised.track_length(i)
             vehicles[global_index:global_index + track_length] = normalised.vehicles[i]
 
             global_index += track_length
 
         return (
             x,
-            get_target_output(
-                normalised,
-                outputs=self.outputs,
-                sampling=self.sampling,
-                patch_size=self.patch_size
-            ),
+            self.target_output(normalised),
             vehicles
         )
 
-    # TODO Document
-    def detransform(self, track_length: int, outputs: List[np.ndarray]):
-        detransformed_outputs = []
-
-        for output in outputs:
-            detransformed = [[] for _ in range(output.shape[0])]
-            for index in range(len(output)):
-                frame_output = output[index]
-                for i in range(len(frame_output)):
-                    original_index = (index + (i - self.patch_size * (self.sampling + 1) + 1)) % track_length
-                    detransformed[original_index].append(frame_output[i])
-
-            detransformed_outputs.append(np.array([np.mean(x) for x in detransformed]))
+    def output_shapes(self, track_lengths: List[int], vehicle_size: int) -> List[Tuple[Tuple[int, ...], np.dtype]]:
+        n_normals = sum(track_lengths)
+        vector_length = math.ceil(max(track_lengths, default=0) / self.patch_size)
+        return [
+            ((n_normals, vector_length, 2 * len(self.inputs) * self.patch_size), np.dtype(np.float32)),
+            *self.target_shapes(track_lengths),
+            ((n_normals, vehicle_size), np.dtype(np.float32))
+        ]
 
-        return detransformed_outputs
+    def compute_target_indexes(self, track_length: int) -> np.ndarray:
+        """The bidirectional targets are sampled without lag since the whole
+        track is given for every seg. line"""
+        return target_indexes(track_length, sampling=self.sampling, patch_size=self.patch_size)
 
 
 def _bidirectional_transform(normalised: NormalisedData, transform: TransformMethod, track_index: int):
     """The bidirectional transform, called by `perform_parallel_transforms` to
      parellalize the transformation"""
-    track_length = len(normalised.widths[track_index])
+    track = combine(*[normalised[_inp][track_index] for _inp in transform.inputs]).astype(np.float32)
+    track_length = len(track)
 
-    x = np.zeros((
-        track_length,
-        math.ceil(track_length / transform.patch_size),
-        2 * len(transform.inputs) * transform.patch_size
-    ), dtype=np.float32)
-    x.fill(-1)
+    # Each row is the track rolled so that it starts after the current normal,
+    # so the rows can be taken as sliding windows over the track repeated twice
+    history = sliding_window_view(np.concatenate((track, track)), track_length, axis=0)
+    history = history[1:track_length + 1]
 
-    track = combine(*[normalised[_inp][track_index] for _inp in transform.inputs])
+    # The reversed history, rolled in the other direction as the normal index increases
     reversed_track = track[::-1]
+    reversed_history = sliding_window_view(np.concatenate((reversed_track, reversed_track)), track_length, axis=0)
+    reversed_history = reversed_history[(track_length - np.arange(track_length)) % track_length]
 
-    for normal_index in range(track_length):
-        # Roll the track based on the normal index
-        history = [np.roll(track, axis=0, shift=-normal_index - 1)]
-        reversed_history = [np.roll(reversed_track, axis=0, shift=normal_index)]
-
-        # Combine the history together
-        window = np.concatenate(history + reversed_history, axis=1)
-        window = patchify(window, patch_size=transform.patch_size)
-
-        x[normal_index, -len(window):] = window
+    # Combine the history together, the sliding windows have the seg. lines in the last axis
+    windows = np.concatenate((history, reversed_history), axis=1).transpose((0, 2, 1))
 
-    return x
+    return patchify_batch(windows, patch_size=transform.patch_size)
@@ -0,0 +1,91 @@
+from dataclasses import dataclass
+from typing import List, Iterator, Tuple, Any
+
+import numpy as np
+
+
+"""Length bucketing for the sequence transforms.
+
+The lag and bidirectional transforms pad every sequence in a partition to the
+length of the longest track, so a single long circuit inflates every row of
+every short track. Bucketing groups the tracks by length and transforms each
+group separately so each bucket is only padded to its own longest track."""
+
+
+@dataclass
+class Bucket:
+
+    track_indexes: List[int]
+
+    x: Any
+    outputs: List[np.ndarray]
+    vehicles: np.ndarray
+
+    def __len__(self):
+        return len(self.vehicles)
+
+
+def bucket_track_indexes(track_lengths: List[int], n_buckets: int) -> List[List[int]]:
+    """Group tracks by length into buckets. Tracks are sorted by length and
+    split into length quantiles so each bucket holds the same number of tracks
+    (give or take one).
+
+    Args:
+        track_lengths: The number of seg. lines in each track.
+        n_buckets: The maximum number of buckets to split the tracks into.
+
+    Returns:
+        A list of track indexes for each non-empty bucket, ordered from the
+        shortest to the longest tracks. Indexes within each bucket keep the
+        original track order.
+    """
+    if n_buckets < 1:
+        raise ValueError(f"Number of buckets must be at least 1, got: {n_buckets}")
+
+    if len(track_lengths) == 0:
+        return []
+
+    lengths = np.array(track_lengths)
+    order = np.argsort(lengths, kind="stable")
+
+    # Assign each track to a bucket based on its rank in length
+    bucket_ids = np.arange(len(lengths)) * n_buckets // len(lengths)
+
+    return [
+        sorted(order[bucket_ids == bucket_id].tolist())
+        for bucket_id in range(n_buckets)
+        if np.any(bucket_ids == bucket_id)
+    ]
+
+
+def bucket_batches(
+        buckets: List[Bucket],
+        batch_size: int,
+        shuffle: bool = True
+) -> Iterator[Tuple[Bucket, np.ndarray]]:
+    """Iterate through batches of rows where each batch is drawn from a single
+    bucket, so each batch is only as long as its bucket's padding.
+
+    Args:
+        buckets: The transformed buckets.
+        batch_size: The maximum number of rows in a batch.
+        shuffle: If true, the rows within each bucket and the order of the
+            batches across buckets are shuffled.
+
+    Returns:
+        An iterator of the bucket and the row indexes into that bucket.
+    """
+    batches = []
+    for bucket in buckets:
+        indexes = np.arange(len(bucket))
+        if shuffle:
+            np.random.shuffle(indexes)
+
+        for start in range(0, len(indexes), batch_size):
+            batches.append((bucket, indexes[start:start + batch_size]))
+
+    if shuffle:
+        np.random.shuffle(batches)
+
+    for bucket, batch in batches:
+        yield bucket, batch
@@ -1,11 +1,14 @@
-import math
 from abc import ABC
-from multiprocessing import Pool
-from typing import List, Callable, Tuple, Any
+from multiprocessing import resource_tracker
+from typing import List, Callable, Tuple, Optional, Sequence
 
 import numpy as np
 
 from lapsim.normalisation.normalised_data import NormalisedData
+from lapsim.normalisation.transforms.bucketing import Bucket, bucket_track_indexes
+from lapsim.normalisation.transforms.executor import Cores, Executor, SerialExecutor, ProcessExecutor
+from lapsim.normalisation.transforms.sampling import desample, get_target_output
+from lapsim.normalisation.transforms.shared import SharedArrays
 
 
 def patchify(x, patch_size: int):
@@ -31,68 +34,387 @@ def patchify(x, patch_size: int):
     if patch_size == 1:
         return x
 
-    track_length = x.shape[0]
-    start_padding = (patch_size - (track_length % patch_size)) % patch_size
+    return patchify_batch(x[np.newaxis], patch_size)[0]
 
-    patched_x = np.zeros((math.ceil(track_length / patch_size), x.shape[1] * patch_size))
 
-    for c, start in enumerate(range(-start_padding, track_length, patch_size)):
-        end_index = start + patch_size
+def patchify_batch(x, patch_size: int):
+    """Patch up a batch of equally sized matrices (e.g. many rolled copies of
+    a track), see `patchify`. Each matrix is padded at the start with -1's so
+    the length is a multiple of the patch size, then reshaped so each row
+    contains `patch_size` seg. lines.
 
-        patch = x[max(0, start):end_index].flatten()
+    Args:
+        x: The input batch of shape (batch, seg. lines, features).
+        patch_size: The number of seg. lines to combine into one vector.
+
+    Returns:
+        The patched input of shape (batch, patches, features * patch_size).
+    """
+    if patch_size == 1:
+        return x
 
-        if c == 0:
-            subset = np.zeros(x.shape[1] * patch_size)
-            subset.fill(-1)
-            subset[-patch.size:] = patch
-            patch = subset
+    batch_size, track_length, features = x.shape
+    start_padding = (patch_size - (track_length % patch_size)) % patch_size
 
-        patched_x[c] = patch
+    patched_x = np.empty((batch_size, track_length + start_padding, features), dtype=x.dtype)
+    patched_x[:, :start_padding] = -1
+    patched_x[:, start_padding:] = x
 
-    return patched_x
+    return patched_x.reshape((batch_size, -1, features * patch_size))
 
 
 def combine(*items):
     """Combine a list of vectors into a vector by stacking them."""
-    track = np.zeros((len(items[0]), len(items)))
-    for i, item in enumerate(items):
-        track[:, i] = item
-
-    return track
+    return np.column_stack(items).astype(np.float64, copy=False)
 
 
 class TransformMethod(ABC):
-    def __init__(self):
-        self.inputs: List[str] = []
-        self.outputs: List[str] = []
-        self.sampling: int = 0
+    """A compiled transform plan for one transform configuration. Plans are
+    immutable once created so a single plan can be shared between every
+    transform with the same configuration, including across threads (see
+    `transformer.compile_transform`). The target indexes of each track length
+    come from the bounded caches in `sampling`, so they're reused for the
+    targets of every partition and for detransforming the outputs."""
 
-        self.foresight: int = 0
-        self.patch_size: int = 1
-        self.lag: int = 0
-        self.time_to_vec: bool = False
+    # Whether the outputs are separate arrays per track, so their bytes are
+    # the sum of each track's bytes. Otherwise every output has a row per seg.
+    # line, padded to the longest track at most.
+    per_track_outputs = False
 
-    def transform(self, normalised: NormalisedData, cores: int):
+    # The parameters the method takes, subclasses with parameters of their own
+    # extend these. Only these parameters are part of the plan key.
+    parameters: Tuple[str, ...] = (
+        "inputs", "outputs", "sampling", "foresight", "patch_size", "lag", "time_to_vec"
+    )
+
+    def __init__(
+            self,
+            inputs: Sequence[str] = (),
+            outputs: Sequence[str] = (),
+            sampling: Optional[int] = 0,
+            foresight: Optional[int] = 0,
+            patch_size: int = 1,
+            lag: Optional[int] = 0,
+            time_to_vec: bool = False
+    ):
+        self.inputs: Tuple[str, ...] = tuple(inputs)
+        self.outputs: Tuple[str, ...] = tuple(outputs)
+        self.sampling = sampling
+
+        self.foresight = foresight
+        self.patch_size = patch_size
+        self.lag = lag
+        self.time_to_vec = time_to_vec
+
+        self._frozen = True
+
+    def __setattr__(self, key, value):
+        if getattr(self, "_frozen", False):
+            raise AttributeError(f"Transform plans are immutable, cannot set '{key}'")
+
+        super().__setattr__(key, value)
+
+    def transform(self, normalised: NormalisedData, cores: Cores):
         raise NotImplementedError
 
-    def detransform(self, track_length: int, outputs: List[np.ndarray]) -> List[np.ndarray]:
+    def retransform(
+            self,
+            normalised: NormalisedData,
+            track_index: int,
+            x: np.ndarray,
+            start: int,
+            end: int
+    ) -> np.ndarray:
+        """Update the transform inputs of a track after some of its seg. lines
+        have been edited, see `BaseWindowTransform.retransform`"""
+        raise NotImplementedError("Incremental transforms are only supported by the window transforms")
+
+    def output_shapes(self, track_lengths: List[int], vehicle_size: int) -> List[Tuple[Tuple[int, ...], np.dtype]]:
+        """Get the shapes and types of every array output by the transform of
+        the tracks, without running the transform.
+
+        Args:
+            track_lengths: The number of seg. lines in each track.
+            vehicle_size: The length of each vectorised vehicle.
+
+        Returns:
+            A list of the shape and type of each output array
+        """
+        raise NotImplementedError
+
+    def estimate_output_bytes(self, track_lengths: List[int], vehicle_size: int) -> int:
+        """Get the number of bytes output by the transform of the tracks, see
+        `output_shapes`"""
+        return sum(int(np.prod(shape)) * np.dtype(dtype).itemsize for shape, dtype in self.output_shapes(
+            track_lengths, vehicle_size))
+
+    def target_shapes(self, track_lengths: List[int]) -> List[Tuple[Tuple[int, ...], np.dtype]]:
+        """The shapes of the stacked targets of every output, see `target_output`"""
+        target_size = self.target_indexes(1).shape[1]
+        return [((sum(track_lengths), target_size), np.dtype(np.float64))] * len(self.outputs)
+
+    def compute_target_indexes(self, track_length: int) -> np.ndarray:
+        """Compute the indexes of the seg. lines each value in a row of the
+        sampled target corresponds to, see `sampling.target_indexes`. The
+        indexes should come from one of the cached functions in `sampling`."""
         raise NotImplementedError
 
+    def target_indexes(self, track_length: int) -> np.ndarray:
+        """Get the (cached, read only) target indexes of a track, see
+        `compute_target_indexes`"""
+        return self.compute_target_indexes(track_length)
+
+    def partition_target_indexes(self, track_lengths: List[int]) -> np.ndarray:
+        """Get the target indexes of many tracks, offset so they index into the
+        concatenation of all the tracks"""
+        if len(track_lengths) == 0:
+            return np.zeros((0, self.patch_size * ((self.sampling or 0) * 2 + 1)), dtype=int)
+
+        track_starts = np.cumsum([0] + list(track_lengths[:-1]))
+
+        return np.concatenate([
+            self.target_indexes(track_length) + track_start
+            for track_length, track_start in zip(track_lengths, track_starts)
+        ])
+
+    def target_output(self, normalised: NormalisedData) -> List[np.ndarray]:
+        """Get the sampled targets of every output for all the tracks, see
+        `sampling.get_target_output`"""
+        track_lengths = [normalised.track_length(t_idx) for t_idx in range(len(normalised))]
+        return get_target_output(normalised, self.outputs, self.partition_target_indexes(track_lengths))
+
+    def detransform(self, track_length: int, outputs: List[np.ndarray]) -> List[np.ndarray]:
+        """This function detransforms the output sampling, combining it back to the
+        original vector. This is useful for the combining the sampled output of the
+        network.
+
+        Args:
+            track_length: Number of normals in the track
+            outputs: The list of output data from the network. e.g. [y_pos, y_vel]
+
+        Returns:
+            The combined output, desampled output
+        """
+        indexes = self.target_indexes(track_length)
+        return [desample(indexes, output, track_length) for output in outputs]
+
+    def detransform_batch(self, track_lengths: List[int], outputs: List[np.ndarray]) -> List[List[np.ndarray]]:
+        """Detransform the outputs for many tracks at once. The outputs for each
+        track are stacked in the same order as the transform outputs them.
+
+        Args:
+            track_lengths: Number of normals in each track
+            outputs: The list of stacked output data from the network for all
+                the tracks. e.g. [y_pos, y_vel]
+
+        Returns:
+            A list of the desampled vectors of each track for each output
+        """
+        track_starts = np.cumsum([0] + list(track_lengths))
+        indexes = self.partition_target_indexes(track_lengths)
+
+        return [
+            np.split(desample(indexes, output, track_starts[-1]), track_starts[1:-1])
+            for output in outputs
+        ]
+
+    def transform_bucketed(self, normalised: NormalisedData, cores: Cores, n_buckets: int) -> List[Bucket]:
+        """Transform the tracks in length buckets. Each bucket is transformed
+        on its own, so methods which pad to the longest track (lag and
+        bidirectional) only pad to the longest track within each bucket.
+
+        Args:
+            normalised: The normalised track encoding.
+            cores: Number of cores to spread the compute over
+            n_buckets: The maximum number of buckets to split the tracks into.
+
+        Returns:
+            A list of the transformed buckets, from the shortest to longest
+            tracks.
+        """
+        track_lengths = [normalised.track_length(t_idx) for t_idx in range(len(normalised))]
+
+        buckets = []
+        for track_indexes in bucket_track_indexes(track_lengths, n_buckets):
+            x, outputs, vehicles = self.transform(normalised.subset(track_indexes), cores)
+            buckets.append(Bucket(track_indexes=track_indexes, x=x, outputs=outputs, vehicles=vehicles))
+
+        return buckets
+
     def perform_parallel_transforms(
             self,
-            function: Callable[[NormalisedData, 'TransformMethod', int], Any],
+            function: Callable[[NormalisedData, 'TransformMethod', int], np.ndarray],
             normalised: NormalisedData,
-            cores: int
-    ):
-        # Create inputs
-        map_inputs = [(function, normalised, self, track_index) for track_index in range(len(normalised))]
-        if cores == 1 or len(normalised) <= 1:
-            for track_index in range(len(normalised.vehicles)):
-                return list(map(parallel_wrapper, map_inputs))
+            cores: Cores,
+            shape: Tuple[int, ...],
+            dtype: np.dtype = np.float32,
+            fill: float = 0,
+            offsets: Optional[List[int]] = None
+    ) -> np.ndarray:
+        """Transform each track with the given function and write the encodings
+        into a preallocated output. Each track's encoding is written into the
+        rows starting at the track's offset, aligned to the end of the second
+        axis, so shorter encodings keep the padding the output was filled with.
+
+        When spread over worker processes, the inputs and the output are
+        allocated in shared memory so workers are only sent the track indexes
+        to transform and write their encodings in place, rather than the
+        normalised data being pickled for every track. The shared output is
+        handed over to the caller as it is, see `SharedArrays.take`. Otherwise
+        the output is an ordinary array, which thread workers write into
+        directly.
+
+        Args:
+            function: The per track transform, called with the normalised data,
+                this transform method and the track index.
+            normalised: The normalised track encoding.
+            cores: Number of cores to spread the compute over, or the executor
+                to run on. A pool created for a number of cores is shut down
+                once the transform is complete.
+            shape: The shape of the output.
+            dtype: The type of the output.
+            fill: The value the output is filled with before the encodings are
+                written.
+            offsets: The first row of the output for each track, defaults to
+                the index of the track's first normal.
+
+        Returns:
+            The output
+        """
+        if offsets is None:
+            offsets = np.cumsum([0] + [normalised.track_length(t_idx) for t_idx in range(len(normalised) - 1)])
+
+        if isinstance(cores, Executor):
+            executor = cores.select(len(normalised), normalised.normals_count())
         else:
-            with Pool(cores) as p:
-                return p.map(parallel_wrapper, map_inputs)
+            executor = SerialExecutor() if cores == 1 else ProcessExecutor(cores)
+
+        try:
+            if executor.workers > 1 and len(normalised) > 1 and not executor.shares_memory:
+                return self._perform_shared_transforms(function, normalised, executor, shape, dtype, fill, offsets)
+
+            out = np.full(shape, fill, dtype=dtype)
+
+            if executor.workers == 1 or len(normalised) <= 1:
+                for track_index in range(len(normalised)):
+                    _write_encoding(out, offsets[track_index], function(normalised, self, track_index))
+
+            else:
+                def transform_track(track_index: int):
+                    _write_encoding(out, offsets[track_index], function(normalised, self, track_index))
+
+                executor.map(transform_track, range(len(normalised)))
+
+            return out
+
+        finally:
+            if not isinstance(cores, Executor):
+                executor.shutdown()
+
+    def _perform_shared_transforms(
+            self,
+            function: Callable[[NormalisedData, 'TransformMethod', int], np.ndarray],
+            normalised: NormalisedData,
+            executor: Executor,
+            shape: Tuple[int, ...],
+            dtype: np.dtype,
+            fill: float,
+            offsets: List[int]
+    ) -> np.ndarray:
+        """Transform the tracks on worker processes, sharing the inputs and the
+        output through shared memory. The output has a block of its own, so
+        the inputs are freed once the transform is complete."""
+        # Forked workers inherit the mappings of their parent, so the pool is
+        # started before the blocks are created to keep them out of it. The
+        # resource tracker is started first so the workers share it, see
+        # `SharedArrays.attach`
+        resource_tracker.ensure_running()
+        executor.start()
+
+        # Flatten the inputs required by the transform into the shared memory
+        keys = sorted(set(self.inputs) | {"widths"})
+        track_lengths = [normalised.track_length(t_idx) for t_idx in range(len(normalised))]
+
+        inputs = SharedArrays.create({
+            **{
+                key: np.concatenate([np.asarray(track, dtype=np.float64) for track in normalised[key]])
+                for key in keys
+            },
+            _TRACK_STARTS: np.cumsum([0] + track_lengths),
+            _OFFSETS: np.array(offsets, dtype=np.int64),
+        })
+
+        try:
+            output = SharedArrays.allocate({_OUTPUT: (shape, dtype)})
+        except BaseException:
+            inputs.unlink()
+            raise
+
+        try:
+            output[_OUTPUT].fill(fill)
+
+            chunks = [
+                chunk.tolist()
+                for chunk in np.array_split(np.arange(len(normalised)), min(len(normalised), executor.workers * 4))
+            ]
+
+            executor.map(_shared_transform_worker, [
+                (inputs.descriptor(), output.descriptor(), keys, function, self, chunk) for chunk in chunks
+            ])
+
+        except BaseException:
+            output.unlink()
+            raise
+
+        finally:
+            inputs.unlink()
+
+        return output.take(_OUTPUT)
+
+
+_TRACK_STARTS = "__track_starts"
+_OFFSETS = "__offsets"
+_OUTPUT = "__output"
+
+
+def _write_encoding(out: np.ndarray, offset: int, encoding: np.ndarray):
+    """Write the encoding of a track into the output, aligned to the end of
+    the second axis"""
+    out[offset:offset + len(encoding), -encoding.shape[1]:] = encoding
+
+
+def _shared_transform_worker(item: Tuple[Tuple, Tuple, List[str], Callable, TransformMethod, List[int]]):
+    """Transform a chunk of tracks reading from and writing to shared memory.
+    The blocks are attached for the chunk only, so a persistent worker holds
+    no mapping once the transform is complete."""
+    inputs_descriptor, output_descriptor, keys, function, transform, track_indexes = item
+
+    inputs = SharedArrays.attach(inputs_descriptor)
+    try:
+        output = SharedArrays.attach(output_descriptor)
+        try:
+            _transform_shared_chunk(inputs, output, keys, function, transform, track_indexes)
+        finally:
+            output.close()
+    finally:
+        inputs.close()
+
 
+def _transform_shared_chunk(
+        inputs: SharedArrays,
+        output: SharedArrays,
+        keys: List[str],
+        function: Callable,
+        transform: TransformMethod,
+        track_indexes: List[int]
+):
+    """Transform a chunk of tracks of attached blocks. The views of the blocks
+    only live in this frame, so the blocks can be closed once it returns."""
+    track_starts = inputs[_TRACK_STARTS]
+    normalised = NormalisedData({
+        key: [inputs[key][track_starts[t]:track_starts[t + 1]] for t in range(len(track_starts) - 1)]
+        for key in keys
+    })
 
-def parallel_wrapper(item: Tuple[Callable, NormalisedData, TransformMethod, int]):
-    return item[0](item[1], item[2], item[3])
+    for track_index in track_indexes:
+        _write_encoding(output[_OUTPUT], inputs[_OFFSETS][track_index], function(normalised, transform, track_index))
@@ -0,0 +1,189 @@
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+from typing import Callable, Iterable, List, Any, Optional, Union
+
+
+"""Executors for the parallel transforms.
+
+Creating a process pool for every transform pays the process spawn and import
+costs once per partition, per epoch. The executors here own their workers so
+they persist between transforms until they are shut down. The auto executor
+picks a backend based on the size of the partition, so small partitions are
+transformed serially rather than being slowed down by the pool overhead."""
+
+
+class Executor(ABC):
+    """Maps a function over items, with the results returned in order"""
+
+    # True if the workers share memory with the caller (and can therefore
+    # write directly into the caller's arrays)
+    shares_memory: bool = True
+
+    def __init__(self, workers: int = 1):
+        if workers < 1:
+            raise ValueError(f"Number of workers must be at least 1, got: {workers}")
+
+        self.workers = workers
+
+    @abstractmethod
+    def map(self, function: Callable[[Any], Any], items: Iterable[Any]) -> List[Any]:
+        raise NotImplementedError()
+
+    def start(self):
+        """Start the workers, if they aren't running already"""
+        pass
+
+    def select(self, n_tracks: int, n_normals: int) -> 'Executor':
+        """Select the executor to transform a partition of the given size"""
+        return self
+
+    def shutdown(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+
+class SerialExecutor(Executor):
+    """Runs everything in the calling thread"""
+
+    def __init__(self):
+        super().__init__(workers=1)
+
+    def map(self, function: Callable[[Any], Any], items: Iterable[Any]) -> List[Any]:
+        return [function(item) for item in items]
+
+
+class ThreadExecutor(Executor):
+    """Runs on a persistent pool of threads, only faster than the serial
+    executor when the transform kernels release the GIL"""
+
+    def __init__(self, workers: int):
+        super().__init__(workers)
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def start(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers)
+
+    def map(self, function: Callable[[Any], Any], items: Iterable[Any]) -> List[Any]:
+        self.start()
+        return list(self._pool.map(function, items))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+class ProcessExecutor(Executor):
+    """Runs on a persistent pool of processes. Functions and items must be
+    picklable and results are copied back, so the transforms share their
+    arrays through shared memory instead"""
+
+    shares_memory = False
+
+    def __init__(self, workers: int):
+        super().__init__(workers)
+        self._pool = None
+
+    def start(self):
+        if self._pool is None:
+            self._pool = Pool(self.workers)
+
+    def map(self, function: Callable[[Any], Any], items: Iterable[Any]) -> List[Any]:
+        self.start()
+        return self._pool.map(function, items)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+class AutoExecutor(Executor):
+    """Picks the backend and number of workers from the partition size.
+    Partitions smaller than `min_parallel_normals` (or with a single track) are
+    transformed serially, otherwise a worker is used for every
+    `normals_per_worker` normals up to the maximum number of workers. The
+    pools are created on first use and persist between transforms."""
+
+    def __init__(
+            self,
+            workers: Optional[int] = None,
+            backend: str = "process",
+            min_parallel_normals: int = 20000,
+            normals_per_worker: int = 10000
+    ):
+        super().__init__(workers or os.cpu_count() or 1)
+
+        if backend not in {"thread", "process"}:
+            raise ValueError(f"Unknown executor backend: {backend}")
+
+        self.backend = backend
+        self.min_parallel_normals = min_parallel_normals
+        self.normals_per_worker = normals_per_worker
+
+        self._serial = SerialExecutor()
+        self._pool: Optional[Executor] = None
+
+    def select(self, n_tracks: int, n_normals: int) -> Executor:
+        if self.workers == 1 or n_tracks <= 1 or n_normals < self.min_parallel_normals:
+            return self._serial
+
+        return self._get_pool(min(self.workers, n_tracks, max(2, n_normals // self.normals_per_worker)))
+
+    def map(self, function: Callable[[Any], Any], items: Iterable[Any]) -> List[Any]:
+        items = list(items)
+        executor = self._serial if len(items) <= 1 else self._get_pool(min(self.workers, len(items)))
+
+        return executor.map(function, items)
+
+    def _get_pool(self, workers: int) -> Executor:
+        """Get a pool with at least the given number of workers. The pool is
+        only recreated when a larger partition needs more workers"""
+        if self._pool is None or self._pool.workers < workers:
+            if self._pool is not None:
+                self._pool.shutdown()
+
+            self._pool = ThreadExecutor(workers) if self.backend == "thread" else ProcessExecutor(workers)
+
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def create_executor(mode: str = "auto", workers: Optional[int] = None) -> Executor:
+    """Create an executor
+
+    Args:
+        mode: One of "serial", "thread", "process" or "auto".
+        workers: The number of workers, defaults to the number of CPUs. For
+            the auto executor this is the maximum number of workers.
+
+    Returns:
+        The executor, which should be shut down once no longer needed.
+    """
+    if mode == "serial":
+        return SerialExecutor()
+    elif mode == "thread":
+        return ThreadExecutor(workers or os.cpu_count() or 1)
+    elif mode == "process":
+        return ProcessExecutor(workers or os.cpu_count() or 1)
+    elif mode == "auto":
+        return AutoExecutor(workers)
+
+    raise ValueError(f"Unknown executor mode: {mode}")
+
+
+# Either a number of cores to use, or an executor to run on
+Cores = Union[int, Executor]
@@ -1,11 +1,13 @@
 import math
-from typing import List
+from typing import List, Tuple
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 from lapsim.normalisation.normalised_data import NormalisedData
-from lapsim.normalisation.transforms.common import patchify, combine, TransformMethod
-from lapsim.normalisation.transforms.sampling import get_target_output
+from lapsim.normalisation.transforms.executor import Cores
+from lapsim.normalisation.transforms.common import combine, TransformMethod
+from lapsim.normalisation.transforms.sampling import target_indexes
 
 
 """This method encodes the data allowing for a stateless LSTM to train and 
@@ -22,7 +24,7 @@ def apply_sampling(x, sampling=0):
 
 class LaggingTransformMethod(TransformMethod):
 
-    def transform(self, normalised: NormalisedData, cores: int):
+    def transform(self, normalised: NormalisedData, cores: Cores):
         """Lagging history transform creates a series track sequences where the
         last item in the sequence is the current point we're predicting the output
         of (assuming lag is 0). This method is designed to work in stateless RNN/
@@ -45,21 +47,17 @@ class LaggingTransformMethod(TransformMethod):
         max_track_length = normalised.longest_track_length()
 
         vector_length = math.ceil(max_track_length / self.patch_size) * 2
-        x = np.zeros(
-            (items_count, vector_length, len(self.inputs) * self.patch_size + int(self.time_to_vec)),
-            dtype=np.float32)
-        x.fill(-1)
         vehicles = np.zeros((items_count, len(normalised.vehicles[0])), dtype=np.float32)
 
-        # Encode tracks
-        track_encodings = self.perform_parallel_transforms(_lag_transform, normalised, cores)
+        # Encode tracks, padded with -1s
+        x = self.perform_parallel_transforms(
+            _lag_transform, normalised, cores,
+            shape=(items_count, vector_length, len(self.inputs) * self.patch_size + int(self.time_to_vec)),
+            dtype=np.float32, fill=-1)
 
         global_index = 0
-        for i in range(len(normalised.vehicles)):
-            track_length = len(normalised.widths[i])
-            track_encoding = track_encodings[i]
-
-            x[global_index:global_index + len(track_encoding), -track_encoding.shape[1]:] = track_encoding
+        for i in range(len(normalised)):
+            track_length = normalised.track_length(i)
             vehicles[global_index:global_index + track_length] = normalised.vehicles[i]
 
             global_index += track_length
@@ -67,64 +65,63 @@ class LaggingTransformMethod(TransformMethod):
         # Apply sampling patchification
         return (
             x,
-            get_target_output(
-                normalised,
-                outputs=self.outputs,
-                lag=self.lag,
-                sampling=self.sampling,
-                patch_size=self.patch_size
-            ),
+            self.target_output(normalised),
             vehicles
         )
 
-    def detransform(self, track_length: int, outputs: List[np.ndarray]) -> List[np.ndarray]:
-        detransformed_outputs = []
-        for output in outputs:
-            detransformed = [[] for _ in range(output.shape[0])]
-            for index in range(len(output)):
-                frame_output = output[index]
-                for i in range(len(frame_output)):
-                    original_index = (index + (i - self.patch_size * (self.sampling + 1) + 1)) % track_length
-                    detransformed[original_index].append(frame_output[i])
-
-            detransformed = np.array(np.mean(detransformed, axis=1))
-            detransformed = np.roll(detransformed, -self.lag)
-            detransformed_outputs.append(detransformed)
+    def output_shapes(self, track_lengths: List[int], vehicle_size: int) -> List[Tuple[Tuple[int, ...], np.dtype]]:
+        n_normals = sum(track_lengths)
+        vector_length = math.ceil(max(track_lengths, default=0) / self.patch_size) * 2
+        return [
+            (
+                (n_normals, vector_length, len(self.inputs) * self.patch_size + int(self.time_to_vec)),
+                np.dtype(np.float32)
+            ),
+            *self.target_shapes(track_lengths),
+            ((n_normals, vehicle_size), np.dtype(np.float32))
+        ]
 
-        return detransformed_outputs
+    def compute_target_indexes(self, track_length: int) -> np.ndarray:
+        return target_indexes(track_length, sampling=self.sampling, lag=self.lag, patch_size=self.patch_size)
 
 
 def _lag_transform(normalised: NormalisedData, transform: TransformMethod, t_idx: int):
     """The lagging transform, called by `perform_parallel_transforms` to
      parellalize the transformation"""
-    track_length = len(normalised.widths[t_idx])
-    vector_length = math.ceil(track_length / transform.patch_size) * 2
+    # Combine th defined inputs (e.g. position, angles, offsets)
+    track = combine(*[normalised[_inp][t_idx] for _inp in transform.inputs]).astype(np.float32)
 
-    x = np.zeros((
-        track_length,
-        vector_length,
-        len(transform.inputs) * transform.patch_size + int(transform.time_to_vec)
-    ), dtype=np.float32)
-    x.fill(-1)
+    track_length, features = track.shape
+    patch_size = transform.patch_size
+    vector_length = math.ceil(track_length / patch_size) * 2
+    patched_track_size = math.ceil(track_length / patch_size)
 
-    patched_track_size = math.ceil(track_length / transform.patch_size)
+    # Each row holds the track followed by the track up to and including the
+    # current normal, aligned to the end of the row and padded with -1s. So
+    # each row is a sliding window over the track repeated twice, after padding
+    padding = np.full((vector_length * patch_size, features), -1, dtype=np.float32)
+    windows = sliding_window_view(np.concatenate((padding, track, track)), vector_length * patch_size, axis=0)
+    windows = windows[track_length + 1:2 * track_length + 1].transpose((0, 2, 1))
 
-    track_to_vec = np.arange(patched_track_size) / (max(1, patched_track_size - 1))
+    x = windows.reshape((track_length, vector_length, features * patch_size))
 
-    # Combine th defined inputs (e.g. position, angles, offsets)
-    track = combine(*[normalised[_inp][t_idx] for _inp in transform.inputs])
+    if transform.time_to_vec:
+        track_to_vec = np.arange(patched_track_size) / (max(1, patched_track_size - 1))
+
+        normal_indexes = np.arange(track_length)[:, np.newaxis]
+        subtrack_patches = (track_length + normal_indexes + patch_size) // patch_size
+        expected_patches = normal_indexes // patch_size + 1
 
-    for normal_index in range(track_length):
-        subtrack = np.concatenate((track, track[:normal_index + 1]))
-        subtrack = patchify(subtrack, patch_size=transform.patch_size)
+        # Index of each patch within the subtrack, negative indexes are padding
+        subtrack_index = np.arange(vector_length)[np.newaxis] - (vector_length - subtrack_patches)
+        second_loop_index = subtrack_index - (subtrack_patches - expected_patches)
 
-        if transform.time_to_vec:
-            time_vec = np.zeros((len(subtrack), 1))
-            time_vec[:len(track_to_vec), -1] = track_to_vec
-            exp_patch = (normal_index // transform.patch_size) + 1
-            time_vec[-exp_patch:, -1] = track_to_vec[:exp_patch]
-            subtrack = np.hstack((subtrack, time_vec))
+        time_vec = np.zeros((track_length, vector_length), dtype=np.float32)
+        first_loop = subtrack_index < patched_track_size
+        time_vec[first_loop] = track_to_vec[np.clip(subtrack_index, 0, None)[first_loop]]
+        time_vec[second_loop_index >= 0] = track_to_vec[second_loop_index[second_loop_index >= 0]]
+        time_vec[subtrack_index < 0] = -1
 
-        x[normal_index, -len(subtrack):] = subtrack
+        x = np.concatenate((x, time_vec[:, :, np.newaxis]), axis=2)
 
     return x
@@ -1,11 +1,12 @@
 import math
-from typing import List
+from typing import Tuple, List
 
 import numpy as np
 
 from lapsim.normalisation.normalised_data import NormalisedData
+from lapsim.normalisation.transforms.executor import Cores
 from lapsim.normalisation.transforms.common import patchify, combine, TransformMethod
-from lapsim.normalisation.transforms.sampling import loop_track_for_patching_sampling
+from lapsim.normalisation.transforms.sampling import stateful_target_indexes
 
 
 """This class transforms the data allowing for a stateful LSTM to predict from.
@@ -22,7 +23,9 @@ def apply_sampling(x, sampling=0):
 
 class StatefulLaggingTransformMethod(TransformMethod):
 
-    def transform(self, normalised: NormalisedData, cores: int):
+    per_track_outputs = True
+
+    def transform(self, normalised: NormalisedData, cores: Cores):
         """Stateful lagging history works akin to the normal lagging history in
         concept, however, instead of using a series of windows, this method just
         creates a single vector for the whole track which you would feed into the
@@ -50,58 +53,107 @@ class StatefulLaggingTransformMethod(TransformMethod):
 
         for track_idx in range(len(normalised)):
             track_length = normalised.track_length(track_idx)
-            patched_track_size = math.ceil(track_length / self.patch_size)
-            track_to_vec = np.arange(patched_track_size) / (max(1, patched_track_size - 1))
+            target_indexes = self.target_indexes(track_length)
+
+            inputs.append(_stateful_track(normalised, self, track_idx))
+            vehicles.append(np.array(normalised["vehicles"][track_idx]))
+            outputs.append([
+                np.asarray(normalised[output][track_idx], dtype=np.float64)[target_indexes]
+                for output in self.outputs
+            ])
 
-            track = combine(*[normalised[_inp][track_idx] for _inp in self.inputs])
-            track = np.concatenate((track, track))
-            track = patchify(track, self.patch_size)
+        return inputs, outputs, vehicles
 
-            # Apply time to vec
-            if self.time_to_vec:
-                track = np.hstack((track, np.zeros((track.shape[0], 1))))
-                track[:len(track_to_vec), -1] = track_to_vec
-                track[-len(track_to_vec):, -1] = track_to_vec
+    def transform_packed(
+            self,
+            normalised: NormalisedData,
+            cores: Cores
+    ) -> Tuple[np.ndarray, List[np.ndarray], np.ndarray, np.ndarray]:
+        """Transform the tracks into single padded arrays so many tracks can be
+        batched through a stateful network at once, see `transform` for the
+        encoding of each track.
+
+        Each track's input sequence is padded at the start with -1s to the
+        longest sequence, so every track ends on the last row. The targets use
+        the same layout: each track's targets are aligned to the end of its
+        input sequence (the second time through the track) with the preceding
+        rows filled with -1s.
 
-            inputs.append(track)
-            vehicles.append(np.array(normalised["vehicles"][track_idx]))
+        Args:
+            normalised: The normalised track encoding.
+            cores: Number of cores to spread the transform across
+
+        Returns:
+            A tuple of the inputs of shape (tracks, max length, features), the
+            list of targets of shape (tracks, max length, targets) for each
+            output, the vehicles of shape (tracks, vehicle size), and the
+            length of each track's input sequence.
+        """
+        n_tracks = len(normalised)
+        track_lengths = np.array([normalised.track_length(t_idx) for t_idx in range(n_tracks)], dtype=int)
 
-            # Loop and roll the tracks to accomodate patch_sizing/sampling larger than the track
-            rolled_outputs = [np.roll(normalised[output][track_idx], self.lag) for output in self.outputs]
-            patched_outputs = [
-                loop_track_for_patching_sampling(output, sampling=self.sampling, patch_size=self.patch_size)
-                for output in rolled_outputs]
+        lengths = -(-track_lengths * 2 // self.patch_size)
+        target_lengths = -(-track_lengths // self.patch_size)
+        max_length = int(np.max(lengths)) if n_tracks > 0 else 0
 
-            final_outputs = [
-                np.zeros((patched_track_size, self.patch_size * (self.sampling * 2 + 1)))
-                for _ in self.outputs
-            ]
-            for i, norm in enumerate(range(0, track_length, self.patch_size)):
-                N, P, L = track_length, self.patch_size, (patched_track_size - i - 1)
-                patch_start = (N - (P * (1 + L + self.sampling))) % N
-                patch_end = patch_start + (self.patch_size * (self.sampling * 2 + 1))
+        x = self.perform_parallel_transforms(
+            _packed_stateful_transform, normalised, cores,
+            shape=(n_tracks, max_length, len(self.inputs) * self.patch_size + int(self.time_to_vec)),
+            dtype=np.float32, fill=-1, offsets=np.arange(n_tracks))
 
-                for out_idx in range(len(self.outputs)):
-                    final_outputs[out_idx][i] = patched_outputs[out_idx][patch_start:patch_end]
+        # Scatter the gathered targets of every track to the end of its row
+        track_ids = np.repeat(np.arange(n_tracks), target_lengths)
+        rows = np.arange(len(track_ids)) - np.repeat(np.cumsum(target_lengths) - max_length, target_lengths)
 
-            outputs.append(final_outputs)
+        outputs = []
+        for target in self.target_output(normalised):
+            packed_target = np.full((n_tracks, max_length, target.shape[1]), -1, dtype=np.float64)
+            packed_target[track_ids, rows] = target
+            outputs.append(packed_target)
+
+        vehicles = np.array(normalised.vehicles, dtype=np.float32).reshape((n_tracks, -1))
+
+        return x, outputs, vehicles, lengths
+
+    def output_shapes(self, track_lengths: List[int], vehicle_size: int) -> List[Tuple[Tuple[int, ...], np.dtype]]:
+        """The inputs, targets and vehicles are output for each track"""
+        target_size = self.patch_size * (self.sampling * 2 + 1)
+        features = len(self.inputs) * self.patch_size + int(self.time_to_vec)
+
+        shapes = []
+        for track_length in track_lengths:
+            shapes.append(((math.ceil(track_length * 2 / self.patch_size), features), np.dtype(np.float64)))
+            shapes.extend(
+                [((math.ceil(track_length / self.patch_size), target_size), np.dtype(np.float64))] * len(self.outputs))
+            shapes.append(((vehicle_size,), np.dtype(np.float64)))
+
+        return shapes
+
+    def compute_target_indexes(self, track_length: int) -> np.ndarray:
+        return stateful_target_indexes(
+            track_length, sampling=self.sampling, lag=self.lag, patch_size=self.patch_size)
+
+
+def _stateful_track(normalised: NormalisedData, transform: TransformMethod, track_idx: int) -> np.ndarray:
+    """Encode a track, repeated twice, as a single input sequence"""
+    track_length = normalised.track_length(track_idx)
+    patched_track_size = math.ceil(track_length / transform.patch_size)
+    track_to_vec = np.arange(patched_track_size) / (max(1, patched_track_size - 1))
+
+    track = combine(*[normalised[_inp][track_idx] for _inp in transform.inputs])
+    track = np.concatenate((track, track))
+    track = patchify(track, transform.patch_size)
+
+    # Apply time to vec
+    if transform.time_to_vec:
+        track = np.hstack((track, np.zeros((track.shape[0], 1))))
+        track[:len(track_to_vec), -1] = track_to_vec
+        track[-len(track_to_vec):, -1] = track_to_vec
+
+    return track
 
-        return inputs, outputs, vehicles
 
-    def detransform(self, track_length: int, outputs: List[np.ndarray]) -> List[np.ndarray]:
-        detransformed_outputs = []
-        for output in outputs:
-            detransformed = [[] for _ in range(track_length)]
-            for index in range(len(output)):
-                frame_output = output[index]
-                for i in range(len(frame_output)):
-                    # Calculate the original index to put the value in
-                    N, P, L = track_length, self.patch_size, (len(output) - index - 1)
-                    original_index = (N - (P * (1 + L + self.sampling)) + i) % N
-                    detransformed[original_index].append(frame_output[i])
-
-            detransformed = np.array([np.mean(x) for x in detransformed])
-            detransformed = np.roll(detransformed, -self.lag)
-            detransformed_outputs.append(detransformed)
-
-        return detransformed_outputs
+def _packed_stateful_transform(normalised: NormalisedData, transform: TransformMethod, track_idx: int) -> np.ndarray:
+    """The packed stateful transform, called by `perform_parallel_transforms`
+    to write each track into its own row of the packed inputs"""
+    return _stateful_track(normalised, transform, track_idx)[np.newaxis]
@@ -0,0 +1,95 @@
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+from lapsim.normalisation.transforms.subsampling import subsample_batches
+
+
+"""Fixed-point quantisation of the transform inputs.
+
+The normalised widths, angles and offsets (and the -1 padding) fill a small
+fixed range, so the windows can be stored as uint8 or int16 with a scale and
+offset, rather than float32/float64. The quantised inputs are dequantised a
+batch at a time, just before being passed to the network."""
+
+
+QUANTISATION_DTYPES = {"uint8": np.uint8, "int16": np.int16}
+
+
+@dataclass
+class QuantisedArray:
+    """An array stored as integers, dequantised as `values * scale + offset`"""
+
+    values: np.ndarray
+    scale: float
+    offset: float
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return self.values.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes
+
+    def dequantise(self, indexes: Optional[Union[np.ndarray, slice]] = None, dtype=np.float32) -> np.ndarray:
+        """Dequantise the array, or only the rows at the given indexes"""
+        values = self.values if indexes is None else self.values[indexes]
+        return values.astype(dtype) * dtype(self.scale) + dtype(self.offset)
+
+
+def quantise(array: np.ndarray, dtype: str = "uint8") -> QuantisedArray:
+    """Quantise an array to fixed-point using the full range of the integer
+    type between the array's min and max values
+
+    Args:
+        array: The array to quantise.
+        dtype: The integer type, "uint8" or "int16".
+
+    Returns:
+        The quantised array
+    """
+    if dtype not in QUANTISATION_DTYPES:
+        raise ValueError(f"Unknown quantisation type: '{dtype}', expected one of {list(QUANTISATION_DTYPES)}")
+
+    info = np.iinfo(QUANTISATION_DTYPES[dtype])
+
+    low, high = (float(np.min(array)), float(np.max(array))) if array.size > 0 else (0., 0.)
+    scale = (high - low) / (int(info.max) - int(info.min)) if high > low else 1.
+
+    values = np.rint((array - low) / scale) + info.min
+    values = np.clip(values, info.min, info.max).astype(info.dtype)
+
+    return QuantisedArray(values=values, scale=scale, offset=low - info.min * scale)
+
+
+def dequantised_batches(
+        quantised: QuantisedArray,
+        batch_size: int,
+        shuffle: bool = True,
+        indexes: Optional[np.ndarray] = None,
+        rng: Optional[np.random.Generator] = None,
+        dtype=np.float32
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Iterate through batches of the quantised rows, dequantising each batch
+
+    Args:
+        quantised: The quantised transform inputs.
+        batch_size: The maximum number of rows in a batch.
+        shuffle: If true, the rows are shuffled before batching.
+        indexes: The rows to iterate through, defaults to every row. e.g. the
+            rows drawn by `subsampling.subsample_indexes`
+        rng: The random generator, defaults to a new unseeded generator.
+        dtype: The type to dequantise to.
+
+    Returns:
+        An iterator of the row indexes of each batch and the dequantised rows
+    """
+    indexes = np.arange(len(quantised)) if indexes is None else indexes
+
+    for batch in subsample_batches(indexes, batch_size, shuffle, rng):
+        yield batch, quantised.dequantise(batch, dtype)
@@ -1,5 +1,6 @@
 import math
-from typing import List
+from functools import lru_cache
+from typing import Sequence
 
 import numpy as np
 
@@ -10,46 +11,114 @@ from lapsim.normalisation.normalised_data import NormalisedData
 networks."""
 
 
-def get_target_output(
-        normalised: NormalisedData,
-        outputs: List[str],
-        sampling: int = 0,
-        lag: int = 0,
-        patch_size: int = 1
-):
+def get_target_output(normalised: NormalisedData, outputs: Sequence[str], indexes: np.ndarray):
     """This function gets the target output when normalising data. This is done
     by creating a multiple matrix described in garlick & bradley 2021
 
+    The targets for all the tracks are gathered at once for each output, using
+    the target indexes of each track offset into the flattened tracks.
+
     Args:
         normalised: The normalised data class
         outputs: List of keys to encode in the given order, eg positions, velocities
-        sampling: The output sampling
-        lag: How much lag to apply to the output
-        patch_size: The patch size
+        indexes: The target indexes of all the tracks, see
+            `TransformMethod.partition_target_indexes`
 
     Returns:
         A tuple of the output vectors
     """
-    items_count = normalised.normals_count()
+    return [
+        np.concatenate([np.asarray(track, dtype=np.float64) for track in normalised[output]])[indexes]
+        for output in outputs
+    ]
+
+
+@lru_cache(maxsize=1024)
+def target_indexes(track_length: int, sampling: int = 0, lag: int = 0, patch_size: int = 1) -> np.ndarray:
+    """Get the indexes of the seg. lines which make up the target of each
+    seg. line in a track. Row n contains the `patch_size * (sampling * 2 + 1)`
+    seg. lines starting `patch_size * (sampling + 1) - 1 + lag` lines before
+    line n, looping around the track.
 
-    outputs_vectors = [np.zeros((items_count, (sampling * 2 + 1) * patch_size)) for _ in outputs]
+    The indexes are cached since they only depend on the track length and the
+    transform parameters, so the returned array is read only.
 
-    global_item_index = 0
-    for t_idx in range(len(normalised)):
-        track_length = normalised.track_length(t_idx)
+    Args:
+        track_length: Number of seg. lines in the track
+        sampling: Number of seg lines to predict prior and
+            post the central position
+        lag: How much to offset the track so the output lags behind
+        patch_size: Size of the patch to group lines by.
 
-        # Compute output vectors by looping through output keys inserting them into the output vectors
-        for i, output in enumerate(outputs):
-            outputs_vectors[i][global_item_index:global_item_index + track_length] = compute_targets_for_track(
-                np.array(normalised[output][t_idx]),
-                lag=lag,
-                sampling=sampling,
-                patch_size=patch_size
-            )
+    Returns:
+        The (track_length, patch_size * (sampling * 2 + 1)) index matrix
+    """
+    first_index = 1 - patch_size - (sampling * patch_size) - lag
 
-        global_item_index += track_length
+    indexes = (
+        np.arange(track_length)[:, np.newaxis] +
+        np.arange(patch_size * (sampling * 2 + 1))[np.newaxis] +
+        first_index
+    ) % track_length
+    indexes.setflags(write=False)
 
-    return outputs_vectors
+    return indexes
+
+
+@lru_cache(maxsize=1024)
+def stateful_target_indexes(track_length: int, sampling: int = 0, lag: int = 0, patch_size: int = 1) -> np.ndarray:
+    """Get the indexes of the seg. lines which make up the target of each
+    patch for the stateful lag transform, where each row is a patch of the
+    track rather than a seg. line. The last row ends `lag` lines before the
+    end of the track, and each preceding row starts `patch_size` lines earlier.
+
+    Args:
+        track_length: Number of seg. lines in the track
+        sampling: Number of seg lines to predict prior and
+            post the central position
+        lag: How much to offset the track so the output lags behind
+        patch_size: Size of the patch to group lines by.
+
+    Returns:
+        The (ceil(track_length / patch_size), patch_size * (sampling * 2 + 1))
+        index matrix
+    """
+    patched_track_size = math.ceil(track_length / patch_size)
+    patches_from_end = patched_track_size - np.arange(patched_track_size) - 1
+
+    indexes = (
+        (track_length - patch_size * (1 + patches_from_end + sampling) - lag)[:, np.newaxis] +
+        np.arange(patch_size * (sampling * 2 + 1))[np.newaxis]
+    ) % track_length
+    indexes.setflags(write=False)
+
+    return indexes
+
+
+def desample(indexes: np.ndarray, output: np.ndarray, track_length: int) -> np.ndarray:
+    """Combine the sampled output back into one value per seg. line by taking
+    the mean of every prediction made for each seg. line. This is done as a
+    scatter-add of the outputs onto the seg. lines given by the target indexes.
+
+    Args:
+        indexes: The target indexes the output was sampled with, these can span
+            many tracks (see `TransformMethod.partition_target_indexes`).
+        output: The sampled output, the same shape as the indexes.
+        track_length: The total number of seg. lines being desampled to.
+
+    Returns:
+        The desampled vector
+    """
+    indexes = indexes.ravel()
+    output = np.asarray(output, dtype=np.float64).ravel()
+
+    if len(indexes) != len(output):
+        raise ValueError(f"Output of size {len(output)} doesn't match the target indexes of size {len(indexes)}")
+
+    totals = np.bincount(indexes, weights=output, minlength=track_length)
+    counts = np.bincount(indexes, minlength=track_length)
+
+    return totals / counts
 
 
 def loop_track_for_patching_sampling(arr, sampling, patch_size):
@@ -77,18 +146,5 @@ def compute_targets_for_track(arr: np.ndarray, sampling=0, lag=0, patch_size=1):
     Returns:
         The transformed output
     """
-    output = np.zeros((len(arr), patch_size * (sampling * 2 + 1)))
-
-    # Apply lag, then repeat the track so that the full target can be
-    #  directly spliced from even for large sampling and patch sizes
-    extended_positions = np.roll(arr, lag)
-    extended_positions = loop_track_for_patching_sampling(extended_positions, sampling, patch_size)
-
-    for normal_index in range(len(arr)):
-        # Calculate here in the looped vector to splice from
-        patch_start = (normal_index + 1 - patch_size - (sampling * patch_size)) % len(arr)
-        patch_end = patch_start + (patch_size * (sampling * 2 + 1))
-
-        output[normal_index] = extended_positions[patch_start:patch_end]
-
-    return output
+    arr = np.asarray(arr, dtype=np.float64)
+    return arr[target_indexes(len(arr), sampling=sampling, lag=lag, patch_size=patch_size)]
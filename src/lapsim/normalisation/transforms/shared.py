@@ -0,0 +1,128 @@
+import ctypes
+import sys
+from multiprocessing import shared_memory
+from typing import Dict, Tuple
+
+import numpy as np
+
+
+"""Shared memory transport for the parallel transforms.
+
+Rather than pickling the normalised data for every track sent to a worker, the
+arrays are placed into a single shared memory block. Workers are only sent the
+small descriptor of the block (its name and the layout of the arrays within
+it) which they attach to, reading the inputs and writing their outputs in
+place. An output block can then be handed over to the caller with `take`, so
+the output is never copied out of shared memory."""
+
+
+# Layout of each array in the block: (byte offset, shape, dtype)
+ArrayLayout = Dict[str, Tuple[int, Tuple[int, ...], str]]
+
+
+class SharedArrays:
+    """A group of named numpy arrays stored in one shared memory block"""
+
+    def __init__(self, memory: shared_memory.SharedMemory, layout: ArrayLayout):
+        self._memory = memory
+        self._layout = layout
+
+        self.arrays: Dict[str, np.ndarray] = {
+            key: np.ndarray(shape, dtype=np.dtype(dtype), buffer=memory.buf, offset=offset)
+            for key, (offset, shape, dtype) in layout.items()
+        }
+
+    @property
+    def name(self):
+        return self._memory.name
+
+    @staticmethod
+    def create(arrays: Dict[str, np.ndarray]) -> 'SharedArrays':
+        """Create a shared memory block and copy the given arrays into it"""
+        shared = SharedArrays.allocate({key: (array.shape, array.dtype) for key, array in arrays.items()})
+        for key, array in arrays.items():
+            shared[key][...] = array
+
+        return shared
+
+    @staticmethod
+    def allocate(shapes: Dict[str, Tuple[Tuple[int, ...], np.dtype]]) -> 'SharedArrays':
+        """Create a shared memory block for arrays of the given shapes and
+        types, without initialising them"""
+        layout, size = {}, 0
+        for key, (shape, dtype) in shapes.items():
+            dtype = np.dtype(dtype)
+
+            # Align each array to 64 bytes
+            size = -(-size // 64) * 64
+            layout[key] = (size, tuple(shape), dtype.str)
+            size += int(np.prod(shape)) * dtype.itemsize
+
+        return SharedArrays(shared_memory.SharedMemory(create=True, size=max(1, size)), layout)
+
+    @staticmethod
+    def attach(descriptor: Tuple[str, ArrayLayout]) -> 'SharedArrays':
+        """Attach to a shared memory block created in another process"""
+        name, layout = descriptor
+
+        if sys.version_info >= (3, 13):
+            memory = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            # Pool workers share the resource tracker of the process which
+            # created the block, so attaching re-registers the same block and
+            # it must not be unregistered here (it's unregistered on unlink)
+            memory = shared_memory.SharedMemory(name=name)
+
+        return SharedArrays(memory, layout)
+
+    def descriptor(self) -> Tuple[str, ArrayLayout]:
+        return self._memory.name, self._layout
+
+    def __getitem__(self, key) -> np.ndarray:
+        return self.arrays[key]
+
+    def take(self, key: str) -> np.ndarray:
+        """Hand an array over to the caller without copying it. The block is
+        unlinked, so no other process can attach to it, and the returned
+        array owns the mapping, which is closed once the array (and every view
+        of it) is garbage collected. The block can't be used after this."""
+        offset, shape, dtype = self._layout[key]
+        self.arrays = {}
+        self._memory.unlink()
+
+        if int(np.prod(shape)) == 0:
+            self._memory.close()
+            return np.empty(shape, dtype=np.dtype(dtype))
+
+        return np.asarray(_BlockOwner(self._memory, offset, shape, dtype))
+
+    def close(self):
+        self.arrays = {}
+        self._memory.close()
+
+    def unlink(self):
+        self.close()
+        self._memory.unlink()
+
+
+class _BlockOwner:
+    """Exposes an array in a shared memory block, keeping the block mapped
+    until the arrays built on it are garbage collected. It's the base of those
+    arrays, so it's collected after them and then closes the block."""
+
+    def __init__(self, memory: shared_memory.SharedMemory, offset: int, shape: Tuple[int, ...], dtype: str):
+        self._memory = memory
+        self._pointer = ctypes.c_char.from_buffer(memory.buf, offset)
+
+        self.__array_interface__ = {
+            "data": (ctypes.addressof(self._pointer), False),
+            "shape": tuple(shape),
+            "typestr": dtype,
+            "version": 3,
+        }
+
+    def __del__(self):
+        # The pointer holds an export of the block's buffer, which has to be
+        # released before the block can be closed
+        self._pointer = None
+        self._memory.close()
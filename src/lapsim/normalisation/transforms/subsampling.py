@@ -0,0 +1,80 @@
+from typing import List, Iterator, Optional
+
+import numpy as np
+
+
+"""Row subsampling of the transformed data.
+
+The `random_repeats` and `decimation` transform options are applied to the row
+indexes of the transform output rather than the output itself, so an epoch can
+be trained on a subsampled view of a partition without copying any windows.
+Decimation drops a random fraction of the normals of each track and repeats
+draw the (decimated) rows of a track multiple times, each time independently.
+"""
+
+
+def subsample_indexes(
+        track_lengths: List[int],
+        decimation: float = 0,
+        random_repeats: int = 1,
+        rng: Optional[np.random.Generator] = None
+) -> np.ndarray:
+    """Draw the rows of the transform output to train on
+
+    Args:
+        track_lengths: The number of rows (normals) of each track, in the order
+            they are stacked in the transform output.
+        decimation: The fraction of each track's rows to drop, e.g. 0.5 keeps
+            half of each track. At least one row of each track is kept.
+        random_repeats: A number of repeats up to this value is drawn for each
+            track, the rows of each repeat are drawn independently.
+        rng: The random generator, defaults to a new unseeded generator.
+
+    Returns:
+        The row indexes into the transform output, grouped by track.
+    """
+    if not 0 <= decimation < 1:
+        raise ValueError(f"Decimation must be in the range [0, 1), got: {decimation}")
+
+    if random_repeats < 1:
+        raise ValueError(f"Random repeats must be at least 1, got: {random_repeats}")
+
+    track_starts = np.cumsum([0] + list(track_lengths))
+    if decimation == 0 and random_repeats == 1:
+        return np.arange(track_starts[-1])
+
+    rng = rng if rng is not None else np.random.default_rng()
+
+    indexes = []
+    for track_start, track_length in zip(track_starts, track_lengths):
+        keep = max(1, round(track_length * (1 - decimation))) if track_length > 0 else 0
+
+        for _ in range(rng.integers(1, random_repeats + 1)):
+            indexes.append(track_start + np.sort(rng.choice(track_length, keep, replace=False)))
+
+    return np.concatenate(indexes) if indexes else np.zeros(0, dtype=np.int64)
+
+
+def subsample_batches(
+        indexes: np.ndarray,
+        batch_size: int,
+        shuffle: bool = True,
+        rng: Optional[np.random.Generator] = None
+) -> Iterator[np.ndarray]:
+    """Iterate through batches of the subsampled row indexes
+
+    Args:
+        indexes: The row indexes, see `subsample_indexes`.
+        batch_size: The maximum number of rows in a batch.
+        shuffle: If true, the rows are shuffled before batching.
+        rng: The random generator, defaults to a new unseeded generator.
+
+    Returns:
+        An iterator of the row indexes of each batch.
+    """
+    if shuffle:
+        rng = rng if rng is not None else np.random.default_rng()
+        indexes = rng.permutation(indexes)
+
+    for start in range(0, len(indexes), batch_size):
+        yield indexes[start:start + batch_size]
@@ -1,13 +1,19 @@
-from typing import Union, Optional, List
+import threading
+from functools import lru_cache
+from typing import Any, Union, Optional, List, Iterator, Dict, Tuple, Type
 
 import numpy as np
 from pydantic import BaseModel, Field
 
+from lapsim.encoder.partition import Partition
 from lapsim.normalisation.normalised_data import NormalisedData
 
+from lapsim.normalisation.transforms.common import TransformMethod
+from lapsim.normalisation.transforms.executor import Cores
 from lapsim.normalisation.transforms.bidirectional import BidirectionalTransformMethod
 from lapsim.normalisation.transforms.lagging import LaggingTransformMethod, StatefulLaggingTransformMethod
-from lapsim.normalisation.transforms.window import WindowTransform, FlatWindowTransform
+from lapsim.normalisation.transforms.window import WindowTransform, FlatWindowTransform, DilatedWindowTransform
+from lapsim.normalisation.transforms.subsampling import subsample_indexes, subsample_batches
 
 
 VEHICLE_KEYS = {
@@ -24,15 +30,61 @@ DEFAULT_INPUTS = ["widths", "angles", "offsets"]
 DEFAULT_OUTPUTS = ["positions", "velocities"]
 
 
-transform_map = {
-    "bidirectional": BidirectionalTransformMethod(),
-    "lag": LaggingTransformMethod(),
-    "stateful-lag": StatefulLaggingTransformMethod(),
-    "window": WindowTransform(),
-    "flat-window": FlatWindowTransform()
+transform_map: Dict[str, Type[TransformMethod]] = {
+    "bidirectional": BidirectionalTransformMethod,
+    "lag": LaggingTransformMethod,
+    "stateful-lag": StatefulLaggingTransformMethod,
+    "window": WindowTransform,
+    "flat-window": FlatWindowTransform,
+    "dilated-window": DilatedWindowTransform
 }
 
 
+# The number of compiled transform plans kept, so a hyperparameter sweep
+# doesn't keep a plan alive for every configuration it has tried
+PLAN_CACHE_SIZE = 64
+
+_plans_lock = threading.Lock()
+
+
+def compile_transform(method: str, **params) -> TransformMethod:
+    """Get the compiled transform plan for a configuration. Plans are
+    immutable, so the same plan is returned for the same configuration (while
+    it's one of the `PLAN_CACHE_SIZE` most recently used) and is safe to
+    share between threads.
+
+    Args:
+        method: The transform method, a key of `transform_map`.
+        **params: The transform method parameters, see `TransformMethod`.
+            Unset (None) parameters the method doesn't take are ignored, so
+            they aren't part of the plan key.
+
+    Returns:
+        The transform plan
+    """
+    if method not in transform_map:
+        raise Exception(f"Unknown transform method: '{method}'")
+
+    declared = transform_map[method].parameters
+    unknown = [name for name, value in params.items() if name not in declared and value is not None]
+    if len(unknown) > 0:
+        raise ValueError(f"The '{method}' transform doesn't take the parameters: {', '.join(sorted(unknown))}")
+
+    key = tuple(
+        (name, tuple(value) if isinstance(value, list) else value)
+        for name, value in sorted(params.items())
+        if name in declared
+    )
+
+    with _plans_lock:
+        return _compile_plan(method, key)
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _compile_plan(method: str, params: Tuple[Tuple[str, Any], ...]) -> TransformMethod:
+    return transform_map[method](**dict(params))
+
+
 class Transform(BaseModel):
 
     method: str = Field(default="flat-window")
@@ -49,6 +101,12 @@ class Transform(BaseModel):
 
     patch_size: int = 1
     time_to_vec: bool = False  # Should always be relative to the track rather than current track window otherwise will always learn to predict for when values equal 1
+
+    # Used by the dilated window method, see `dilated_window.dilated_offsets`
+    dense_foresight: Optional[int] = None
+    dilation_rate: Optional[int] = None
+    dilation_pooling: Optional[bool] = None
+
     random_repeats: int = 1  # Choose a random number up to this point
     decimation: float = 0  # 0.5 means half the randomly track disapears, this is to help overfitting
 
@@ -72,11 +130,7 @@ class Transform(BaseModel):
         Returns:
             The vehicle vector
         """
-        keys_order = (
-            VEHICLE_KEYS[self.vehicle_encoding]
-            if isinstance(self.vehicle_encoding, str) else
-            self.vehicle_encoding
-        )
+        keys_order = self.vehicle_keys()
 
         lower_keyed_vehicle = {key.lower(): vehicle[key] for key in vehicle}
 
@@ -92,30 +146,145 @@ class Transform(BaseModel):
 
         return vehicle_data
 
+    def vehicle_keys(self) -> List[str]:
+        """Get the keys of the vehicle encoding, in order"""
+        return (
+            VEHICLE_KEYS[self.vehicle_encoding]
+            if isinstance(self.vehicle_encoding, str) else
+            self.vehicle_encoding
+        )
+
     def vectorise_vehicles(self, vehicles: List[dict]) -> List[List[float]]:
         """Vectorise a list of vehicles"""
         return [self.transform_vehicle(x) for x in vehicles]
 
-    def get_transform(self):
-        """Get the transform method class, then set the params of the transform"""
-        if self.method not in transform_map:
-            raise Exception(f"Unknown transform method: '{self.method}'")
+    def get_transform(self) -> TransformMethod:
+        """Get the compiled transform plan for the current params of the
+        transform"""
+        return compile_transform(
+            self.method,
+            inputs=self.inputs,
+            outputs=self.outputs,
+            sampling=self.sampling,
+            patch_size=self.patch_size,
+            lag=self.lag,
+            foresight=self.foresight,
+            time_to_vec=self.time_to_vec,
+            dense_foresight=self.dense_foresight,
+            dilation_rate=self.dilation_rate,
+            dilation_pooling=self.dilation_pooling
+        )
+
+    def estimate_output_bytes(self, partition_or_manifest: Union[Partition, List[int]]) -> int:
+        """Compute the exact number of bytes output by the transform (inputs,
+        targets and vehicles) without running it.
+
+        Args:
+            partition_or_manifest: The partition, or the number of seg. lines
+                in each track of the partition.
+
+        Returns:
+            The number of bytes
+        """
+        track_lengths = (
+            [len(widths) for widths in partition_or_manifest.widths]
+            if isinstance(partition_or_manifest, Partition) else
+            list(partition_or_manifest)
+        )
+
+        return self.get_transform().estimate_output_bytes(track_lengths, len(self.vehicle_keys()))
+
+    def chunk_track_indexes(self, track_lengths: List[int], max_bytes: int) -> List[List[int]]:
+        """Split the tracks into consecutive chunks whose transform outputs fit
+        within the given number of bytes. A track which doesn't fit on its own
+        is given a chunk of its own.
+
+        The bytes of a chunk are kept as it grows, so only the added track is
+        estimated: the sum of each track's bytes for per-track outputs,
+        otherwise the bytes per seg. line of the longest track so far (which
+        the rows are padded to) times the number of seg. lines.
+
+        Args:
+            track_lengths: The number of seg. lines in each track.
+            max_bytes: The maximum output bytes of each chunk.
+
+        Returns:
+            The track indexes of each chunk
+        """
+        transform = self.get_transform()
+        vehicle_size = len(self.vehicle_keys())
+
+        track_bytes: Dict[int, int] = {}
+
+        def estimate_track(track_length: int) -> int:
+            if track_length not in track_bytes:
+                track_bytes[track_length] = transform.estimate_output_bytes([track_length], vehicle_size)
+            return track_bytes[track_length]
+
+        def estimate_chunk(n_normals: int, max_length: int, chunk_bytes: int, track_length: int) -> int:
+            if transform.per_track_outputs:
+                return chunk_bytes + estimate_track(track_length)
 
-        transform = transform_map[self.method]
+            max_length = max(max_length, track_length)
+            return estimate_track(max_length) // max_length * (n_normals + track_length) if max_length else 0
 
-        transform.inputs = self.inputs
-        transform.outputs = self.outputs
+        chunks, chunk = [], []
+        n_normals, max_length, chunk_bytes = 0, 0, 0
+        for t_idx, track_length in enumerate(track_lengths):
+            if chunk and estimate_chunk(n_normals, max_length, chunk_bytes, track_length) > max_bytes:
+                chunks.append(chunk)
+                chunk = []
+                n_normals, max_length, chunk_bytes = 0, 0, 0
 
-        transform.sampling = self.sampling
-        transform.patch_size = self.patch_size
-        transform.lag = self.lag
-        transform.foresight = self.foresight
-        transform.time_to_vec = self.time_to_vec
+            chunk.append(t_idx)
+            chunk_bytes = estimate_chunk(n_normals, max_length, chunk_bytes, track_length)
+            n_normals += track_length
+            max_length = max(max_length, track_length)
 
-        return transform
+        if chunk:
+            chunks.append(chunk)
 
-    def transform(self, normalised_data: NormalisedData, cores: int):
+        return chunks
+
+    def transform(self, normalised_data: NormalisedData, cores: Cores):
         return self.get_transform().transform(normalised_data, cores)
 
+    def transform_bucketed(self, normalised_data: NormalisedData, cores: Cores, n_buckets: int):
+        return self.get_transform().transform_bucketed(normalised_data, cores, n_buckets)
+
+    def transform_packed(self, normalised_data: NormalisedData, cores: Cores):
+        """Transform into padded arrays of whole tracks, see
+        `StatefulLaggingTransformMethod.transform_packed`"""
+        transform = self.get_transform()
+        if not isinstance(transform, StatefulLaggingTransformMethod):
+            raise ValueError(f"Packed transforms are only supported by the stateful-lag transform, not '{self.method}'")
+
+        return transform.transform_packed(normalised_data, cores)
+
+    def retransform(self, normalised_data: NormalisedData, track_index: int, x: np.ndarray, start: int, end: int):
+        return self.get_transform().retransform(normalised_data, track_index, x, start, end)
+
     def detransform(self, track_length: int, outputs: List[np.ndarray]):
         return self.get_transform().detransform(track_length, outputs)
+
+    def detransform_batch(self, track_lengths: List[int], outputs: List[np.ndarray]):
+        return self.get_transform().detransform_batch(track_lengths, outputs)
+
+    def subsample_indexes(self, track_lengths: List[int], rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """Draw the rows of the transform output to train on for an epoch,
+        applying the `decimation` and `random_repeats` options, see
+        `subsampling.subsample_indexes`"""
+        if self.method == "stateful-lag":
+            raise ValueError("Subsampling is not supported by the stateful-lag transform since it outputs whole tracks")
+
+        return subsample_indexes(track_lengths, self.decimation, self.random_repeats, rng)
+
+    def subsample_batches(
+            self,
+            track_lengths: List[int],
+            batch_size: int,
+            shuffle: bool = True,
+            rng: Optional[np.random.Generator] = None
+    ) -> Iterator[np.ndarray]:
+        """Iterate through shuffled batches of the rows drawn for an epoch"""
+        return subsample_batches(self.subsample_indexes(track_lengths, rng), batch_size, shuffle, rng)
@@ -1,2 +1,3 @@
 from .window import WindowTransform
 from .flat_window import FlatWindowTransform
+from .dilated_window import DilatedWindowTransform
@@ -1,38 +1,87 @@
-from typing import List
-
 import numpy as np
 
 from lapsim.normalisation.normalised_data import NormalisedData
-from lapsim.normalisation.transforms.common import TransformMethod
+from lapsim.normalisation.transforms.executor import Cores
+from lapsim.normalisation.transforms.common import TransformMethod, combine
+from lapsim.normalisation.transforms.sampling import target_indexes
 
 
-"""This module stores the BaseWindow class which contains the detransformation."""
+"""This module stores the BaseWindow class which contains the target indexes
+used for the detransformation and the incremental re-transform of edited
+seg. lines."""
 
 
 class BaseWindowTransform(TransformMethod):
 
-    def transform(self, normalised: NormalisedData, cores: int):
+    def transform(self, normalised: NormalisedData, cores: Cores):
+        raise NotImplementedError
+
+    def compute_target_indexes(self, track_length: int) -> np.ndarray:
+        """The window targets are sampled around each seg. line without any
+        lag or patching"""
+        return target_indexes(track_length, sampling=self.sampling)
+
+    def encode_windows(self, track: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Encode the windows of the given rows of a track
+
+        Args:
+            track: The combined inputs of the track, of shape (seg. lines, inputs)
+            rows: The seg. lines to encode the windows of
+
+        Returns:
+            The windows in the layout of the transform's inputs
+        """
         raise NotImplementedError
 
-    def detransform(self, track_length: int, outputs: List[np.ndarray]) -> List[np.ndarray]:
-        """This function detransforms the output sampling, combining it back to the
-        original vector. This is useful for the combining the sampled output of the
-        network.
+    def retransform(
+            self,
+            normalised: NormalisedData,
+            track_index: int,
+            x: np.ndarray,
+            start: int,
+            end: int
+    ) -> np.ndarray:
+        """Update the windows of a previously transformed track after the seg.
+        lines in the range [start, end) have been edited. Only the windows
+        which include an edited line (those within the foresight of the edit)
+        are re-encoded.
 
         Args:
-            track_length: Number of normals in the track
-            outputs: The list of output data from the network. e.g. [y_pos, y_vel]
+            normalised: The normalised data containing the edited track.
+            track_index: The index of the edited track.
+            x: The transform inputs of the track (its rows of a previous
+                transform), updated in place.
+            start: The first edited seg. line.
+            end: The seg. line after the last edited line.
 
         Returns:
-            The combined output, desampled output
+            The sorted indexes of the rows which were updated
         """
-        detransformed_outputs = []
-        for output in outputs:
-            detransformed = [[] for _ in range(track_length)]
-            for index in range(len(output)):
-                for s in range(-self.sampling, self.sampling + 1):
-                    detransformed[(index + s) % len(output)].append(output[index][s + self.sampling])
+        track_length = normalised.track_length(track_index)
+        if not 0 <= start < end <= track_length:
+            raise ValueError(f"Invalid edit range [{start}, {end}) for a track of length {track_length}")
+
+        if len(x) != track_length:
+            raise ValueError(f"Expected {track_length} rows for the track, got: {len(x)}")
+
+        rows = affected_window_rows(track_length, start, end, self.foresight)
+        track = combine(*[normalised[_inp][track_index] for _inp in self.inputs])
+
+        x[rows] = self.encode_windows(track, rows)
+
+        return rows
+
+
+def window_indexes(track_length: int, rows: np.ndarray, foresight: int) -> np.ndarray:
+    """Get the seg. lines within the window of each row, looping around the
+    track, of shape (rows, 2f+1)"""
+    return (np.asarray(rows)[:, np.newaxis] + np.arange(-foresight, foresight + 1)[np.newaxis]) % track_length
+
 
-            detransformed_outputs.append(np.array([np.mean(x) for x in detransformed]))
+def affected_window_rows(track_length: int, start: int, end: int, foresight: int) -> np.ndarray:
+    """Get the rows whose windows include any of the seg. lines in the range
+    [start, end), looping around the track"""
+    if end - start + 2 * foresight >= track_length:
+        return np.arange(track_length)
 
-        return detransformed_outputs
+    return np.sort(np.arange(start - foresight, end + foresight) % track_length)
@@ -0,0 +1,183 @@
+from typing import Tuple, List, Optional
+
+import numpy as np
+
+from lapsim.normalisation.normalised_data import NormalisedData
+from lapsim.normalisation.transforms.executor import Cores
+from lapsim.normalisation.transforms.common import TransformMethod, combine
+from lapsim.normalisation.transforms.window.base import BaseWindowTransform
+
+
+"""This module encodes data into multi-scale windows. Like the flat-window,
+each window is centred on the seg. line being predicted and compressed into a
+single vector, however only the seg. lines near the centre are sampled densely.
+Further out, the seg. lines are sampled at exponentially increasing strides
+(or pooled into averages of the seg. lines between the samples), covering the
+same foresight with a fraction of the features."""
+
+
+class DilatedWindowTransform(BaseWindowTransform):
+
+    parameters = BaseWindowTransform.parameters + ("dense_foresight", "dilation_rate", "dilation_pooling")
+
+    def __init__(
+            self,
+            dense_foresight: Optional[int] = None,
+            dilation_rate: Optional[int] = None,
+            dilation_pooling: Optional[bool] = None,
+            **params
+    ):
+        """
+        Args:
+            dense_foresight: The number of seg. lines either side of the centre
+                sampled densely, defaults to 0.
+            dilation_rate: The factor the strides between samples grow by,
+                defaults to 2.
+            dilation_pooling: Whether each sample is the mean of the seg. lines
+                up to the next sample, see `pooling_intervals`.
+            **params: The parameters of every transform, see `TransformMethod`.
+        """
+        dense_foresight = 0 if dense_foresight is None else dense_foresight
+        dilation_rate = 2 if dilation_rate is None else dilation_rate
+
+        if dense_foresight < 0:
+            raise ValueError(f"The dense foresight can't be negative, got: {dense_foresight}")
+        if dilation_rate < 2:
+            raise ValueError(f"The dilation rate must be at least 2, got: {dilation_rate}")
+
+        # Set before the plan is frozen by the base constructor
+        self.dense_foresight = dense_foresight
+        self.dilation_rate = dilation_rate
+        self.dilation_pooling = bool(dilation_pooling)
+
+        super().__init__(**params)
+
+    def transform(self, normalised: NormalisedData, cores: Cores):
+        """Encode the data into a series of dilated windows, compressing each
+        window into a single vector with each input's window after the previous
+        input's, see `dilated_offsets` for the seg. lines sampled.
+
+        Args:
+            normalised: The normalised partition from the normalisation step
+            cores: Number of cores used to multiprocess the track using
+
+        Returns:
+            (x, vehicles), (y_pos, y_vel)
+        """
+        total_normals_count = normalised.normals_count()
+        offsets = self.offsets()
+
+        vehicles = np.zeros((total_normals_count, len(normalised.vehicles[0])), dtype=np.float32)
+
+        # Encode tracks into the preallocated output
+        x = self.perform_parallel_transforms(
+            _dilated_window_transform, normalised, cores,
+            shape=(total_normals_count, len(self.inputs) * len(offsets)), dtype=np.float32)
+
+        global_index = 0
+        for i in range(len(normalised)):
+            track_length = normalised.track_length(i)
+            vehicles[global_index:global_index + track_length] = normalised["vehicles"][i]
+
+            global_index += track_length
+
+        return x, self.target_output(normalised), vehicles
+
+    def output_shapes(self, track_lengths: List[int], vehicle_size: int) -> List[Tuple[Tuple[int, ...], np.dtype]]:
+        n_normals = sum(track_lengths)
+        return [
+            ((n_normals, len(self.inputs) * len(self.offsets())), np.dtype(np.float32)),
+            *self.target_shapes(track_lengths),
+            ((n_normals, vehicle_size), np.dtype(np.float32))
+        ]
+
+    def offsets(self) -> np.ndarray:
+        """The offsets of the seg. lines sampled in each window"""
+        return dilated_offsets(self.foresight, self.dense_foresight, self.dilation_rate)
+
+    def encode_windows(self, track: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Encode the dilated windows of the rows as flat vectors, with each
+        input's window after the previous input's"""
+        offsets = self.offsets()
+        rows = np.asarray(rows)
+
+        if self.dilation_pooling:
+            starts, ends = pooling_intervals(offsets)
+
+            # Pool with prefix sums over the track, looped by the foresight at each end
+            looped = track[np.arange(-self.foresight, len(track) + self.foresight) % len(track)]
+            sums = np.concatenate((np.zeros((1, track.shape[1])), np.cumsum(looped, axis=0)))
+
+            first = rows[:, np.newaxis] + starts[np.newaxis] + self.foresight
+            last = rows[:, np.newaxis] + ends[np.newaxis] + self.foresight + 1
+            windows = (sums[last] - sums[first]) / (ends - starts + 1)[np.newaxis, :, np.newaxis]
+        else:
+            windows = track[(rows[:, np.newaxis] + offsets[np.newaxis]) % len(track)]
+
+        return windows.transpose((0, 2, 1)).reshape((len(rows), -1)).astype(np.float32)
+
+
+def dilated_offsets(foresight: int, dense_foresight: int = 0, dilation_rate: int = 2) -> np.ndarray:
+    """Get the offsets of the seg. lines sampled in each window, relative to the
+    seg. line at the centre of the window.
+
+    Every seg. line within the dense foresight is sampled, beyond that the
+    strides between samples start at 1 and grow by the dilation rate, e.g.
+    dense foresight 2 and rate 2 samples 0, ±1, ±2, ±3, ±5, ±9, ±17 and so on.
+    The last sample is always at the foresight, so the window covers the same
+    seg. lines as the (flat) window transform.
+
+    Args:
+        foresight: The number of seg. lines either side of the centre covered.
+        dense_foresight: The number of seg. lines either side of the centre
+            which are all sampled.
+        dilation_rate: The factor the strides between samples grow by.
+
+    Returns:
+        The sorted offsets of the sampled seg. lines
+    """
+    if foresight is None or foresight < 0:
+        raise ValueError(f"A foresight of at least 0 is required, got: {foresight}")
+
+    if dilation_rate < 2:
+        raise ValueError(f"The dilation rate must be at least 2, got: {dilation_rate}")
+
+    dense_foresight = min(dense_foresight, foresight)
+    positive = list(range(1, dense_foresight + 1))
+
+    offset, stride = dense_foresight, 1
+    while offset < foresight:
+        offset = min(offset + stride, foresight)
+        stride *= dilation_rate
+
+        positive.append(offset)
+
+    positive = np.array(positive, dtype=int)
+    return np.concatenate((-positive[::-1], [0], positive))
+
+
+def pooling_intervals(offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the (inclusive) range of seg. lines pooled into each sample. Each
+    sample pools the seg. lines from itself back towards the previous sample
+    nearer the centre, so the samples cover the window without overlapping.
+
+    Args:
+        offsets: The sorted offsets of the samples, see `dilated_offsets`.
+
+    Returns:
+        The first and last offset pooled by each sample
+    """
+    centre = len(offsets) // 2
+
+    starts, ends = offsets.copy(), offsets.copy()
+    starts[centre + 1:] = offsets[centre:-1] + 1
+    ends[:centre] = offsets[1:centre + 1] - 1
+
+    return starts, ends
+
+
+def _dilated_window_transform(normalised: NormalisedData, transform: TransformMethod, track_index: int):
+    """The dilated-window transform, called by `perform_parallel_transforms` to
+     parellalize the transformation"""
+    track = combine(*[normalised[_inp][track_index] for _inp in transform.inputs])
+    return transform.encode_windows(track, np.arange(len(track)))
@@ -1,9 +1,11 @@
+from typing import List, Tuple
+
 import numpy as np
 
 from lapsim.normalisation.normalised_data import NormalisedData
-from lapsim.normalisation.transforms.common import TransformMethod
-from lapsim.normalisation.transforms.sampling import get_target_output
-from lapsim.normalisation.transforms.window.base import BaseWindowTransform
+from lapsim.normalisation.transforms.executor import Cores
+from lapsim.normalisation.transforms.common import TransformMethod, combine
+from lapsim.normalisation.transforms.window.base import BaseWindowTransform, window_indexes
 
 
 """This module encodes data into windows as described in garlick and bradley 
@@ -16,7 +18,7 @@ train upon."""
 
 class FlatWindowTransform(BaseWindowTransform):
 
-    def transform(self, normalised: NormalisedData, cores: int):
+    def transform(self, normalised: NormalisedData, cores: Cores):
         """Encode the data into a series of windows (as described in Garlick &
         Bradley 2021, but compress each window into a single vector containing
         widths, angles, offsets and vehicles.
@@ -33,43 +35,38 @@ class FlatWindowTransform(BaseWindowTransform):
         window_length = self.foresight * 2 + 1
         total_window_size = len(self.inputs) * window_length
 
-        # Preallocate the memory, this makes it much faster and memory efficient as
-        # the arrays don't need reallocating
-        x = np.zeros((total_normals_count, total_window_size), dtype=np.float32)
         vehicles = np.zeros((total_normals_count, len(normalised.vehicles[0])), dtype=np.float32)
 
-        # Encode tracks
-        track_encodings = self.perform_parallel_transforms(_flat_window_transform, normalised, cores)
+        # Encode tracks into the preallocated output
+        x = self.perform_parallel_transforms(
+            _flat_window_transform, normalised, cores, shape=(total_normals_count, total_window_size), dtype=np.float32)
 
         global_index = 0
         for i in range(len(normalised)):
             track_length = normalised.track_length(i)
-
-            x[global_index: global_index + track_length] = track_encodings[i]
             vehicles[global_index:global_index + track_length] = normalised["vehicles"][i]
 
             global_index += track_length
 
-        return x, get_target_output(normalised, outputs=self.outputs, sampling=self.sampling), vehicles
-
+        return x, self.target_output(normalised), vehicles
 
-def _flat_window_transform(normalised_data: NormalisedData, transform: TransformMethod, track_index: int):
-    """The flat-window transform, called by `perform_parallel_transforms` to
-     parellalize the transformation"""
-    window_length = transform.foresight * 2 + 1
+    def output_shapes(self, track_lengths: List[int], vehicle_size: int) -> List[Tuple[Tuple[int, ...], np.dtype]]:
+        n_normals = sum(track_lengths)
+        return [
+            ((n_normals, len(self.inputs) * (self.foresight * 2 + 1)), np.dtype(np.float32)),
+            *self.target_shapes(track_lengths),
+            ((n_normals, vehicle_size), np.dtype(np.float32))
+        ]
 
-    track_length = normalised_data.track_length(track_index)
-    x = np.zeros((track_length, window_length * len(transform.inputs)))
+    def encode_windows(self, track: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Encode the windows of the rows as flat vectors, with each input's
+        window after the previous input's"""
+        windows = track[window_indexes(len(track), rows, self.foresight)]
+        return windows.transpose((0, 2, 1)).reshape((len(windows), -1)).astype(np.float32)
 
-    # Extract inputs from the transform based on defined keys
-    inputs = [normalised_data[_inp][track_index] for _inp in transform.inputs]
 
-    for normal_index in range(track_length):
-        for i, f in enumerate(range(normal_index - transform.foresight, normal_index + transform.foresight + 1)):
-            index = f % track_length
-
-            # Iterate through the inputs splicing in where needed
-            for inp_idx in range(len(transform.inputs)):
-                x[normal_index, i + (window_length * inp_idx)] = inputs[inp_idx][index]
-
-    return x
+def _flat_window_transform(normalised: NormalisedData, transform: TransformMethod, track_index: int):
+    """The flat-window transform, called by `perform_parallel_transforms` to
+     parellalize the transformation"""
+    track = combine(*[normalised[_inp][track_index] for _inp in transform.inputs])
+    return transform.encode_windows(track, np.arange(len(track)))
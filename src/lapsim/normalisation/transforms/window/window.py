@@ -1,9 +1,11 @@
+from typing import List, Tuple
+
 import numpy as np
 
 from lapsim.normalisation.normalised_data import NormalisedData
-from lapsim.normalisation.transforms.common import TransformMethod
-from lapsim.normalisation.transforms.sampling import get_target_output
-from lapsim.normalisation.transforms.window.base import BaseWindowTransform
+from lapsim.normalisation.transforms.executor import Cores
+from lapsim.normalisation.transforms.common import TransformMethod, combine
+from lapsim.normalisation.transforms.window.base import BaseWindowTransform, window_indexes
 
 
 """This module encodes data into windows as described in garlick and bradley 
@@ -16,7 +18,7 @@ allowing a CNN to train upon."""
 
 class WindowTransform(BaseWindowTransform):
 
-    def transform(self, normalised: NormalisedData, cores: int):
+    def transform(self, normalised: NormalisedData, cores: Cores):
         """Encode the data into a series of windows (as described in Garlick &
         Bradley 2021, where each window is a 3 x (2f+1) matrix which can be trained
         with a CNN. Vehicles aren't included in the main input and need to be fed
@@ -30,52 +32,40 @@ class WindowTransform(BaseWindowTransform):
         """
         total_normals_count = sum([len(x) for x in normalised.angles])
 
-        # Preallocate the memory, this makes it much faster and memory efficient as
-        # the arrays don't need reallocating
-        x = np.zeros((
+        vehicles = np.ones((total_normals_count, len(normalised.vehicles[0])))
+
+        # Encode tracks into the preallocated output
+        x = self.perform_parallel_transforms(_window_transform, normalised, cores, shape=(
             total_normals_count,
             len(self.inputs),
             self.foresight * 2 + 1
         ), dtype=np.float32)
 
-        vehicles = np.ones((total_normals_count, len(normalised.vehicles[0])))
-
-        # Encode tracks
-        track_encodings = self.perform_parallel_transforms(_window_transform, normalised, cores)
-
         global_index = 0
         for i in range(len(normalised)):
             track_length = normalised.track_length(i)
-
             vehicles[global_index:global_index + track_length] = normalised["vehicles"][i]
-            for ti, window in enumerate(track_encodings[i]):
-                x[global_index + ti] = window
 
             global_index += track_length
 
-        return x, get_target_output(normalised, outputs=self.outputs, sampling=self.sampling), vehicles
+        return x, self.target_output(normalised), vehicles
+
+    def output_shapes(self, track_lengths: List[int], vehicle_size: int) -> List[Tuple[Tuple[int, ...], np.dtype]]:
+        n_normals = sum(track_lengths)
+        return [
+            ((n_normals, len(self.inputs), self.foresight * 2 + 1), np.dtype(np.float32)),
+            *self.target_shapes(track_lengths),
+            ((n_normals, vehicle_size), np.dtype(np.float64))
+        ]
+
+    def encode_windows(self, track: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Encode the windows of the rows as (inputs, 2f+1) matrices"""
+        windows = track[window_indexes(len(track), rows, self.foresight)]
+        return windows.transpose((0, 2, 1)).astype(np.float32)
 
 
 def _window_transform(normalised: NormalisedData, transform: TransformMethod, track_index: int):
     """The window transform, called by `perform_parallel_transforms` to
      parellalize the transformation"""
-    track_length = len(normalised.widths[track_index])
-
-    # Extract the inputs (eg widths, angles, offsets) for the current track
-    inputs = [normalised[_inp][track_index] for _inp in transform.inputs]
-
-    windows = []
-
-    for normal_index in range(track_length):
-        window = np.zeros((len(transform.inputs), 2 * transform.foresight + 1), dtype=np.float32)
-
-        # Foresight
-        for i, f in enumerate(range(normal_index - transform.foresight, normal_index + transform.foresight + 1)):
-            index = f % track_length
-            # Loop through the given inptus (eg widths, angles, offsets) and splice into the window
-            for inp_idx, _inp in enumerate(transform.inputs):
-                window[inp_idx][i] = inputs[inp_idx][index]
-
-        windows.append(window)
-
-    return windows
+    track = combine(*[normalised[_inp][track_index] for _inp in transform.inputs])
+    return transform.encode_windows(track, np.arange(len(track)))
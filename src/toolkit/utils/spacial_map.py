@@ -93,3 +93,81 @@ class SpatialMap:
         self.cached_boxes = box_indexes
 
         return box_indexes
+
+
+class SegmentGrid:
+    """A grid index of line segments, for finding the segments which may
+    intersect a set of lines without testing every pair.
+
+    Each segment is added to every cell its (padded) bounding box overlaps.
+    Since a line can only intersect a segment where their bounding boxes
+    overlap, querying the cells a line's bounding box overlaps returns every
+    segment it can intersect (and some it doesn't)."""
+
+    # Padding added to the bounding boxes, larger than the tolerance used by
+    # `maths.segment_intersections` so no intersections are missed
+    PADDING = 1e-6
+
+    def __init__(self, segments: np.ndarray, cell_size: float):
+        """
+        Args:
+            segments: The `(M, 4)` segments as `[x1, y1, x2, y2]`.
+            cell_size: The width and height of the grid cells.
+        """
+        self.segments = np.asarray(segments, dtype=np.float64).reshape((-1, 4))
+        self.cell_size = cell_size
+
+        segment_indexes, keys = self._cells(self.segments)
+
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._segment_indexes = segment_indexes[order]
+
+    def _cells(self, lines: np.ndarray):
+        """Get the cells each line's bounding box overlaps, as the line
+        indexes and the cell keys"""
+        low = np.floor((np.minimum(lines[:, :2], lines[:, 2:]) - self.PADDING) / self.cell_size).astype(np.int64)
+        high = np.floor((np.maximum(lines[:, :2], lines[:, 2:]) + self.PADDING) / self.cell_size).astype(np.int64)
+
+        nx, ny = high[:, 0] - low[:, 0] + 1, high[:, 1] - low[:, 1] + 1
+        counts = nx * ny
+
+        line_indexes = np.repeat(np.arange(len(lines)), counts)
+        local = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        cx = low[line_indexes, 0] + local // ny[line_indexes]
+        cy = low[line_indexes, 1] + local % ny[line_indexes]
+
+        # Pack the cell coordinates into a single key
+        return line_indexes, (cx << 32) + (cy & 0xFFFFFFFF)
+
+    def query(self, lines: np.ndarray) -> List[np.ndarray]:
+        """Get the candidate segments of each line
+
+        Args:
+            lines: The `(N, 4)` lines as `[x1, y1, x2, y2]`.
+
+        Returns:
+            The sorted indexes of the segments each line may intersect
+        """
+        lines = np.asarray(lines, dtype=np.float64).reshape((-1, 4))
+        if len(self.segments) == 0:
+            return [np.zeros(0, dtype=np.int64) for _ in range(len(lines))]
+
+        line_indexes, keys = self._cells(lines)
+
+        # Join the cells of the lines with the cells of the segments
+        starts = np.searchsorted(self._keys, keys, side="left")
+        counts = np.searchsorted(self._keys, keys, side="right") - starts
+
+        pair_lines = np.repeat(line_indexes, counts)
+        pair_segments = self._segment_indexes[
+            np.repeat(starts, counts) + np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+        ]
+
+        # Remove the segments found in more than one cell, sorting by line then segment
+        pairs = np.unique(pair_lines * len(self.segments) + pair_segments)
+        pair_lines, pair_segments = pairs // len(self.segments), pairs % len(self.segments)
+
+        splits = np.searchsorted(pair_lines, np.arange(1, len(lines)))
+        return np.split(pair_segments, splits)
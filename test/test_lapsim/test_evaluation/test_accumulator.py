@@ -0,0 +1,114 @@
+import pickle
+
+import numpy as np
+from toolkit.tracks.models import Track
+
+from utils.test_base import TestBase
+from lapsim import eval
+
+
+"""Test the mergeable accumulators give the metrics of the whole dataset"""
+
+
+class TestAccumulator(TestBase):
+
+    def load_errors(self):
+        errors = []
+        for i in range(10):
+            truth = Track.parse_file(self.get_lapsim_data_path() / 'predicted' / f'ground-{i}.json')
+            predicted = Track.parse_file(self.get_lapsim_data_path() / 'predicted' / f'predicted-{i}.json')
+
+            truth_lines, truth_pos, truth_vel = eval.track_arrays(truth)
+            predicted_lines, predicted_pos, predicted_vel = eval.track_arrays(predicted)
+
+            errors.append(eval.lap_errors(truth_lines, truth_pos, truth_vel, predicted_pos, predicted_vel, predicted_lines))
+
+        return errors
+
+    def test_quantile_sketch(self):
+        values = np.random.default_rng(0).lognormal(size=10000)
+
+        sketch = eval.QuantileSketch(relative_accuracy=0.01)
+        sketch.update(values)
+
+        self.assertEqual(10000, sketch.count)
+        for q in [0, 0.5, 0.95, 0.99]:
+            expected = np.sort(values)[int(len(values) * q)]
+            self.assertAlmostEqual(expected, sketch.quantile(q), delta=expected * 0.01)
+
+        # Merging is the same as adding every value to one sketch
+        a, b = eval.QuantileSketch(), eval.QuantileSketch()
+        a.update(values[:3000])
+        b.update(values[3000:])
+        np.testing.assert_array_equal(sketch.counts, a.merge(b).counts)
+
+        zeros = eval.QuantileSketch()
+        zeros.update(np.zeros(10))
+        self.assertEqual(0, zeros.quantile(0.95))
+        self.assertIsNone(eval.QuantileSketch().quantile(0.95))
+
+        with self.assertRaises(ValueError):
+            sketch.update(np.array([-1.]))
+
+        with self.assertRaises(ValueError):
+            sketch.merge(eval.QuantileSketch(relative_accuracy=0.02))
+
+    def test_dataset_metrics(self):
+        """The accumulated metrics are the metrics of all the laps' seg. lines
+        concatenated, with the accumulators merged in any grouping"""
+        errors = self.load_errors()
+
+        first, second = eval.EvaluationAccumulator(), eval.EvaluationAccumulator()
+        for i, lap in enumerate(errors):
+            (first if i < 4 else second).update(lap)
+
+        # Accumulators are sent between processes
+        evaluation = pickle.loads(pickle.dumps(first)).merge(second).finalise()
+
+        offsets = np.cumsum([0] + [len(lap.position_deltas) for lap in errors])
+        expected = eval.LapErrors(
+            laptime=1,
+            predicted_laptime=1,
+            position_deltas=np.concatenate([lap.position_deltas for lap in errors]),
+            position_percentage_errors=np.concatenate([lap.position_percentage_errors for lap in errors]),
+            velocity_deltas=np.concatenate([lap.velocity_deltas for lap in errors]),
+            velocity_percentage_errors=np.concatenate([lap.velocity_percentage_errors for lap in errors]),
+            apexes=[apex + offset for lap, offset in zip(errors, offsets) for apex in lap.apexes]
+        ).evaluation()
+
+        for field in ["position", "velocity"]:
+            expected_error, error = getattr(expected, field), getattr(evaluation, field)
+
+            for name in ["max", "mean", "mean_absolute", "rmse", "percentage_mean", "percentage_max",
+                         "apex_mean", "apex_mean_absolute", "apex_max"]:
+                self.assertAlmostEqual(getattr(expected_error, name), getattr(error, name), places=9)
+
+            self.assertAlmostEqual(expected_error.ci95, error.ci95, delta=expected_error.ci95 * 0.01)
+            self.assertAlmostEqual(expected_error.percentage_ci95, error.percentage_ci95, delta=expected_error.percentage_ci95 * 0.01)
+
+        # The lap times are the means of each lap
+        combined = eval.Evaluation.combine([lap.evaluation() for lap in errors])
+        self.assertAlmostEqual(combined.laptime.abs_error, evaluation.laptime.abs_error)
+        self.assertAlmostEqual(combined.laptime.percentage, evaluation.laptime.percentage)
+
+    def test_evaluate_many(self):
+        path = self.get_lapsim_data_path() / 'predicted'
+
+        accumulator = eval.EvaluationAccumulator()
+        eval.evaluate_many(
+            [path / f'ground-{i}.json' for i in range(10)],
+            [path / f'predicted-{i}.json' for i in range(10)],
+            workers=2,
+            accumulator=accumulator
+        )
+
+        expected = eval.EvaluationAccumulator()
+        for lap in self.load_errors():
+            expected.update(lap)
+
+        self.assertEqual(10, accumulator.laps)
+        self.assertEqual(expected.finalise(), accumulator.finalise())
+
+    def test_empty(self):
+        with self.assertRaises(ValueError):
+            eval.EvaluationAccumulator().finalise()
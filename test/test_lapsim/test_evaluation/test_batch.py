@@ -0,0 +1,68 @@
+import dataclasses
+import os
+
+from lapsim.eval.evaluation import Evaluation
+from toolkit.tracks.models import Track
+
+from utils.test_base import TestBase
+from lapsim import eval
+
+
+"""Test the batch evaluation of a set of predicted tracks"""
+
+
+class TestBatchEvaluation(TestBase):
+
+    def get_paths(self, n: int = 10):
+        path = self.get_lapsim_data_path() / 'predicted'
+        return [path / f'ground-{i}.json' for i in range(n)], [path / f'predicted-{i}.json' for i in range(n)]
+
+    def assertEvaluationAlmostEqual(self, expected: Evaluation, actual: Evaluation):
+        for field, value in dataclasses.asdict(expected).items():
+            if field == "apexes":
+                self.assertListEqual(list(value), list(actual.apexes))
+                continue
+
+            for name, expected_value in value.items():
+                self.assertAlmostEqual(expected_value, getattr(getattr(actual, field), name), places=9)
+
+    def test_evaluate_many(self):
+        truth_paths, predicted_paths = self.get_paths()
+        expected = Evaluation.combine([
+            eval.evaluate(Track.parse_file(truth), Track.parse_file(predicted))
+            for truth, predicted in zip(truth_paths, predicted_paths)
+        ])
+
+        os.makedirs(self.get_temp_output_path())
+        output = self.get_temp_output_path() / 'evaluations.jsonl'
+
+        combined = eval.evaluate_many(truth_paths, predicted_paths, workers=2, output=output)
+        self.assertEvaluationAlmostEqual(expected, combined)
+
+        # Every track is streamed to the output, in order
+        evaluations = list(eval.read_evaluations(output))
+        self.assertListEqual([f'ground-{i}' for i in range(10)], [name for name, _ in evaluations])
+        self.assertEvaluationAlmostEqual(expected, Evaluation.combine([evaluation for _, evaluation in evaluations]))
+
+    def test_array_predictions(self):
+        """Predictions can be given as the predicted pos and vel arrays"""
+        truth_paths, predicted_paths = self.get_paths(2)
+
+        predictions = []
+        for path in predicted_paths:
+            _, pos, vel = eval.track_arrays(Track.parse_file(path))
+            predictions.append((pos, vel))
+
+        self.assertEvaluationAlmostEqual(
+            eval.evaluate_many(truth_paths, predicted_paths, workers=1),
+            eval.evaluate_many(truth_paths, predictions, workers=1)
+        )
+
+    def test_invalid_arguments(self):
+        truth_paths, predicted_paths = self.get_paths(2)
+
+        with self.assertRaises(ValueError):
+            eval.evaluate_many(truth_paths, predicted_paths[:1])
+
+        with self.assertRaises(ValueError):
+            eval.evaluate_many(truth_paths, predicted_paths, method="unknown")
@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+from toolkit.tracks.models import Track
+
+from utils.test_base import TestBase
+from lapsim import eval
+
+
+"""Test the precomputed truth-side evaluation contexts"""
+
+
+class TestEvaluationContext(TestBase):
+
+    def load_predicted(self, index: int):
+        truth = Track.parse_file(self.get_lapsim_data_path() / 'predicted' / f'ground-{index}.json')
+        predicted = Track.parse_file(self.get_lapsim_data_path() / 'predicted' / f'predicted-{index}.json')
+        return truth, predicted
+
+    def test_context(self):
+        truth, predicted = self.load_predicted(0)
+        context = eval.EvaluationContext.from_track(truth)
+
+        self.assertEqual(eval.estimate_lap_time(truth), context.laptime)
+        self.assertListEqual(eval.find_apexes(truth.segmentations), context.apexes.tolist())
+        np.testing.assert_array_equal(eval.calculate_optimal_positions(truth), context.optimal_line)
+        self.assertTupleEqual((len(truth.segmentations), 4), context.racing_line_normals.shape)
+
+        _, pos, vel = eval.track_arrays(truth)
+        self.assertEqual(np.min(vel), context.min_vel)
+        self.assertEqual(np.max(vel), context.max_vel)
+
+    def test_evaluate(self):
+        """A context gives the same evaluations as evaluating from scratch"""
+        for i in range(3):
+            truth, predicted = self.load_predicted(i)
+            context = eval.EvaluationContext.from_track(truth)
+
+            truth_lines, truth_pos, truth_vel = eval.track_arrays(truth)
+            predicted_lines, predicted_pos, predicted_vel = eval.track_arrays(predicted)
+
+            self.assertEqual(
+                eval.evaluate(truth, predicted),
+                context.evaluate(predicted_pos, predicted_vel, predicted_lines)
+            )
+            self.assertEqual(
+                eval.evaluate2_arrays(truth_lines, truth_pos, truth_vel, predicted_pos, predicted_vel, predicted_lines),
+                context.evaluate2(predicted_pos, predicted_vel, predicted_lines)
+            )
+
+    def test_lazy_normals(self):
+        truth, predicted = self.load_predicted(0)
+        _, predicted_pos, predicted_vel = eval.track_arrays(predicted)
+
+        eager = eval.EvaluationContext.from_track(truth)
+        lazy = eval.EvaluationContext.from_track(truth, normals=False)
+        self.assertIsNone(lazy.racing_line_normals)
+
+        self.assertEqual(eager.evaluate2(predicted_pos, predicted_vel), lazy.evaluate2(predicted_pos, predicted_vel))
+        np.testing.assert_array_equal(eager.racing_line_normals, lazy.racing_line_normals)
+
+    def test_save_and_load(self):
+        truth, predicted = self.load_predicted(1)
+        _, predicted_pos, predicted_vel = eval.track_arrays(predicted)
+
+        os.makedirs(self.get_temp_output_path())
+        path = self.get_temp_output_path() / 'context.npz'
+
+        context = eval.EvaluationContext.from_track(truth)
+        context.save(path)
+        loaded = eval.EvaluationContext.load(path)
+
+        self.assertEqual(context.laptime, loaded.laptime)
+        np.testing.assert_array_equal(context.apexes, loaded.apexes)
+        np.testing.assert_array_equal(context.racing_line_normals, loaded.racing_line_normals)
+
+        self.assertEqual(context.evaluate(predicted_pos, predicted_vel), loaded.evaluate(predicted_pos, predicted_vel))
+        self.assertEqual(context.evaluate2(predicted_pos, predicted_vel), loaded.evaluate2(predicted_pos, predicted_vel))
+
+        # Contexts built without the normals are saved without them
+        eval.EvaluationContext.from_track(truth, normals=False).save(path)
+        self.assertIsNone(eval.EvaluationContext.load(path).racing_line_normals)
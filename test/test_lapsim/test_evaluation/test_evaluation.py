@@ -2,6 +2,7 @@ import json
 
 import numpy as np
 from toolkit import maths
+from lapsim.encoder.partition import Partition
 from lapsim.eval.evaluation import Evaluation, EvaluationLapTime, EvaluationError
 from toolkit.tracks.models import SegmentationLine, Track
 
@@ -38,6 +39,19 @@ class TestEvaluation(TestBase):
             [63, 88, 117, 137, 232, 267, 326, 422, 432, 539, 570, 587, 682, 796, 864, 895, 997, 1103, 1113]
         )
 
+    def test_find_apexes_with_encoded_angles(self):
+        """The apexes can be found from the angles of the encoded track"""
+        spliced_track = self.get_spliced_data()
+        partition = Partition.load(self.get_lapsim_data_path() / 'encoded' / '100586536.json')
+
+        self.assertListEqual(
+            eval.find_apexes(spliced_track.segmentations),
+            eval.find_apexes(spliced_track.segmentations, partition.angles[0])
+        )
+
+        with self.assertRaises(ValueError):
+            eval.find_apexes(spliced_track.segmentations, partition.angles[0][1:])
+
     def test_laptime(self):
         # Create track of two segmentations seperated by 10m (20m round trip)
         # at speeds of 5mps
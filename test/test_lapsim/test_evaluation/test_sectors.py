@@ -0,0 +1,93 @@
+import numpy as np
+from toolkit.tracks.models import Track
+
+from utils.test_base import TestBase
+from lapsim import eval
+
+
+"""Test the sector queries match evaluating the sub-ranges directly"""
+
+
+class TestSectors(TestBase):
+
+    def setUp(self) -> None:
+        super().setUp()
+
+        truth = Track.parse_file(self.get_lapsim_data_path() / 'predicted' / 'ground-0.json')
+        predicted = Track.parse_file(self.get_lapsim_data_path() / 'predicted' / 'predicted-0.json')
+
+        self.truth_lines, self.truth_pos, self.truth_vel = eval.track_arrays(truth)
+        self.predicted_lines, self.predicted_pos, self.predicted_vel = eval.track_arrays(predicted)
+        self.n = len(self.truth_lines)
+
+        self.context = eval.EvaluationContext.from_track(truth)
+        self.index = eval.SectorIndex.from_context(
+            self.context, self.predicted_pos, self.predicted_vel, self.predicted_lines
+        )
+        self.errors = self.context.lap_errors(self.predicted_pos, self.predicted_vel, self.predicted_lines)
+
+    def test_full_lap(self):
+        sector = self.index.sector(0, self.n)
+
+        self.assertAlmostEqual(self.errors.laptime, sector.laptime, places=9)
+        self.assertAlmostEqual(self.errors.predicted_laptime, sector.predicted_laptime, places=9)
+
+        evaluation = self.errors.evaluation()
+        self.assertAlmostEqual(evaluation.position.rmse, sector.position_rmse, places=9)
+        self.assertAlmostEqual(evaluation.position.mean, sector.position_mean, places=9)
+        self.assertAlmostEqual(evaluation.velocity.mean_absolute, sector.velocity_mean_absolute, places=9)
+
+        # A full lap can start anywhere
+        self.assertAlmostEqual(sector.laptime, self.index.sector(100, 100 + self.n).laptime, places=9)
+
+    def test_ranges(self):
+        _, traces = eval.estimate_lap_times(self.truth_lines, self.truth_pos, self.truth_vel, cumulative=True)
+
+        for start, end in [(0, 10), (50, 51), (100, 400), (self.n - 20, self.n + 20), (30, 30)]:
+            sector = self.index.sector(start, end)
+            lines = np.arange(start, end) % self.n
+
+            deltas = self.errors.position_deltas[lines]
+            self.assertAlmostEqual(float(np.mean(deltas)) if len(lines) else None, sector.position_mean)
+            self.assertAlmostEqual(float(np.sqrt(np.mean(np.square(self.errors.velocity_deltas[lines])))) if len(lines) else None, sector.velocity_rmse)
+
+            if end <= self.n - 1:
+                self.assertAlmostEqual(traces[0, end] - traces[0, start], sector.laptime, places=9)
+
+        with self.assertRaises(ValueError):
+            self.index.sector(10, 5)
+
+        with self.assertRaises(ValueError):
+            self.index.sector(0, self.n + 1)
+
+    def test_missing_errors(self):
+        index = eval.SectorIndex(np.ones(4), np.ones(4), np.array([1., np.nan, 3., np.nan]), np.zeros(4), [])
+
+        self.assertEqual(2, index.sector(0, 3).position_mean)
+        self.assertIsNone(index.sector(1, 2).position_mean)
+        self.assertEqual(1, index.sector(3, 5).position_mean_absolute)
+
+    def test_split_sectors(self):
+        self.assertListEqual([(0, 2), (2, 5), (5, 7), (7, 10)], eval.split_sectors(10, 4))
+
+        sectors = self.index.split_sectors(3)
+        self.assertEqual(3, len(sectors))
+        self.assertAlmostEqual(self.errors.laptime, sum(sector.laptime for sector in sectors), places=9)
+
+        with self.assertRaises(ValueError):
+            eval.split_sectors(10, 0)
+
+    def test_apex_segments(self):
+        self.assertListEqual([(0, 10)], eval.apex_segments([], 10))
+        self.assertListEqual([(4, 14)], eval.apex_segments([4], 10))
+        self.assertListEqual([(2, 5), (5, 8), (8, 12)], eval.apex_segments([5, 2, 8], 10))
+
+        segments = self.index.apex_segments()
+        self.assertEqual(max(1, len(self.context.apexes)), len(segments))
+        self.assertAlmostEqual(self.errors.laptime, sum(segment.laptime for segment in segments), places=9)
+
+    def test_from_arrays(self):
+        index = eval.SectorIndex.from_arrays(
+            self.truth_lines, self.truth_pos, self.truth_vel, self.predicted_pos, self.predicted_vel, self.predicted_lines
+        )
+        self.assertEqual(self.index.sector(10, 200), index.sector(10, 200))
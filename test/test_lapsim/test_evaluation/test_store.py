@@ -0,0 +1,140 @@
+import os
+
+import numpy as np
+from toolkit.tracks.models import Track
+
+from utils.test_base import TestBase
+from lapsim import eval
+from lapsim.eval.store import TRACK_METRICS
+
+
+"""Test the columnar evaluation store"""
+
+
+class TestEvaluationStore(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(self.get_temp_output_path())
+
+        self.errors = []
+        for i in range(4):
+            truth = Track.parse_file(self.get_lapsim_data_path() / 'predicted' / f'ground-{i}.json')
+            predicted = Track.parse_file(self.get_lapsim_data_path() / 'predicted' / f'predicted-{i}.json')
+            self.errors.append(eval.lap_errors(*eval.track_arrays(truth), *eval.track_arrays(predicted)[1:]))
+
+        self.vehicles = ["car", "car", "truck", "truck"]
+        self.models = ["v1", "v2", "v1", "v2"]
+
+    def write(self, shard_size: int = 1_000_000) -> eval.EvaluationStore:
+        path = self.get_temp_output_path() / 'store'
+        with eval.EvaluationStoreWriter(path, shard_size=shard_size) as writer:
+            for i, errors in enumerate(self.errors):
+                writer.add(errors, f"lap-{i}", vehicle=self.vehicles[i], track=f"track-{i % 2}", model=self.models[i])
+
+        return eval.EvaluationStore(path)
+
+    def test_tracks(self):
+        # A shard per track
+        store = self.write(shard_size=1)
+        self.assertEqual(4, len(store.index["shards"]))
+        self.assertEqual(4, len(store))
+        self.assertEqual(sum(len(errors.position_deltas) for errors in self.errors), store.n_lines)
+
+        tracks = store.tracks()
+        self.assertListEqual([f"lap-{i}" for i in range(4)], tracks["name"].tolist())
+        self.assertEqual(set(TRACK_METRICS), set(tracks) & set(TRACK_METRICS))
+
+        for i, errors in enumerate(self.errors):
+            evaluation = errors.evaluation()
+            self.assertEqual(evaluation.laptime.error, tracks["laptime_error"][i])
+            self.assertEqual(evaluation.position.rmse, tracks["position_rmse"][i])
+            self.assertEqual(evaluation.velocity.ci95, tracks["velocity_ci95"][i])
+
+        v1 = store.tracks(["name"], model="v1")
+        self.assertListEqual(["lap-0", "lap-2"], v1["name"].tolist())
+
+        with self.assertRaises(ValueError):
+            store.tracks(["position_delta"])
+
+    def test_lines(self):
+        store = self.write(shard_size=1000)
+        lines = store.lines(["name", "vehicle", "line", "apex", "position_delta"])
+
+        self.assertEqual(store.n_lines, len(lines["line"]))
+        np.testing.assert_array_equal(np.concatenate([errors.position_deltas for errors in self.errors]), lines["position_delta"])
+
+        apexes = store.lines(["name", "line"], apex=True)
+        for i, errors in enumerate(self.errors):
+            self.assertListEqual(sorted(errors.apexes), apexes["line"][apexes["name"] == f"lap-{i}"].tolist())
+
+        trucks = store.lines(["name"], vehicle="truck")
+        self.assertSetEqual({"lap-2", "lap-3"}, set(trucks["name"].tolist()))
+
+    def test_aggregate(self):
+        store = self.write(shard_size=1000)
+
+        for vehicle, result in store.aggregate("vehicle").items():
+            deltas = np.concatenate([
+                errors.velocity_deltas for errors, v in zip(self.errors, self.vehicles) if v == vehicle
+            ])
+
+            self.assertEqual(len(deltas), result["count"])
+            self.assertTrue(all(type(value) is float for name, value in result.items() if name != "count"))
+            self.assertAlmostEqual(np.mean(deltas), result["velocity_delta_mean"])
+            self.assertAlmostEqual(np.mean(np.abs(deltas)), result["velocity_delta_mean_absolute"])
+            self.assertAlmostEqual(np.sqrt(np.mean(np.square(deltas))), result["velocity_delta_rmse"])
+
+        results = store.aggregate(["model", "apex"], columns=["position_delta"])
+        self.assertSetEqual({("v1", False), ("v1", True), ("v2", False), ("v2", True)}, set(results))
+
+        apex_deltas = np.concatenate([
+            errors.position_deltas[errors.apexes] for errors, m in zip(self.errors, self.models) if m == "v2"
+        ])
+        self.assertEqual(len(apex_deltas), results[("v2", True)]["count"])
+        self.assertAlmostEqual(np.mean(np.abs(apex_deltas)), results[("v2", True)]["position_delta_mean_absolute"])
+
+        results = store.aggregate("track", level="tracks", model="v1")
+        self.assertSetEqual({"track-0"}, set(results))
+        self.assertEqual(2, results["track-0"]["count"])
+        self.assertAlmostEqual(
+            np.mean([self.errors[i].evaluation().position.rmse for i in (0, 2)]),
+            results["track-0"]["position_rmse_mean"]
+        )
+
+        with self.assertRaises(ValueError):
+            store.aggregate("vehicle", level="laps")
+
+    def test_append(self):
+        """Writers append to an existing store"""
+        self.write()
+        store = self.write()
+
+        self.assertEqual(2, len(store.index["shards"]))
+        self.assertEqual(8, len(store))
+
+        path = self.get_temp_output_path() / 'store'
+        with eval.EvaluationStoreWriter(path) as writer:
+            writer.add_evaluation(self.errors[0].evaluation(), "summary", model="v3")
+
+        store = eval.EvaluationStore(path)
+        self.assertEqual(9, len(store))
+        self.assertEqual(0, store.tracks(["n_lines"], model="v3")["n_lines"][0])
+        self.assertEqual(store.n_lines, len(store.lines(["line"])["line"]))
+
+    def test_single_writer(self):
+        """A store only takes one writer at a time"""
+        path = self.get_temp_output_path() / 'store'
+
+        writer = eval.EvaluationStoreWriter(path)
+        with self.assertRaises(FileExistsError):
+            eval.EvaluationStoreWriter(path)
+
+        writer.add(self.errors[0], "lap-0")
+        writer.close()
+        writer.close()
+
+        with eval.EvaluationStoreWriter(path) as writer:
+            writer.add(self.errors[1], "lap-1")
+
+        self.assertEqual(2, len(eval.EvaluationStore(path)))
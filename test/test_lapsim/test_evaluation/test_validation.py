@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+
+from lapsim import eval
+from lapsim.encoder.partition import Partition
+from lapsim.normalisation.transform_normalisation import TransformNormalisation
+from lapsim.normalisation.transforms.transformer import Transform
+from utils.test_base import TestBase
+
+
+"""Test the in-training validation metrics"""
+
+
+def circuit_lines(widths) -> np.ndarray:
+    """Seg. lines of the given widths spaced around a circle"""
+    angles = np.linspace(0, 2 * np.pi, len(widths), endpoint=False)
+    inner, outer = 100, 100 + np.asarray(widths)
+
+    return np.stack([
+        inner * np.cos(angles), inner * np.sin(angles),
+        outer * np.cos(angles), outer * np.sin(angles)
+    ], axis=1)
+
+
+class TestValidationMetrics(TestBase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.partition = Partition.load(self.get_lapsim_data_path() / 'encoded' / 'partition-1.json')
+        self.geometry = eval.ValidationGeometry([circuit_lines(widths) for widths in self.partition.widths])
+
+    def test_geometry(self):
+        self.assertEqual(3, len(self.geometry))
+        self.assertListEqual([len(x) for x in self.partition.widths], self.geometry.track_lengths)
+        np.testing.assert_allclose(np.concatenate(self.partition.widths), self.geometry.widths)
+
+        # Each track's first line loops back to its own last line
+        for start, length in zip(self.geometry.starts, self.geometry.track_lengths):
+            self.assertEqual(start + length - 1, self.geometry.previous[start])
+            self.assertEqual(start, self.geometry.previous[start + 1])
+
+        with self.assertRaises(ValueError):
+            eval.ValidationGeometry([np.zeros((0, 4))])
+
+    def test_save_and_load(self):
+        os.makedirs(self.get_temp_output_path())
+        path = self.get_temp_output_path() / 'geometry.npz'
+
+        self.geometry.save(path)
+        loaded = eval.ValidationGeometry.load(path)
+
+        self.assertListEqual(self.geometry.track_lengths, loaded.track_lengths)
+        np.testing.assert_array_equal(self.geometry.lines, loaded.lines)
+
+    def test_matches_evaluate(self):
+        """The metrics of each track match evaluating it on its own"""
+        rng = np.random.default_rng(0)
+        truth_pos = np.concatenate(self.partition.positions)
+        truth_vel = np.concatenate(self.partition.velocities)
+        predicted_pos = np.clip(truth_pos + rng.normal(0, 0.05, len(truth_pos)), 0, 1)
+        predicted_vel = truth_vel + rng.normal(0, 2, len(truth_vel))
+
+        metrics = eval.validation_metrics_arrays(self.geometry, truth_pos, truth_vel, predicted_pos, predicted_vel)
+        self.assertTupleEqual((3,), metrics.position_rmse.shape)
+
+        split = [self.geometry.split(values) for values in (truth_pos, truth_vel, predicted_pos, predicted_vel)]
+        for i, lines in enumerate(self.geometry.split(self.geometry.lines)):
+            evaluation = eval.evaluate_arrays(lines, *(values[i] for values in split))
+
+            self.assertAlmostEqual(evaluation.laptime.truth, metrics.laptime[i])
+            self.assertAlmostEqual(evaluation.laptime.predicted, metrics.predicted_laptime[i])
+            self.assertAlmostEqual(evaluation.laptime.error, metrics.laptime_error[i])
+
+            self.assertAlmostEqual(evaluation.position.mean, metrics.position_mean[i])
+            self.assertAlmostEqual(evaluation.position.mean_absolute, metrics.position_mean_absolute[i])
+            self.assertAlmostEqual(evaluation.position.rmse, metrics.position_rmse[i])
+
+            self.assertAlmostEqual(evaluation.velocity.mean, metrics.velocity_mean[i])
+            self.assertAlmostEqual(evaluation.velocity.mean_absolute, metrics.velocity_mean_absolute[i])
+            self.assertAlmostEqual(evaluation.velocity.rmse, metrics.velocity_rmse[i])
+
+        with self.assertRaises(ValueError):
+            eval.validation_metrics_arrays(self.geometry, truth_pos[1:], truth_vel, predicted_pos, predicted_vel)
+
+    def test_normalised_outputs(self):
+        """Scoring the normalised outputs matches scoring the denormalised traces"""
+        normaliser = TransformNormalisation(transform=Transform(method="lag", lag=5, sampling=2, patch_size=3))
+        normaliser.extend(self.partition)
+        _, targets, _ = normaliser.normalise_and_transform(self.partition)
+
+        # The targets score perfectly against themselves
+        metrics = eval.validation_metrics(normaliser, self.geometry, targets, targets)
+        np.testing.assert_allclose(metrics.laptime, metrics.predicted_laptime)
+        np.testing.assert_allclose(0, metrics.position_rmse, atol=1e-9)
+        np.testing.assert_allclose(0, metrics.velocity_rmse, atol=1e-9)
+        self.assertEqual(0, metrics.summary()["laptime_error"])
+
+        outputs = [targets[0] * 0.9, targets[1] * 1.1]
+        metrics = eval.validation_metrics(normaliser, self.geometry, outputs, targets)
+
+        positions, velocities = normaliser.detransform_and_denormalise_batch(self.geometry.track_lengths, *outputs)
+        expected = eval.validation_metrics_arrays(
+            self.geometry,
+            np.concatenate(self.partition.positions),
+            np.concatenate(self.partition.velocities),
+            np.concatenate(positions),
+            np.concatenate(velocities)
+        )
+
+        for name, value in expected.summary().items():
+            self.assertAlmostEqual(value, metrics.summary()[name])
+        self.assertTrue(np.all(metrics.position_rmse > 0))
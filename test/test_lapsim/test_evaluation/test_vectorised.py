@@ -0,0 +1,170 @@
+import dataclasses
+import json
+
+import numpy as np
+from toolkit import maths
+from toolkit.tracks.models import SegmentationLine, Track
+from toolkit.utils.spacial_map import SegmentGrid
+
+from lapsim.encoder.encoder import extract_features
+from utils.test_base import TestBase
+from lapsim import eval
+
+
+"""Test the array-native evaluation matches the evaluation of the track models"""
+
+
+class TestVectorisedEvaluation(TestBase):
+
+    def load_predicted(self, index: int):
+        truth = Track.parse_file(self.get_lapsim_data_path() / 'predicted' / f'ground-{index}.json')
+        predicted = Track.parse_file(self.get_lapsim_data_path() / 'predicted' / f'predicted-{index}.json')
+        return truth, predicted
+
+    def assertEvaluationsEqual(self, expected, actual):
+        self.assertListEqual(list(expected.apexes), list(actual.apexes))
+
+        for field, value in dataclasses.asdict(expected).items():
+            if field == "apexes":
+                continue
+
+            for name, expected_value in value.items():
+                actual_value = getattr(getattr(actual, field), name)
+                if expected_value is None:
+                    self.assertIsNone(actual_value, msg=f"{field}.{name}")
+                else:
+                    self.assertAlmostEqual(expected_value, actual_value, places=9, msg=f"{field}.{name}")
+
+    def test_line_angles(self):
+        with open(self.get_lapsim_data_path() / 'spliced' / '100586536.json') as file:
+            track = Track(**json.load(file)['track'])
+
+        lines, _, _ = eval.track_arrays(track)
+        _, angles, _ = extract_features(track.segmentations)
+
+        np.testing.assert_allclose(eval.line_angles(lines), angles, atol=1e-12)
+
+    def test_find_apexes(self):
+        with open(self.get_lapsim_data_path() / 'spliced' / '100586536.json') as file:
+            track = Track(**json.load(file)['track'])
+
+        lines, pos, _ = eval.track_arrays(track)
+        apexes = eval.find_apexes_arrays(pos, eval.line_angles(lines))
+
+        self.assertListEqual(eval.find_apexes(track.segmentations), apexes.tolist())
+
+    def test_laptime(self):
+        lines = np.array([[0, 0, 1, 0], [0, 10, 1, 10]], dtype=float)
+        self.assertEqual(4, eval.estimate_lap_time_arrays(lines, np.zeros(2), np.full(2, 5.)))
+
+        truth, _ = self.load_predicted(0)
+        self.assertAlmostEqual(eval.estimate_lap_time(truth), eval.estimate_lap_time_arrays(*eval.track_arrays(truth)))
+
+    def test_batched_laptimes(self):
+        truth, predicted = self.load_predicted(0)
+        lines, truth_pos, truth_vel = eval.track_arrays(truth)
+        _, predicted_pos, predicted_vel = eval.track_arrays(predicted)
+
+        rng = np.random.default_rng(0)
+        pos = np.stack([truth_pos, predicted_pos, rng.uniform(size=len(lines))])
+        vel = np.stack([truth_vel, predicted_vel, rng.uniform(10, 50, size=len(lines))])
+
+        laptimes, traces = eval.estimate_lap_times(lines, pos, vel, cumulative=True)
+
+        self.assertTupleEqual((3,), laptimes.shape)
+        self.assertTupleEqual((3, len(lines)), traces.shape)
+        for k in range(3):
+            self.assertAlmostEqual(eval.estimate_lap_time_arrays(lines, pos[k], vel[k]), laptimes[k], places=9)
+
+        # The traces start at 0 and increase up to the last line
+        np.testing.assert_array_equal(0, traces[:, 0])
+        self.assertTrue(np.all(np.diff(traces, axis=1) > 0))
+        self.assertTrue(np.all(traces[:, -1] < laptimes))
+
+        np.testing.assert_allclose(laptimes, eval.estimate_lap_times(lines, pos, vel))
+
+        with self.assertRaises(ValueError):
+            eval.estimate_lap_times(lines, pos[:, 1:], vel[:, 1:])
+
+    def test_evaluate(self):
+        for i in range(10):
+            truth, predicted = self.load_predicted(i)
+
+            truth_lines, truth_pos, truth_vel = eval.track_arrays(truth)
+            predicted_lines, predicted_pos, predicted_vel = eval.track_arrays(predicted)
+
+            self.assertEvaluationsEqual(
+                eval.evaluate(truth, predicted),
+                eval.evaluate_arrays(truth_lines, truth_pos, truth_vel, predicted_pos, predicted_vel, predicted_lines)
+            )
+
+    def test_evaluate2(self):
+        """`evaluate2` fails on normals without an intersection, so the errors of
+        each seg. line are compared instead"""
+        truth, predicted = self.load_predicted(0)
+
+        truth_lines, truth_pos, truth_vel = eval.track_arrays(truth)
+        predicted_lines, predicted_pos, predicted_vel = eval.track_arrays(predicted)
+
+        expected_errors, expected_percentages = eval.evaluate_position_errors_irrespective_of_smoothing(truth, predicted)
+        errors, percentages = eval.vectorised.position_errors_irrespective_of_smoothing(
+            truth_lines, truth_pos, predicted_lines, predicted_pos
+        )
+
+        to_array = lambda values: np.array([np.nan if v is None else v for v in values])
+        self.assertTrue(np.any(np.isnan(errors)))
+        np.testing.assert_allclose(to_array(expected_errors), errors)
+        np.testing.assert_allclose(to_array(expected_percentages), percentages)
+
+        evaluation = eval.evaluate2_arrays(truth_lines, truth_pos, truth_vel, predicted_pos, predicted_vel, predicted_lines)
+        self.assertAlmostEqual(np.nanmax(errors), evaluation.position.max)
+        self.assertAlmostEqual(np.nanmean(percentages), evaluation.position.percentage_mean)
+
+    def test_missing_errors(self):
+        """NaN errors are ignored, and the apex errors are taken from the
+        unfiltered errors"""
+        error = eval.evaluation_error(np.array([1., np.nan, -3., 2.]), np.array([10., np.nan, 30., 20.]), [2, 3])
+
+        self.assertEqual(3, error.max)
+        self.assertEqual(0, error.mean)
+        self.assertEqual(-0.5, error.apex_mean)
+        self.assertEqual(3, error.apex_max)
+        self.assertEqual(30, error.percentage_max)
+
+        error = eval.evaluation_error(np.array([1., 2.]), np.array([1., 2.]), [])
+        self.assertIsNone(error.apex_mean)
+
+    def test_track_arrays(self):
+        lines, pos, vel = eval.track_arrays(Track(segmentations=[SegmentationLine(x1=0, y1=1, x2=2, y2=3, pos=0.5, vel=4)]))
+
+        np.testing.assert_array_equal(lines, [[0, 1, 2, 3]])
+        np.testing.assert_array_equal(pos, [0.5])
+        np.testing.assert_array_equal(vel, [4])
+
+    def test_racing_line_intersections(self):
+        """The grid indexed intersections are identical to testing every segment"""
+        for i in range(10):
+            truth, predicted = self.load_predicted(i)
+
+            true_racing_line = eval.calculate_optimal_positions(truth)
+            normals = maths.create_line_normals_from_points(true_racing_line, 10)
+            segments = maths.points_to_lines(
+                maths.catmull_rom_spline(eval.calculate_optimal_positions(predicted).tolist(), 5, True)
+            )
+
+            self.assertListEqual(
+                [maths.segment_intersections(normal, segments) for normal in normals],
+                eval.racing_line_intersections(normals, segments)
+            )
+
+    def test_segment_grid(self):
+        segments = np.array([[0, 0, 1, 1], [15, 15, 25, 15], [100, 100, 101, 100]], dtype=float)
+        grid = SegmentGrid(segments, cell_size=10)
+
+        candidates = grid.query(np.array([[0.5, -1, 0.5, 2], [20, 0, 20, 10], [-50, -50, -40, -40]]))
+
+        self.assertListEqual([0], candidates[0].tolist())
+        self.assertListEqual([1], candidates[1].tolist())
+        self.assertListEqual([], candidates[2].tolist())
+
+        self.assertListEqual([[]], [c.tolist() for c in SegmentGrid(np.zeros((0, 4)), 10).query(np.zeros((1, 4)))])
@@ -0,0 +1,139 @@
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from lapsim.normalisation import TransformNormalisation, DiskTransformCache, MemoryTransformCache
+from lapsim.normalisation.cache import cache_key
+from lapsim.encoder.partition import Partition
+from lapsim.normalisation.transforms.transformer import Transform
+from utils.test_base import TestBase
+
+
+class TestTransformCache(TestBase):
+
+    def setUp(self):
+        self.partition_path = self.get_lapsim_data_path() / 'encoded' / 'partition-1.json'
+        self.partition = Partition.load(self.partition_path)
+
+        self.normaliser = TransformNormalisation(transform=Transform(method="flat-window", foresight=5, sampling=1))
+        self.normaliser.extend(self.partition)
+
+    def test_cache_key(self):
+        """Test the key changes with the partition and the transform settings"""
+        key = cache_key(self.normaliser, partition_path=self.partition_path)
+
+        self.assertEqual(key, cache_key(self.normaliser.model_copy(deep=True), partition_path=self.partition_path))
+        self.assertNotEqual(key, cache_key(self.normaliser, partition=self.partition))
+
+        other = self.normaliser.model_copy(deep=True)
+        other.transform.foresight = 6
+        self.assertNotEqual(key, cache_key(other, partition_path=self.partition_path))
+
+        other = self.normaliser.model_copy(deep=True)
+        other.transform.decimation = 0.5
+        self.assertEqual(key, cache_key(other, partition_path=self.partition_path))
+
+    def test_disk_cache(self):
+        """Test the cached transform is read back memory mapped"""
+        with tempfile.TemporaryDirectory() as directory:
+            cache = DiskTransformCache(directory)
+
+            expected_x, (expected_pos, expected_vel), expected_vehicles = self.normaliser.normalise_and_transform(
+                self.partition)
+
+            key = cache_key(self.normaliser, partition_path=self.partition_path)
+            self.assertIsNone(cache.get(key))
+
+            for _ in range(2):
+                x, (y_pos, y_vel), vehicles = cache.load_and_transform(self.normaliser, self.partition_path)
+
+                self.assertTrue(np.array_equal(expected_x, x))
+                self.assertTrue(np.array_equal(expected_pos, y_pos))
+                self.assertTrue(np.array_equal(expected_vel, y_vel))
+                self.assertTrue(np.array_equal(expected_vehicles, vehicles))
+
+            self.assertIsInstance(x, np.memmap)
+            self.assertListEqual([key], [entry[0] for entry in cache.entries()])
+
+    def test_disk_cache_eviction(self):
+        """Test the least recently used entries are evicted"""
+        with tempfile.TemporaryDirectory() as directory:
+            cache = DiskTransformCache(directory)
+            result = (np.zeros((100, 10)), [np.zeros((100, 3))], np.zeros((100, 2)))
+
+            for key in ["a", "b", "c"]:
+                cache.put(key, result)
+
+            # Use the oldest entry so the second entry is the least recently used
+            entry_size = cache.size_bytes() // 3
+            os.utime(Path(directory) / "b", ns=(1, 1))
+            os.utime(Path(directory) / "c", ns=(2, 2))
+            os.utime(Path(directory) / "a", ns=(3, 3))
+
+            cache.max_bytes = entry_size * 3
+            cache.put("d", result)
+
+            self.assertListEqual(["c", "a", "d"], [entry[0] for entry in cache.entries()])
+            self.assertIsNone(cache.get("b"))
+
+            self.assertRaises(ValueError, lambda: cache.put("e", ([np.zeros(3)], [], np.zeros(1))))
+
+    def test_memory_cache(self):
+        """Test the memory cache counts hits and misses and evicts the least
+        recently used entries to stay within the budget"""
+        result = (np.zeros((100, 10)), [np.zeros((100, 3))], np.zeros((100, 2)))
+        size = 100 * 15 * 8
+
+        cache = MemoryTransformCache(max_bytes=size * 2)
+        cache.put("a", result)
+        cache.put("b", result)
+
+        self.assertIs(result, cache.get("a"))
+        self.assertIsNone(cache.get("c"))
+
+        # Cached results are read-only, so callers can't change them in place
+        x, outputs, vehicles = result
+        for array in [x, *outputs, vehicles]:
+            with self.assertRaises(ValueError):
+                array[0] = 1
+
+        cache.put("c", result)
+        self.assertListEqual(["a", "c"], [key for key in ["a", "b", "c"] if key in cache])
+        self.assertEqual(size * 2, cache.size_bytes())
+        self.assertTupleEqual((1, 1), (cache.hits, cache.misses))
+
+        # Results larger than the budget aren't cached, but are still read-only
+        oversized = (np.zeros((1000, 10)), [np.zeros((1000, 3))], np.zeros(1))
+        cache.put("d", oversized)
+        self.assertNotIn("d", cache)
+        self.assertEqual(2, len(cache))
+
+        x, outputs, vehicles = oversized
+        for array in [x, *outputs, vehicles]:
+            with self.assertRaises(ValueError):
+                array[0] = 1
+
+        # As are the results transformed on a miss
+        x, _, _ = MemoryTransformCache(max_bytes=1).normalise_and_transform(self.normaliser, self.partition)
+        self.assertFalse(x.flags.writeable)
+
+    def test_async_loader_cache(self):
+        """Test the async loader reads the transform from the cache after the
+        first load"""
+        cache = MemoryTransformCache(max_bytes=1 << 30)
+        expected_x, _, _ = self.normaliser.normalise_and_transform(self.partition)
+
+        for _ in range(3):
+            loader = self.normaliser.async_load_and_normalise_partition(self.partition_path, cache=cache)
+            loader.join()
+
+            self.assertTrue(np.array_equal(expected_x, loader.normalisation[0]))
+
+        self.assertTupleEqual((2, 1), (cache.hits, cache.misses))
+
+        # Loaded partitions are keyed by their content rather than their file
+        result = cache.normalise_and_transform(self.normaliser, self.partition)
+        self.assertIs(result, cache.normalise_and_transform(self.normaliser, self.partition))
+        self.assertTupleEqual((3, 2), (cache.hits, cache.misses))
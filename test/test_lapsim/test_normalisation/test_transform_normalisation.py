@@ -1,5 +1,8 @@
+import numpy as np
+
 from lapsim.encoder.partition import Partition
 from lapsim.normalisation.transform_normalisation import TransformNormalisation
+from lapsim.normalisation.transforms.transformer import Transform
 from utils.test_base import TestBase
 
 
@@ -89,3 +92,29 @@ class TestTransformNormalisationFunctionality(TestBase):
         self.assertTupleEqual((1174, 16), vehicles.shape)
         self.assertTupleEqual((1174, 5), y_pos.shape)
         self.assertTupleEqual((1174, 5), y_vel.shape)
+
+    def test_batch_detransform(self):
+        """Test detransforming a whole partition at once matches detransforming
+        each track"""
+        partition = Partition.load(self.get_lapsim_data_path() / 'encoded' / 'partition-1.json')
+        track_lengths = [len(x) for x in partition.widths]
+
+        for transform in [
+            Transform(method="flat-window", foresight=3, sampling=2),
+            Transform(method="lag", lag=5, sampling=2, patch_size=3),
+            Transform(method="bidirectional", sampling=1, patch_size=2),
+            Transform(method="stateful-lag", lag=5, sampling=2, patch_size=3),
+        ]:
+            normaliser = TransformNormalisation(transform=transform).extend(partition)
+            _, outputs, _ = normaliser.normalise_and_transform(partition)
+
+            # The stateful lag outputs a list of targets per track
+            if transform.method == "stateful-lag":
+                outputs = [np.concatenate([track[i] for track in outputs]) for i in range(2)]
+
+            positions, velocities = normaliser.detransform_and_denormalise_batch(track_lengths, *outputs)
+            self.assertEqual(3, len(positions))
+
+            for i in range(len(partition.widths)):
+                self.assertFloatListEqual(positions[i], partition.positions[i])
+                self.assertFloatListEqual(velocities[i], partition.velocities[i])
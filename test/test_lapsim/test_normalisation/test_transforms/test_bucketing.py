@@ -0,0 +1,47 @@
+import numpy as np
+
+from lapsim.encoder.partition import Partition
+from lapsim.normalisation import TransformNormalisation
+from lapsim.normalisation.transforms.bucketing import bucket_track_indexes, bucket_batches
+from lapsim.normalisation.transforms.transformer import Transform
+from test_lapsim.test_normalisation.test_transforms.test_transform_base import TestTransformBase
+
+
+class TestBucketing(TestTransformBase):
+
+    def test_bucket_track_indexes(self):
+        """Test tracks are grouped by length and keep their original order"""
+        self.assertListEqual(bucket_track_indexes([743, 463, 1013], 1), [[0, 1, 2]])
+        self.assertListEqual(bucket_track_indexes([743, 463, 1013], 3), [[1], [0], [2]])
+        self.assertListEqual(bucket_track_indexes([10, 500, 12, 480], 2), [[0, 2], [1, 3]])
+        self.assertListEqual(bucket_track_indexes([], 2), [])
+
+    def test_bucketed_lag_transform(self):
+        """Test each bucket is only padded to its longest track and the rows
+        match the unbucketed transform"""
+        partition = Partition.load(self.get_lapsim_data_path() / 'encoded' / 'partition-1.json')
+        normaliser = TransformNormalisation(transform=Transform(method="lag", lag=20, sampling=4)).extend(partition)
+
+        x, (y_pos, y_vel), vehicles = normaliser.normalise_and_transform(partition)
+        buckets = normaliser.normalise_and_transform_bucketed(partition, n_buckets=3)
+
+        self.assertListEqual([b.track_indexes for b in buckets], [[1], [0], [2]])
+        self.assertListEqual([b.x.shape[1] for b in buckets], [926, 1486, 2026])
+
+        track_starts = np.cumsum([0] + [len(w) for w in partition.widths])
+        for bucket in buckets:
+            t_idx = bucket.track_indexes[0]
+            rows = slice(track_starts[t_idx], track_starts[t_idx + 1])
+
+            self.assertTrue(np.array_equal(bucket.x, x[rows, -bucket.x.shape[1]:]))
+            self.assertTrue(np.array_equal(bucket.outputs[0], y_pos[rows]))
+            self.assertTrue(np.array_equal(bucket.vehicles, vehicles[rows]))
+
+        # Test every row is visited once and batches don't span buckets
+        visited = 0
+        for bucket, batch in bucket_batches(buckets, batch_size=100):
+            self.assertLessEqual(len(batch), 100)
+            self.assertLess(np.max(batch), len(bucket))
+            visited += len(batch)
+
+        self.assertEqual(x.shape[0], visited)
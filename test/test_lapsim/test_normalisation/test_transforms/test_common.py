@@ -0,0 +1,78 @@
+import numpy as np
+
+from lapsim.encoder.partition import Partition
+from lapsim.normalisation import TransformNormalisation
+from lapsim.normalisation.transforms.common import patchify, patchify_batch, combine
+from lapsim.normalisation.transforms.shared import SharedArrays
+from lapsim.normalisation.transforms.transformer import Transform
+from test_lapsim.test_normalisation.test_transforms.test_transform_base import TestTransformBase
+
+
+class TestTransformCommon(TestTransformBase):
+
+    def test_patchify(self):
+        """Test the track is padded at the start and split into patches"""
+        x = np.arange(13).reshape((13, 1))
+
+        patched = patchify(x, patch_size=5)
+        self.assert2dFloatListAlmostEqual(patched, [
+            [-1, -1, 0, 1, 2],
+            [3, 4, 5, 6, 7],
+            [8, 9, 10, 11, 12]
+        ])
+
+        # Multiple features are interleaved by seg. line
+        x = combine(list(range(4)), list(range(10, 14)))
+        self.assertTupleEqual((4, 2), x.shape)
+
+        patched = patchify(x, patch_size=3)
+        self.assert2dFloatListAlmostEqual(patched, [
+            [-1, -1, -1, -1, 0, 10],
+            [1, 11, 2, 12, 3, 13]
+        ])
+
+        self.assertIs(x, patchify(x, patch_size=1))
+
+    def test_patchify_batch(self):
+        """Test patching a batch matches patching each item"""
+        batch = np.random.random((4, 11, 3))
+        patched = patchify_batch(batch, patch_size=4)
+
+        self.assertTupleEqual((4, 3, 12), patched.shape)
+        for i in range(len(batch)):
+            self.assertTrue(np.array_equal(patchify(batch[i], patch_size=4), patched[i]))
+
+    def test_shared_parallel_transforms(self):
+        """Test transforming over shared memory matches the serial transform"""
+        partition = Partition.load(self.get_lapsim_data_path() / 'encoded' / 'partition-1.json')
+
+        for method in ["window", "flat-window", "lag", "bidirectional"]:
+            normaliser = TransformNormalisation(transform=Transform(method=method, foresight=5, lag=5, sampling=1))
+            normaliser.extend(partition)
+
+            serial_x, _, _ = normaliser.normalise_and_transform(partition, cores=1)
+            parallel_x, _, _ = normaliser.normalise_and_transform(partition, cores=2)
+
+            self.assertTrue(np.array_equal(serial_x, parallel_x), method)
+
+    def test_take_shared_output(self):
+        """Test an array taken from shared memory keeps its values and stays
+        mapped while any view of it is alive"""
+        shared = SharedArrays.allocate({"a": ((4, 3), np.float32), "b": ((0, 2), np.float64)})
+        shared["a"][...] = np.arange(12).reshape((4, 3))
+
+        attached = SharedArrays.attach(shared.descriptor())
+        attached["a"][0, 0] = -1
+        attached.close()
+
+        a = shared.take("a")
+        self.assertTrue(a.flags.writeable)
+        self.assertListEqual([-1, 1, 2], a[0].tolist())
+
+        view = a[2:]
+        del a
+        self.assertListEqual([[6, 7, 8], [9, 10, 11]], view.tolist())
+
+        # The block is unlinked once taken
+        with self.assertRaises(FileNotFoundError):
+            SharedArrays.attach(shared.descriptor())
@@ -0,0 +1,68 @@
+import numpy as np
+
+from lapsim.encoder.partition import Partition
+from lapsim.normalisation import TransformNormalisation
+from lapsim.normalisation.transforms.transformer import Transform
+from lapsim.normalisation.transforms.window.dilated_window import dilated_offsets, pooling_intervals
+from test_lapsim.test_normalisation.test_transforms.test_transform_base import TestTransformBase
+
+
+class TestDilatedWindowTransform(TestTransformBase):
+
+    def test_dilated_offsets(self):
+        """Test the seg. lines are sampled densely then at growing strides up
+        to the foresight"""
+        self.assertListEqual(dilated_offsets(20, 2, 2).tolist(), [
+            -20, -17, -9, -5, -3, -2, -1, 0, 1, 2, 3, 5, 9, 17, 20
+        ])
+        self.assertListEqual(dilated_offsets(10, 1, 3).tolist(), [-10, -5, -2, -1, 0, 1, 2, 5, 10])
+        self.assertListEqual(dilated_offsets(3, 5).tolist(), [-3, -2, -1, 0, 1, 2, 3])
+        self.assertEqual(31, len(dilated_offsets(120, 8, 2)))
+
+        starts, ends = pooling_intervals(dilated_offsets(10, 1, 3))
+        self.assertListEqual(starts.tolist(), [-10, -5, -2, -1, 0, 1, 2, 3, 6])
+        self.assertListEqual(ends.tolist(), [-6, -3, -2, -1, 0, 1, 2, 5, 10])
+
+        self.assertRaises(ValueError, lambda: dilated_offsets(10, 1, 1))
+
+    def test_dilated_window_transform_real(self):
+        """Test the dilated window samples and pools the seg. lines around each
+        seg. line"""
+        partition = Partition.load(self.get_lapsim_data_path() / 'encoded' / 'partition-1.json')
+
+        # A dense foresight covering the foresight is the flat-window
+        flat = TransformNormalisation(transform=Transform(method="flat-window", foresight=6, sampling=1))
+        dense = TransformNormalisation(transform=Transform(
+            method="dilated-window", foresight=6, sampling=1, dense_foresight=6))
+
+        flat_x, flat_y, flat_vehicles = flat.extend(partition).normalise_and_transform(partition)
+        dense_x, dense_y, dense_vehicles = dense.extend(partition).normalise_and_transform(partition)
+
+        self.assertTrue(np.allclose(flat_x, dense_x))
+        self.assertTrue(np.array_equal(flat_y[0], dense_y[0]))
+        self.assertTrue(np.array_equal(flat_vehicles, dense_vehicles))
+
+        for pooling in [False, True]:
+            normaliser = TransformNormalisation(transform=Transform(
+                method="dilated-window", foresight=40, sampling=1, dense_foresight=4, dilation_pooling=pooling))
+            normaliser.extend(partition)
+
+            x, _, _ = normaliser.normalise_and_transform(partition, cores=2)
+            normalised = normaliser.bounds.normalise(partition, normaliser.transform.vectorise_vehicles(partition.vehicles))
+
+            offsets = dilated_offsets(40, 4)
+            starts, ends = pooling_intervals(offsets)
+            self.assertTupleEqual((normalised.normals_count(), 3 * len(offsets)), x.shape)
+
+            # Check the windows of the first track, which loop around the track
+            widths = np.array(normalised.widths[0])
+            for row in [0, 17, len(widths) - 1]:
+                if pooling:
+                    expected = [
+                        np.mean(widths[np.arange(row + start, row + end + 1) % len(widths)])
+                        for start, end in zip(starts, ends)
+                    ]
+                else:
+                    expected = widths[(row + offsets) % len(widths)]
+
+                self.assertTrue(np.allclose(expected, x[row, :len(offsets)], atol=1e-6))
@@ -0,0 +1,73 @@
+import os
+import unittest
+
+import numpy as np
+
+from lapsim.encoder.partition import Partition
+from lapsim.normalisation import TransformNormalisation
+from lapsim.normalisation.transforms.executor import (
+    AutoExecutor, SerialExecutor, ThreadExecutor, ProcessExecutor, create_executor
+)
+from lapsim.normalisation.transforms.transformer import Transform
+from test_lapsim.test_normalisation.test_transforms.test_transform_base import TestTransformBase
+
+
+def _shared_mappings(_) -> list:
+    """The shared memory blocks mapped by the current process"""
+    with open("/proc/self/maps") as maps:
+        return [line.split()[-1] for line in maps if "/dev/shm/psm_" in line]
+
+
+class TestExecutor(TestTransformBase):
+
+    def test_executors_match_serial(self):
+        """Test each executor produces the serial transform and persists
+        between transforms"""
+        partition = Partition.load(self.get_lapsim_data_path() / 'encoded' / 'partition-1.json')
+        normaliser = TransformNormalisation(transform=Transform(method="lag", lag=5, sampling=1)).extend(partition)
+
+        expected_x, _, _ = normaliser.normalise_and_transform(partition)
+
+        for mode in ["serial", "thread", "process"]:
+            executor = normaliser.set_executor(mode, workers=2)
+
+            for _ in range(2):
+                x, _, _ = normaliser.normalise_and_transform(partition)
+                self.assertTrue(np.array_equal(expected_x, x), mode)
+
+            if mode != "serial":
+                self.assertIsNotNone(executor._pool)
+
+            normaliser.shutdown()
+            self.assertIsNone(getattr(executor, "_pool", None))
+
+    def test_auto_executor_select(self):
+        """Test small partitions are transformed serially and the pool only
+        grows for larger partitions"""
+        with AutoExecutor(workers=4, min_parallel_normals=1000, normals_per_worker=1000) as executor:
+            self.assertIsInstance(executor.select(n_tracks=1, n_normals=100000), SerialExecutor)
+            self.assertIsInstance(executor.select(n_tracks=10, n_normals=500), SerialExecutor)
+
+            pool = executor.select(n_tracks=10, n_normals=2500)
+            self.assertIsInstance(pool, ProcessExecutor)
+            self.assertEqual(2, pool.workers)
+
+            self.assertIs(pool, executor.select(n_tracks=10, n_normals=1500))
+            self.assertEqual(4, executor.select(n_tracks=10, n_normals=100000).workers)
+
+        self.assertIsInstance(create_executor("thread", 2), ThreadExecutor)
+        self.assertRaises(ValueError, lambda: create_executor("gpu"))
+
+    @unittest.skipUnless(os.path.exists("/proc/self/maps"), "Requires /proc")
+    def test_process_workers_release_shared_memory(self):
+        """Test the persistent workers don't keep the shared blocks of a
+        transform mapped once it's complete"""
+        partition = Partition.load(self.get_lapsim_data_path() / 'encoded' / 'partition-1.json')
+        normaliser = TransformNormalisation(transform=Transform(method="lag", lag=5, sampling=1)).extend(partition)
+
+        executor = normaliser.set_executor("process", workers=2)
+        try:
+            normaliser.normalise_and_transform(partition)
+            self.assertListEqual([[]] * 8, executor.map(_shared_mappings, range(8)))
+        finally:
+            normaliser.shutdown()
@@ -0,0 +1,48 @@
+import numpy as np
+
+from lapsim.encoder.partition import Partition
+from lapsim.normalisation import TransformNormalisation
+from lapsim.normalisation.transforms.quantisation import QuantisedArray, quantise, dequantised_batches
+from lapsim.normalisation.transforms.transformer import Transform
+from test_lapsim.test_normalisation.test_transforms.test_transform_base import TestTransformBase
+
+
+class TestQuantisation(TestTransformBase):
+
+    def test_quantise(self):
+        """Test the quantised array dequantises within half a step"""
+        array = np.random.uniform(-1, 1, (50, 3, 7))
+
+        for dtype, levels in [("uint8", 255), ("int16", 65535)]:
+            quantised = quantise(array, dtype)
+
+            self.assertEqual(np.dtype(dtype), quantised.values.dtype)
+            self.assertLessEqual(np.max(np.abs(quantised.dequantise() - array)), (2 / levels) / 2 + 1e-6)
+            self.assertTrue(np.array_equal(quantised.dequantise([3, 1]), quantised.dequantise()[[3, 1]]))
+
+        # Constant arrays are exact
+        self.assertTrue(np.array_equal(quantise(np.full(4, -1.)).dequantise(), np.full(4, -1.)))
+        self.assertRaises(ValueError, lambda: quantise(array, "int4"))
+
+    def test_quantised_transform(self):
+        """Test the quantised transform matches the float transform and is
+        iterated through in dequantised batches"""
+        partition = Partition.load(self.get_lapsim_data_path() / 'encoded' / 'partition-1.json')
+        normaliser = TransformNormalisation(transform=Transform(method="window", foresight=10, sampling=1))
+        normaliser.extend(partition)
+
+        x, (y_pos, _), _ = normaliser.normalise_and_transform(partition)
+        quantised, (q_pos, _), _ = normaliser.normalise_and_transform(partition, quantisation="int16")
+
+        self.assertIsInstance(quantised, QuantisedArray)
+        self.assertEqual(x.size * 2, quantised.nbytes)
+        self.assertTrue(np.allclose(x, quantised.dequantise(), atol=quantised.scale))
+        self.assertTrue(np.array_equal(y_pos, q_pos))
+
+        visited = []
+        for batch, batch_x in dequantised_batches(quantised, batch_size=256):
+            self.assertEqual(np.float32, batch_x.dtype)
+            self.assertTrue(np.allclose(x[batch], batch_x, atol=quantised.scale))
+            visited.extend(batch.tolist())
+
+        self.assertListEqual(list(range(len(x))), sorted(visited))
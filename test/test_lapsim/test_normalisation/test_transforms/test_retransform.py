@@ -0,0 +1,50 @@
+import numpy as np
+
+from lapsim.encoder.partition import Partition
+from lapsim.normalisation import TransformNormalisation
+from lapsim.normalisation.transforms.transformer import Transform
+from lapsim.normalisation.transforms.window.base import affected_window_rows
+from test_lapsim.test_normalisation.test_transforms.test_transform_base import TestTransformBase
+
+
+class TestRetransform(TestTransformBase):
+
+    def test_affected_window_rows(self):
+        """Test the rows within the foresight of the edit are affected, looping
+        around the track"""
+        self.assertListEqual(affected_window_rows(20, 5, 7, 2).tolist(), [3, 4, 5, 6, 7, 8])
+        self.assertListEqual(affected_window_rows(20, 0, 1, 2).tolist(), [0, 1, 2, 18, 19])
+        self.assertListEqual(affected_window_rows(10, 2, 5, 3).tolist(), [0, 1, 2, 3, 4, 5, 6, 7, 9])
+        self.assertListEqual(affected_window_rows(10, 2, 5, 4).tolist(), list(range(10)))
+
+    def test_retransform_track(self):
+        """Test re-transforming an edited track only updates the affected rows
+        and matches transforming the whole edited track"""
+        partition = Partition.load(self.get_lapsim_data_path() / 'encoded' / 'partition-1.json')
+
+        for method in ["window", "flat-window"]:
+            normaliser = TransformNormalisation(transform=Transform(method=method, foresight=10, sampling=1))
+            normaliser.extend(partition)
+
+            track = partition.subset([1])
+            x, _, _ = normaliser.normalise_and_transform(track)
+
+            # Edit a few seg. lines near the end of the track
+            edited = track.model_copy(deep=True)
+            for line in range(455, 460):
+                edited.widths[0][line] *= 0.9
+                edited.angles[0][line] += 0.01
+
+            expected_x, _, _ = normaliser.normalise_and_transform(edited)
+
+            updated_x = x.copy()
+            rows = normaliser.retransform_track(updated_x, edited, 455, 460)
+
+            self.assertListEqual(rows.tolist(), [0, 1, 2, 3, 4, 5, 6] + list(range(445, 463)))
+            self.assertTrue(np.allclose(expected_x, updated_x))
+
+            unaffected = np.setdiff1d(np.arange(len(x)), rows)
+            self.assertTrue(np.array_equal(x[unaffected], updated_x[unaffected]))
+
+        normaliser = TransformNormalisation(transform=Transform(method="lag", lag=1, sampling=1)).extend(partition)
+        self.assertRaises(NotImplementedError, lambda: normaliser.retransform_track(x, partition, 0, 1))
@@ -0,0 +1,33 @@
+import numpy as np
+
+from lapsim.normalisation.transforms.sampling import target_indexes
+from lapsim.normalisation.transforms.transformer import compile_transform
+from utils.test_base import TestBase
+
+
+class TestSampling(TestBase):
+
+    def test_target_indexes(self):
+        """Test the target indexes loop around the track and are cached"""
+        indexes = target_indexes(6, sampling=1, lag=2, patch_size=2)
+
+        # Starts patch_size * (sampling + 1) - 1 + lag lines before the line
+        self.assertTupleEqual((6, 6), indexes.shape)
+        self.assertListEqual(indexes[0].tolist(), [1, 2, 3, 4, 5, 0])
+        self.assertListEqual(indexes[5].tolist(), [0, 1, 2, 3, 4, 5])
+
+        # Large sampling loops the track multiple times
+        self.assertListEqual(target_indexes(2, sampling=2)[0].tolist(), [0, 1, 0, 1, 0])
+
+        self.assertIs(indexes, target_indexes(6, sampling=1, lag=2, patch_size=2))
+        self.assertFalse(indexes.flags.writeable)
+
+    def test_partition_target_indexes(self):
+        """Test the indexes of each track are offset by the preceding tracks"""
+        indexes = compile_transform("window", sampling=1).partition_target_indexes([3, 4])
+
+        self.assertTupleEqual((7, 3), indexes.shape)
+        self.assertTrue(np.array_equal(indexes[:3], target_indexes(3, sampling=1)))
+        self.assertTrue(np.array_equal(indexes[3:], target_indexes(4, sampling=1) + 3))
+
+        self.assertTupleEqual((0, 3), compile_transform("window", sampling=1).partition_target_indexes([]).shape)
@@ -2,7 +2,10 @@ import math
 
 import numpy as np
 
+from lapsim.encoder.partition import Partition
+from lapsim.normalisation import TransformNormalisation
 from lapsim.normalisation.transforms.sampling import loop_track_for_patching_sampling
+from lapsim.normalisation.transforms.transformer import Transform
 from test_lapsim.test_normalisation.test_transforms.test_transform_base import TestTransformBase
 
 
@@ -113,3 +116,33 @@ class TestStatefulLagNormalisationTransform(TestTransformBase):
             self.assertFloatListEqual(pred_pos, partition.positions[i])
             self.assertFloatListEqual(pred_vel, partition.velocities[i])
             global_normal_index += track_length
+
+    def test_packed_transform(self):
+        """Test the packed transform pads each track's sequence and targets at
+        the start and matches the per track transform"""
+        partition = Partition.load(self.get_lapsim_data_path() / 'encoded' / 'partition-1.json')
+        normaliser = TransformNormalisation(
+            transform=Transform(method="stateful-lag", lag=10, sampling=2, patch_size=3, time_to_vec=True))
+        normaliser.extend(partition)
+
+        inputs, outputs, vehicles = normaliser.normalise_and_transform(partition)
+
+        for cores in [1, 2]:
+            x, (y_pos, y_vel), packed_vehicles, lengths = normaliser.normalise_and_transform_packed(partition, cores)
+
+            self.assertListEqual([len(track) for track in inputs], lengths.tolist())
+            self.assertTupleEqual((3, max(lengths), inputs[0].shape[1]), x.shape)
+            self.assertTupleEqual((3, max(lengths), outputs[0][0].shape[1]), y_pos.shape)
+
+            for t_idx, length in enumerate(lengths):
+                self.assertTrue(np.allclose(inputs[t_idx], x[t_idx, -length:]))
+                self.assertTrue(np.all(x[t_idx, :-length] == -1))
+
+                target_length = len(outputs[t_idx][0])
+                self.assertTrue(np.array_equal(outputs[t_idx][0], y_pos[t_idx, -target_length:]))
+                self.assertTrue(np.array_equal(outputs[t_idx][1], y_vel[t_idx, -target_length:]))
+                self.assertTrue(np.all(y_pos[t_idx, :-target_length] == -1))
+
+                self.assertTrue(np.allclose(vehicles[t_idx], packed_vehicles[t_idx]))
+
+        self.assertRaises(ValueError, lambda: TransformNormalisation().extend(partition).normalise_and_transform_packed(partition))
@@ -0,0 +1,43 @@
+import numpy as np
+
+from lapsim.normalisation.transforms.subsampling import subsample_indexes, subsample_batches
+from lapsim.normalisation.transforms.transformer import Transform
+from utils.test_base import TestBase
+
+
+class TestSubsampling(TestBase):
+
+    def test_subsample_indexes(self):
+        """Test decimation drops rows within each track and repeats redraw them"""
+        rng = np.random.default_rng(0)
+        self.assertListEqual(subsample_indexes([3, 2]).tolist(), [0, 1, 2, 3, 4])
+
+        indexes = subsample_indexes([10, 4, 1], decimation=0.5, rng=rng)
+        self.assertEqual(5 + 2 + 1, len(indexes))
+        self.assertTrue(np.all(np.diff(indexes[:5]) > 0))
+        self.assertTrue(np.all(indexes[:5] < 10))
+        self.assertTrue(np.all((indexes[5:7] >= 10) & (indexes[5:7] < 14)))
+        self.assertEqual(14, indexes[-1])
+
+        # Each track is drawn between 1 and random_repeats times
+        for _ in range(10):
+            indexes = subsample_indexes([10], decimation=0.2, random_repeats=3, rng=rng)
+            self.assertIn(len(indexes), [8, 16, 24])
+            self.assertEqual(len(indexes) // 8, np.max(np.bincount(indexes)))
+
+        self.assertRaises(ValueError, lambda: subsample_indexes([10], decimation=1))
+        self.assertRaises(ValueError, lambda: subsample_indexes([10], random_repeats=0))
+
+    def test_subsample_batches(self):
+        """Test every drawn row is batched once"""
+        transform = Transform(method="window", foresight=2, sampling=1, decimation=0.25, random_repeats=2)
+        rng = np.random.default_rng(0)
+
+        indexes = transform.subsample_indexes([20, 12], rng=np.random.default_rng(1))
+        batches = list(transform.subsample_batches([20, 12], batch_size=5, rng=np.random.default_rng(1)))
+
+        self.assertTrue(all(len(batch) <= 5 for batch in batches))
+        self.assertListEqual(sorted(indexes.tolist()), sorted(np.concatenate(batches).tolist()))
+        self.assertListEqual(list(subsample_batches(np.arange(3), 2, shuffle=False, rng=rng))[1].tolist(), [2])
+
+        self.assertRaises(ValueError, lambda: Transform(method="stateful-lag").subsample_indexes([10]))
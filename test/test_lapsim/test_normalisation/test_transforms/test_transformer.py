@@ -0,0 +1,140 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from lapsim.encoder.partition import Partition
+from lapsim.normalisation import TransformNormalisation
+from lapsim.normalisation.transforms.transformer import Transform, PLAN_CACHE_SIZE, compile_transform, _compile_plan
+from test_lapsim.test_normalisation.test_transforms.test_transform_base import TestTransformBase
+
+
+class TestTransformer(TestTransformBase):
+
+    def test_compiled_plans(self):
+        """Test plans are shared per configuration, immutable and cache their
+        target indexes"""
+        plan = Transform(method="window", foresight=3, sampling=1).get_transform()
+
+        self.assertIs(plan, Transform(method="window", foresight=3, sampling=1).get_transform())
+        self.assertIsNot(plan, Transform(method="window", foresight=4, sampling=1).get_transform())
+
+        with self.assertRaises(AttributeError):
+            plan.foresight = 4
+
+        self.assertIs(plan.target_indexes(10), plan.target_indexes(10))
+
+        # Only the most recently used plans are kept
+        for foresight in range(PLAN_CACHE_SIZE + 5):
+            compile_transform("window", foresight=foresight, sampling=1)
+        self.assertEqual(PLAN_CACHE_SIZE, _compile_plan.cache_info().currsize)
+
+        # Changing the transform's params compiles a new plan
+        transform = Transform(method="window", foresight=3, sampling=1)
+        transform.sampling = 2
+        self.assertEqual(2, transform.get_transform().sampling)
+        self.assertEqual(1, plan.sampling)
+
+    def test_plan_parameters(self):
+        """Test plans only take and are keyed by the parameters their method
+        declares"""
+        plan = compile_transform("window", foresight=3, sampling=1)
+        self.assertIs(plan, compile_transform("window", foresight=3, sampling=1, dilation_rate=None))
+        self.assertFalse(hasattr(plan, "dilation_rate"))
+        self.assertRaises(ValueError, lambda: compile_transform("window", foresight=3, sampling=1, dilation_rate=3))
+
+        dilated = Transform(method="dilated-window", foresight=30, sampling=1, dense_foresight=3).get_transform()
+        self.assertEqual(3, dilated.dense_foresight)
+        self.assertEqual(2, dilated.dilation_rate)
+        self.assertFalse(dilated.dilation_pooling)
+
+        self.assertRaises(ValueError, lambda: compile_transform("dilated-window", foresight=30, dilation_rate=1))
+        self.assertRaises(ValueError, lambda: compile_transform("dilated-window", foresight=30, dense_foresight=-1))
+
+    def test_concurrent_transforms(self):
+        """Test transforms with different configurations don't race on each
+        other's settings"""
+        partition = Partition.load(self.get_lapsim_data_path() / 'encoded' / 'partition-1.json')
+        normalisers = [
+            TransformNormalisation(transform=Transform(method="flat-window", foresight=foresight, sampling=1))
+            .extend(partition)
+            for foresight in [2, 7]
+        ]
+        expected = [normaliser.normalise_and_transform(partition)[0] for normaliser in normalisers]
+
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(lambda i: normalisers[i % 2].normalise_and_transform(partition)[0], range(8)))
+
+        for i, x in enumerate(results):
+            self.assertTrue(np.array_equal(expected[i % 2], x))
+
+    def test_estimate_output_bytes(self):
+        """Test the estimated bytes match the bytes output by each transform"""
+        partition = Partition.load(self.get_lapsim_data_path() / 'encoded' / 'partition-1.json')
+
+        for transform in [
+            Transform(method="window", foresight=5, sampling=2),
+            Transform(method="flat-window", foresight=5, sampling=2),
+            Transform(method="dilated-window", foresight=30, sampling=1, dense_foresight=3),
+            Transform(method="lag", lag=5, sampling=2, patch_size=3, time_to_vec=True),
+            Transform(method="bidirectional", sampling=1, patch_size=4),
+            Transform(method="stateful-lag", lag=5, sampling=2, patch_size=3, time_to_vec=True),
+        ]:
+            normaliser = TransformNormalisation(transform=transform).extend(partition)
+            x, outputs, vehicles = normaliser.normalise_and_transform(partition)
+
+            arrays = [x, outputs, vehicles]
+            while any(isinstance(array, list) for array in arrays):
+                arrays = [a for array in arrays for a in (array if isinstance(array, list) else [array])]
+
+            self.assertEqual(sum(array.nbytes for array in arrays), transform.estimate_output_bytes(partition))
+            self.assertEqual(
+                transform.estimate_output_bytes(partition), transform.estimate_output_bytes([743, 463, 1013]))
+
+    def test_transform_chunks(self):
+        """Test the chunks are within the byte limit and match the transform of
+        the whole partition"""
+        partition = Partition.load(self.get_lapsim_data_path() / 'encoded' / 'partition-1.json')
+        transform = Transform(method="lag", lag=5, sampling=1)
+        normaliser = TransformNormalisation(transform=transform).extend(partition)
+
+        max_bytes = transform.estimate_output_bytes([743, 463])
+        self.assertListEqual(transform.chunk_track_indexes([743, 463, 1013], max_bytes), [[0, 1], [2]])
+        self.assertListEqual(transform.chunk_track_indexes([743, 463, 1013], 1), [[0], [1], [2]])
+
+        x, (y_pos, _), _ = normaliser.normalise_and_transform(partition)
+
+        row = 0
+        for track_indexes, (chunk_x, (chunk_pos, _), _) in normaliser.normalise_and_transform_chunks(partition, max_bytes):
+            # The longest track doesn't fit in the limit on its own
+            if len(track_indexes) > 1:
+                self.assertLessEqual(chunk_x.nbytes, max_bytes)
+
+            rows = slice(row, row + len(chunk_x))
+            self.assertTrue(np.array_equal(x[rows, -chunk_x.shape[1]:], chunk_x))
+            self.assertTrue(np.array_equal(y_pos[rows], chunk_pos))
+            row += len(chunk_x)
+
+        self.assertEqual(len(x), row)
+
+    def test_chunk_estimates(self):
+        """Test the chunks match re-estimating each whole chunk as it grows"""
+        track_lengths = np.random.default_rng(0).integers(50, 1500, 200).tolist()
+
+        for transform in [
+            Transform(method="flat-window", foresight=5, sampling=2),
+            Transform(method="dilated-window", foresight=30, sampling=1, dense_foresight=3),
+            Transform(method="lag", lag=5, sampling=2, patch_size=3),
+            Transform(method="bidirectional", sampling=1, patch_size=4),
+            Transform(method="stateful-lag", lag=5, sampling=2, patch_size=3),
+        ]:
+            max_bytes = transform.estimate_output_bytes(track_lengths) // 15
+
+            expected, chunk = [], []
+            for t_idx in range(len(track_lengths)):
+                if chunk and transform.estimate_output_bytes([track_lengths[i] for i in chunk + [t_idx]]) > max_bytes:
+                    expected.append(chunk)
+                    chunk = []
+                chunk.append(t_idx)
+            expected.append(chunk)
+
+            self.assertListEqual(expected, transform.chunk_track_indexes(track_lengths, max_bytes))